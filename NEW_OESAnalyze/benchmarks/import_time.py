@@ -0,0 +1,104 @@
+"""
+Import-time benchmark for the OES Analyzer entry modules.
+
+Runs ``python -X importtime`` in a fresh interpreter for each entry module
+and reports the cumulative cost of the heaviest imports, so regressions in
+startup time are visible. Exits with status 1 when an entry module exceeds
+the startup budget.
+
+Usage (from the NEW_OESAnalyze directory):
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --budget-ms 800 --top 15 --json
+"""
+import os
+import re
+import sys
+import json
+import argparse
+import subprocess
+from typing import Dict, List, Tuple
+
+ENTRY_MODULES = ['model.analyzer', 'controller.controller', 'view.gui']
+DEFAULT_BUDGET_MS = 500.0
+
+_LINE_PATTERN = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$')
+
+
+def measure_imports(module: str) -> List[Tuple[str, float, float, int]]:
+    """
+    Import a module in a fresh interpreter and collect ``-X importtime`` output.
+
+    Args:
+        module: Dotted module name to import
+
+    Returns:
+        List of (module name, self ms, cumulative ms, nesting depth)
+    """
+    env = dict(os.environ)
+    env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=root, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        match = _LINE_PATTERN.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append((name, int(self_us) / 1000, int(cumulative_us) / 1000, (len(indent) - 1) // 2))
+    return entries
+
+
+def summarize(module: str, top: int) -> Dict:
+    """Summarize the import cost of one entry module."""
+    entries = measure_imports(module)
+    total = next((cumulative for name, _, cumulative, _ in entries if name == module), 0.0)
+
+    # 以頂層套件彙總 (numpy, pandas, matplotlib, PyQt6 ...)
+    packages: Dict[str, float] = {}
+    for name, self_ms, _, _ in entries:
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0.0) + self_ms
+
+    heaviest = sorted(entries, key=lambda e: e[2], reverse=True)[:top]
+    return {
+        'module': module,
+        'total_ms': round(total, 1),
+        'packages_ms': {k: round(v, 1) for k, v in sorted(packages.items(), key=lambda kv: -kv[1])[:top]},
+        'heaviest': [{'module': n, 'self_ms': round(s, 1), 'cumulative_ms': round(c, 1)} for n, s, c, _ in heaviest],
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('modules', nargs='*', default=ENTRY_MODULES, help='Entry modules to measure')
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS, help='Startup budget per module')
+    parser.add_argument('--top', type=int, default=10, help='Number of heaviest imports to report')
+    parser.add_argument('--json', action='store_true', help='Print machine-readable results')
+    args = parser.parse_args(argv)
+
+    reports = [summarize(module, args.top) for module in args.modules]
+    over_budget = [r['module'] for r in reports if r['total_ms'] > args.budget_ms]
+
+    if args.json:
+        print(json.dumps({'budget_ms': args.budget_ms, 'reports': reports, 'over_budget': over_budget},
+                         ensure_ascii=False, indent=2))
+    else:
+        for report in reports:
+            status = 'OVER BUDGET' if report['module'] in over_budget else 'ok'
+            print(f"{report['module']}: {report['total_ms']:.1f} ms ({status}, budget {args.budget_ms:.0f} ms)")
+            for package, ms in report['packages_ms'].items():
+                print(f"    {package:<24}{ms:>10.1f} ms")
+            print("  heaviest imports (cumulative):")
+            for entry in report['heaviest']:
+                print(f"    {entry['module']:<40}{entry['cumulative_ms']:>10.1f} ms")
+
+    return 1 if over_budget else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,216 @@
+"""
+Pipeline benchmark for the OES Analyzer.
+
+Generates synthetic runs (see ``benchmarks.synthetic``) for each requested
+size and times every pipeline stage on them: ingest, dissociation
+reductions per threshold, peak finding, activation detection, section
+statistics, export and plotting. Results are printed as a table or as
+JSON; stages slower than their budget are reported and make the command
+exit with status 1.
+
+Budgets (default: ``benchmarks/budgets.json``) are a JSON file mapping
+stage names to seconds. A size label (``FRAMESxPIXELS``) may hold its own
+stage mapping that overrides the defaults for that size:
+    {"ingest_gather_values": 2.0, "2000x2048": {"ingest_gather_values": 15.0}}
+
+Usage (from the NEW_OESAnalyze directory):
+    python -m benchmarks.pipeline
+    python -m benchmarks.pipeline --sizes 200x2048 2000x2048 --repeat 3 --json
+    python -m benchmarks.pipeline --budgets my_budgets.json --output results.json
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import tempfile
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from benchmarks.synthetic import RunSpec, generate_run
+from model.analyzer import OESAnalyzer
+from model.instrumentation import PipelineProfiler, file_sizes
+
+DEFAULT_SIZES = ['200x2048', '1000x2048']
+DEFAULT_BUDGETS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'budgets.json')
+DEFAULT_THRESHOLDS = [100.0, 500.0, 1000.0]
+SECTION_COUNT = 3
+# 啟動區間前後各略過的幀數, 與 OESController.analyze_data 相同
+SETTLE_FRAMES = 10
+
+
+def parse_size(size: str) -> RunSpec:
+    """Parse ``FRAMESxPIXELS`` into a RunSpec."""
+    frames, pixels = size.lower().split('x')
+    return RunSpec(n_frames=int(frames), n_pixels=int(pixels))
+
+
+def run_pipeline(spec: RunSpec, data_directory: str, output_directory: str,
+                 thresholds: List[float], profiler: PipelineProfiler) -> None:
+    """
+    Run every pipeline stage once on a generated run, recording one span per stage.
+
+    Args:
+        spec: Shape of the generated run
+        data_directory: Directory holding the run files
+        output_directory: Directory for exported workbooks, cubes and figures
+        thresholds: Dissociation thresholds (one reduction stage each)
+        profiler: Profiler collecting the stage spans
+    """
+    analyzer = OESAnalyzer()
+    file_names = analyzer.generate_file_names(spec.base_name, spec.start_index, spec.end_index)
+    file_paths = [os.path.join(data_directory, f) for f in file_names]
+    detect_wave = spec.nearest_wavelength(spec.lines[0][0])
+    wavebands = [spec.nearest_wavelength(center) for center, _, _ in spec.lines]
+    input_bytes = file_sizes(file_paths)
+
+    with profiler.span('ingest_read_file_to_data') as span:
+        analyzer.read_file_to_data(file_names, data_directory)
+        span.add(files=len(file_paths), bytes=input_bytes)
+
+    with profiler.span('ingest_gather_values') as span:
+        analyzer.set_files(file_paths)
+        analyzer.gather_values()
+        span.add(files=len(file_paths), bytes=input_bytes)
+
+    for threshold in thresholds:
+        with profiler.span(f'significant_differences[{threshold:g}]'):
+            analyzer.find_significant_differences(threshold)
+        with profiler.span(f'specific_differences[{threshold:g}]'):
+            analyzer.find_specific_wavebands_differences(wavebands, threshold)
+
+    with profiler.span('find_peak_points'):
+        analyzer.find_peak_points()
+
+    with profiler.span('detect_activate_time'):
+        activate_time, end_time = analyzer.detect_activate_time(detect_wave, spec.lines[0][1] / 3, spec.start_index)
+    if activate_time is None or end_time is None:
+        raise RuntimeError(f'Activation not detected on {detect_wave} nm for {spec.label}')
+
+    with profiler.span('analyze_sections'):
+        start_row = activate_time - spec.start_index + SETTLE_FRAMES
+        end_row = end_time - spec.start_index - SETTLE_FRAMES + 1
+        analyzer.analyze_sections(analyzer._all_data[detect_wave][start_row:end_row], SECTION_COUNT)
+
+    with profiler.span('export_difference_workbooks') as span:
+        paths = analyzer.export_difference_workbooks(wavebands, thresholds, spec.base_name, output_directory)
+        span.add(files=len(paths), bytes=file_sizes(paths))
+
+    with profiler.span('export_cube') as span:
+        path = analyzer.export_cube(output_directory, spec.base_name)
+        span.add(files=1, bytes=file_sizes([path]))
+
+    with profiler.span('plot_all_spectrum') as span:
+        path = analyzer.allSpectrum_plot(analyzer.get_cube(), 5, output_directory, spec.base_name.split('_')[1])
+        analyzer.wait_for_plots()
+        span.add(files=1, bytes=file_sizes([path]))
+
+
+def benchmark_size(spec: RunSpec, thresholds: List[float], repeat: int, work_directory: str) -> Dict:
+    """
+    Generate one run and benchmark it ``repeat`` times.
+
+    Returns:
+        Result record with the best (minimum) wall time of every stage
+    """
+    data_directory = os.path.join(work_directory, spec.label, 'data')
+    output_directory = os.path.join(work_directory, spec.label, 'output')
+    os.makedirs(output_directory, exist_ok=True)
+
+    started = time.perf_counter()
+    generate_run(data_directory, spec)
+    generate_s = time.perf_counter() - started
+
+    stages: Dict[str, Dict] = {}
+    for _ in range(repeat):
+        profiler = PipelineProfiler()
+        run_pipeline(spec, data_directory, output_directory, thresholds, profiler)
+        for span in profiler.spans:
+            best = stages.get(span.name)
+            if best is None or span.wall_s < best['wall_s']:
+                stages[span.name] = {'wall_s': span.wall_s, 'cpu_s': span.cpu_s,
+                                     'files': span.files, 'bytes': span.bytes}
+
+    return {'size': spec.label, 'frames': spec.n_frames, 'pixels': spec.n_pixels,
+            'generate_s': generate_s, 'stages': stages}
+
+
+def load_budgets(path: Optional[str]) -> Dict:
+    if not path:
+        return {}
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def check_budgets(results: List[Dict], budgets: Dict) -> List[Dict]:
+    """
+    Compare stage wall times with their budgets.
+
+    Returns:
+        One record per stage over its budget
+    """
+    violations = []
+    for result in results:
+        size_budgets = {k: v for k, v in budgets.items() if not isinstance(v, dict)}
+        size_budgets.update(budgets.get(result['size'], {}))
+        for stage, budget_s in size_budgets.items():
+            measured = result['stages'].get(stage)
+            if measured is not None and measured['wall_s'] > budget_s:
+                violations.append({'size': result['size'], 'stage': stage,
+                                   'wall_s': measured['wall_s'], 'budget_s': budget_s})
+    return violations
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', default=DEFAULT_SIZES, help='Run sizes as FRAMESxPIXELS')
+    parser.add_argument('--thresholds', nargs='+', type=float, default=DEFAULT_THRESHOLDS)
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per size; the fastest is reported')
+    parser.add_argument('--budgets', default=DEFAULT_BUDGETS,
+                        help='JSON file with per-stage budgets in seconds (default: benchmarks/budgets.json)')
+    parser.add_argument('--work-dir', help='Keep generated data and outputs here (default: temporary)')
+    parser.add_argument('--json', action='store_true', help='Print machine-readable results')
+    parser.add_argument('--output', help='Also write the JSON results to this file')
+    parser.add_argument('--log-level', default='ERROR', help='Logging level while benchmarking')
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(args.log_level.upper())
+    budgets = load_budgets(args.budgets)
+
+    with tempfile.TemporaryDirectory(prefix='oes-bench-') as temp_directory:
+        work_directory = args.work_dir or temp_directory
+        results = [benchmark_size(parse_size(size), args.thresholds, args.repeat, work_directory)
+                   for size in args.sizes]
+
+    violations = check_budgets(results, budgets)
+    report = {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'results': results,
+        'over_budget': violations,
+    }
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        for result in results:
+            print(f"{result['size']} (generated in {result['generate_s']:.2f} s)")
+            for stage, measured in result['stages'].items():
+                print(f"    {stage:<36}{measured['wall_s'] * 1000:>10.1f} ms")
+        for violation in violations:
+            print(f"OVER BUDGET: {violation['size']} {violation['stage']} "
+                  f"{violation['wall_s']:.3f} s > {violation['budget_s']:.3f} s")
+
+    return 1 if violations else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
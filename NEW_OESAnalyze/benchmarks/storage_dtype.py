@@ -0,0 +1,127 @@
+"""
+Storage dtype check for the OES Analyzer.
+
+Gathers the same synthetic run with every storage dtype (float64, float32,
+int32), times the vectorized reductions and verifies that peak points,
+dissociation tables and section statistics match the float64 path within
+the precision of each dtype. Exits with status 1 when a result is out of
+tolerance.
+
+Usage (from the NEW_OESAnalyze directory):
+    python -m benchmarks.storage_dtype
+    python -m benchmarks.storage_dtype --frames 2000 --pixels 2048 --json
+"""
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+from typing import Dict, List
+
+import numpy as np
+
+from benchmarks.synthetic import RunSpec, generate_run
+from model.analyzer import OESAnalyzer
+from model.cube import STORAGE_DTYPES
+
+THRESHOLDS = [100.0, 1000.0]
+SECTION_COUNT = 3
+# 與 float64 結果比較時允許的絕對誤差: float32 為相對精度, int32 為四捨五入到整數計數
+TOLERANCES = {'float64': (0.0, 0.0), 'float32': (1e-6, 1e-3), 'int32': (0.0, 0.5)}
+
+
+def run_with_dtype(dtype: str, paths: List[str], spec: RunSpec) -> Dict:
+    """Gather a run with one storage dtype and collect its results and timings."""
+    analyzer = OESAnalyzer(storage_dtype=dtype)
+    analyzer.set_files(paths)
+
+    timings = {}
+    started = time.perf_counter()
+    cube = analyzer.gather_values()
+    timings['gather_values'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    peaks = analyzer.find_peak_points()
+    differences = {threshold: analyzer.find_significant_differences(threshold) for threshold in THRESHOLDS}
+    timings['reductions'] = time.perf_counter() - started
+
+    activate_frame, end_frame = spec.activation_frames()
+    series = cube.column(spec.nearest_wavelength(spec.lines[0][0]))
+    started = time.perf_counter()
+    sections = analyzer.analyze_sections(series[activate_frame - spec.start_index:end_frame - spec.start_index],
+                                         SECTION_COUNT)
+    timings['analyze_sections'] = time.perf_counter() - started
+
+    return {'dtype': dtype, 'cube_bytes': int(cube.intensities.nbytes), 'timings': timings,
+            'peaks': peaks, 'differences': differences, 'sections': sections}
+
+
+def compare(reference: Dict, result: Dict) -> List[str]:
+    """
+    Compare one dtype's results with the float64 reference.
+
+    Returns:
+        Descriptions of the mismatches (empty when within tolerance)
+    """
+    rtol, atol = TOLERANCES[result['dtype']]
+    close = lambda a, b: bool(np.isclose(a, b, rtol=rtol, atol=atol))
+    problems = []
+
+    expected = {p['波段']: p['最大值'] for p in reference['peaks']}
+    actual = {p['波段']: p['最大值'] for p in result['peaks']}
+    bad = [w for w in expected if not close(actual.get(w, np.nan), expected[w])]
+    if bad:
+        problems.append(f"peak maxima differ at {len(bad)} wavelengths (e.g. {bad[0]})")
+
+    for threshold in THRESHOLDS:
+        expected, actual = reference['differences'][threshold], result['differences'][threshold]
+        for wavelength in set(expected) ^ set(actual):
+            # 只允許差值剛好落在門檻附近 (誤差範圍內) 的波長進出
+            min_value, max_value = (expected.get(wavelength) or actual.get(wavelength))[:2]
+            if not close(max_value - min_value, threshold):
+                problems.append(f"threshold {threshold:g}: {wavelength} nm selected differently")
+        for wavelength in set(expected) & set(actual):
+            if not (close(actual[wavelength][0], expected[wavelength][0])
+                    and close(actual[wavelength][1], expected[wavelength][1])):
+                problems.append(f"threshold {threshold:g}: min/max differ at {wavelength} nm")
+
+    for section, stats in reference['sections'].items():
+        for key in ('mean', 'std'):
+            if not close(result['sections'][section][key], stats[key]):
+                problems.append(f"{section} {key}: {result['sections'][section][key]} != {stats[key]}")
+    return problems
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=500)
+    parser.add_argument('--pixels', type=int, default=2048)
+    parser.add_argument('--json', action='store_true', help='Print machine-readable results')
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.ERROR)
+    spec = RunSpec(n_frames=args.frames, n_pixels=args.pixels, malformed_every=0)
+    with tempfile.TemporaryDirectory(prefix='oes-dtype-') as directory:
+        paths = generate_run(directory, spec)
+        results = [run_with_dtype(dtype, paths, spec) for dtype in STORAGE_DTYPES]
+
+    reference = results[0]
+    report = [{'dtype': r['dtype'], 'cube_bytes': r['cube_bytes'], 'timings': r['timings'],
+               'problems': compare(reference, r)} for r in results]
+
+    if args.json:
+        print(json.dumps({'size': spec.label, 'results': report}, ensure_ascii=False, indent=2))
+    else:
+        for entry in report:
+            timings = ', '.join(f"{k} {v * 1000:.1f} ms" for k, v in entry['timings'].items())
+            status = 'ok' if not entry['problems'] else f"{len(entry['problems'])} MISMATCHES"
+            print(f"{entry['dtype']:<8}{entry['cube_bytes'] / 1e6:>8.1f} MB  {timings}  [{status}]")
+            for problem in entry['problems'][:10]:
+                print(f"    {problem}")
+
+    return 1 if any(entry['problems'] for entry in report) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
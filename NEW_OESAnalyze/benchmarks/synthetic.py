@@ -0,0 +1,134 @@
+"""
+Synthetic OES run generator for benchmarks.
+
+Writes ``{base_name}_S####.txt`` files named like
+``OESAnalyzer.generate_file_names``, one spectrum per frame in the
+spectrometer's ``wavelength;intensity`` format. Each run has a flat
+baseline with Gaussian noise, configurable emission lines that switch on
+for an activation window (a step at the activation/end frames), a header
+block and a few malformed lines.
+
+Usage (from the NEW_OESAnalyze directory):
+    python -m benchmarks.synthetic OUTPUT_DIR --frames 500 --pixels 2048
+"""
+import os
+import sys
+import argparse
+from dataclasses import dataclass
+from typing import List, Tuple
+import numpy as np
+
+from model.analyzer import OESAnalyzer
+
+HEADER_LINES = ['Spectrometer;SYNTHETIC', 'Integration time (ms);100', 'Wavelength (nm);Intensity (Cts)']
+
+
+@dataclass
+class RunSpec:
+    """Shape and content of a synthetic run."""
+    base_name: str = 'Spectrum_T2024-09-26'
+    n_frames: int = 200
+    n_pixels: int = 2048
+    wl_start: float = 190.0
+    wl_stop: float = 800.0
+    # (中心波長 nm, 啟動後強度, 寬度 nm)
+    lines: Tuple[Tuple[float, float, float], ...] = (
+        (656.28, 3000.0, 0.8),
+        (486.13, 2000.0, 1.0),
+        (777.19, 1500.0, 0.7),
+    )
+    baseline: float = 100.0
+    noise: float = 5.0
+    # 啟動區間 (以總幀數的比例表示)
+    activation: Tuple[float, float] = (0.25, 0.75)
+    malformed_every: int = 500
+    start_index: int = 1
+    seed: int = 0
+
+    @property
+    def end_index(self) -> int:
+        return self.start_index + self.n_frames - 1
+
+    @property
+    def label(self) -> str:
+        return f'{self.n_frames}x{self.n_pixels}'
+
+    def wavelengths(self) -> np.ndarray:
+        """Pixel wavelengths, rounded like the spectrometer output."""
+        return np.round(np.linspace(self.wl_start, self.wl_stop, self.n_pixels), 2)
+
+    def nearest_wavelength(self, wavelength: float) -> float:
+        """Grid wavelength closest to ``wavelength`` (use it as detect wave)."""
+        wavelengths = self.wavelengths()
+        return float(wavelengths[np.argmin(np.abs(wavelengths - wavelength))])
+
+    def activation_frames(self) -> Tuple[int, int]:
+        """First active frame and first frame after the activation window."""
+        on, off = self.activation
+        return (self.start_index + int(self.n_frames * on),
+                self.start_index + int(self.n_frames * off))
+
+
+def _format_spectrum(wavelengths: np.ndarray, intensities: np.ndarray, malformed_every: int) -> str:
+    lines = [f'{w:.2f};{v:.2f}' for w, v in zip(wavelengths, intensities)]
+    if malformed_every:
+        # 插入無法解析的行 (模擬儀器輸出的雜訊行)
+        for position in range(malformed_every, len(lines), malformed_every + 1):
+            lines.insert(position, 'n/a;saturated')
+    return '\n'.join(HEADER_LINES + lines) + '\n'
+
+
+def generate_run(directory: str, spec: RunSpec = RunSpec()) -> List[str]:
+    """
+    Write a synthetic run.
+
+    Args:
+        directory: Output directory (created if missing)
+        spec: Shape and content of the run
+
+    Returns:
+        Paths of the written files, in frame order
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(spec.seed)
+    wavelengths = spec.wavelengths()
+
+    emission = np.zeros(spec.n_pixels)
+    for center, amplitude, width in spec.lines:
+        emission += amplitude * np.exp(-((wavelengths - center) / width) ** 2)
+
+    activate_frame, end_frame = spec.activation_frames()
+    file_names = OESAnalyzer.generate_file_names(spec.base_name, spec.start_index, spec.end_index)
+    paths = []
+    for frame, file_name in zip(range(spec.start_index, spec.end_index + 1), file_names):
+        intensities = spec.baseline + rng.normal(0.0, spec.noise, spec.n_pixels)
+        if activate_frame <= frame < end_frame:
+            intensities += emission
+        path = os.path.join(directory, file_name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(_format_spectrum(wavelengths, intensities, spec.malformed_every))
+        paths.append(path)
+    return paths
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('output', help='Output directory')
+    parser.add_argument('--frames', type=int, default=RunSpec.n_frames)
+    parser.add_argument('--pixels', type=int, default=RunSpec.n_pixels)
+    parser.add_argument('--noise', type=float, default=RunSpec.noise)
+    parser.add_argument('--malformed-every', type=int, default=RunSpec.malformed_every,
+                        help='Insert a malformed line every N lines (0 disables)')
+    parser.add_argument('--base-name', default=RunSpec.base_name)
+    parser.add_argument('--seed', type=int, default=RunSpec.seed)
+    args = parser.parse_args(argv)
+
+    spec = RunSpec(base_name=args.base_name, n_frames=args.frames, n_pixels=args.pixels, noise=args.noise,
+                   malformed_every=args.malformed_every, seed=args.seed)
+    paths = generate_run(args.output, spec)
+    print(f'Wrote {len(paths)} files ({spec.label}) to {args.output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,24 @@
 import logging
 from model.analyzer import OESAnalyzer
-import pandas as pd
+from model.chunked import ChunkedCubeAnalyzer, write_cube_file, DEFAULT_MEMORY_BUDGET_MB
+from model.manifest import RunManifest
+from model.preprocess import PreprocessConfig
+from model.decomposition import SpectralComponents, Screening
+from model.catalog import RunCatalog, RunSummary, DEFAULT_CATALOG_PATH
+from model.resample import regular_grid
+from model.binning import FrameBinning
+from model.async_ingest import AsyncIngest, LocalFiles
+from model.shared import Stage, run_stages, dissociation_stage
+from model.linefit import fit_lines
+from model.bands import integrate_bands
+from model.fingerprint import FingerprintIndex, run_fingerprint, DEFAULT_INDEX_DIRECTORY
+from model.instrumentation import PipelineProfiler, instrumented_stage, file_sizes
 import os
-from typing import Tuple, Optional, List
+import numpy as np
+from typing import Any, Dict, Tuple, Optional, List, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -16,11 +32,213 @@ class OESController:
     and the View (GUI or other output mechanisms).
     """
 
-    def __init__(self):
-        """Initialize the OES Controller with the OESAnalyzer instance."""
-        self.analyzer = OESAnalyzer()
+    def __init__(self, memory_budget_mb: float = DEFAULT_MEMORY_BUDGET_MB, trace_memory: bool = False,
+                 storage_dtype: Optional[str] = None, catalog_path: Optional[str] = DEFAULT_CATALOG_PATH,
+                 fingerprint_directory: Optional[str] = DEFAULT_INDEX_DIRECTORY):
+        """
+        Initialize the OES Controller with the OESAnalyzer instance.
+
+        Args:
+            memory_budget_mb: Working-memory budget of the chunked (out-of-core) mode.
+            trace_memory: Record peak Python/NumPy allocations of every stage (tracemalloc, slower).
+            storage_dtype: Storage dtype of the loaded/streamed cube ('float64', 'float32' or
+                'int32'); default float64 in memory and float32 for cube files.
+            catalog_path: SQLite run catalog receiving a summary of every analysis
+                (None disables it).
+            fingerprint_directory: Fingerprint index of analyzed runs, used to find
+                similar historical runs (None disables it).
+        """
+        self.storage_dtype = storage_dtype
+        self.analyzer = OESAnalyzer(storage_dtype or 'float64')
         self.analysis_results = None  # To store analysis results
+        self.memory_budget_mb = memory_budget_mb
+        self.chunked_analyzer: Optional[ChunkedCubeAnalyzer] = None
+        self.activation_frames: Tuple[Optional[int], Optional[int]] = (None, None)
+        self.profiler = PipelineProfiler(trace_memory=trace_memory)
+        self.catalog: Optional[RunCatalog] = None
+        if catalog_path:
+            try:
+                self.catalog = RunCatalog(catalog_path)
+            except Exception as e:
+                logger.warning(f"Run catalog unavailable ({catalog_path}): {e}")
+        # 指紋索引在第一次新增或查詢時才開啟, 不拖慢啟動
+        self.fingerprint_directory = fingerprint_directory
+        self._fingerprints: Optional[FingerprintIndex] = None
+        self.last_fingerprint: Optional[np.ndarray] = None
+        self._fingerprint_position: Optional[int] = None
+
+    def _record_run(self, summary: RunSummary) -> Optional[int]:
+        """Add a run summary to the catalog; a catalog failure never fails the analysis."""
+        if self.catalog is None:
+            return None
+        try:
+            return self.catalog.add_run(summary)
+        except Exception as e:
+            logger.warning(f"Could not record run {summary.base_name} in the catalog: {e}")
+            return None
+
+    @property
+    def fingerprints(self) -> Optional[FingerprintIndex]:
+        """The fingerprint index, opened on first use (None when disabled or unavailable)."""
+        if self._fingerprints is None and self.fingerprint_directory:
+            try:
+                self._fingerprints = FingerprintIndex(self.fingerprint_directory)
+            except Exception as e:
+                logger.warning(f"Fingerprint index unavailable ({self.fingerprint_directory}): {e}")
+                self.fingerprint_directory = None
+        return self._fingerprints
+
+    def _fingerprint_run(self) -> None:
+        """Fingerprint the loaded run; failures never fail the analysis."""
+        self.last_fingerprint, self._fingerprint_position = None, None
+        if not self.analyzer.has_data():
+            return
+        try:
+            self.last_fingerprint = run_fingerprint(self.analyzer.get_cube())
+        except Exception as e:
+            logger.warning(f"Could not fingerprint the run: {e}")
+
+    def _index_fingerprint(self, run_id: Optional[int], run_path: str, base_name: str) -> None:
+        """Add the last fingerprint to the index."""
+        if self.last_fingerprint is None or self.fingerprints is None:
+            return
+        try:
+            self._fingerprint_position = self.fingerprints.add(
+                self.last_fingerprint, run_id=run_id, run_path=run_path, base_name=base_name)
+        except Exception as e:
+            logger.warning(f"Could not add run {base_name} to the fingerprint index: {e}")
 
+    def find_similar_runs(self, k: int = 5, metric: str = 'cosine') -> List[dict]:
+        """
+        The historical runs most similar to the last analyzed run.
+
+        Args:
+            k: Number of runs to return
+            metric: 'cosine' or 'euclidean' distance between fingerprints
+
+        Returns:
+            Run records (run_id, run_path, base_name) with their distance, nearest first
+        """
+        if self.last_fingerprint is None:
+            raise ValueError("No run has been analyzed yet.")
+        if self.fingerprints is None:
+            raise ValueError("Fingerprint index is disabled.")
+        neighbors = self.fingerprints.search(self.last_fingerprint, k, metric,
+                                             exclude=self._fingerprint_position)[0]
+        return [dict(run, distance=distance) for run, distance in neighbors]
+
+    def _account_files(self, paths: List[str]) -> None:
+        """Add the given input/output files to the running stage's counters."""
+        span = self.profiler.current
+        if span is not None:
+            span.add(files=len(paths), bytes=file_sizes(paths))
+
+    def set_status_callback(self, callback) -> None:
+        """Send aggregated ingest diagnostics (one summary per chunk of files) to ``callback``."""
+        self.analyzer.set_status_callback(callback)
+
+    def begin_run(self, label: str = '') -> None:
+        """Start a new timing report; stage timings of the previous run are discarded."""
+        self.profiler.begin_run(label)
+
+    def set_preprocessing(self, dark_frames: Optional[Tuple[int, int]] = None, dark_before_activation: bool = False,
+                          baseline: Optional[str] = None, spike_rejection: bool = False) -> PreprocessConfig:
+        """
+        Configure the pre-processing applied before the OES analyses.
+
+        Args:
+            dark_frames: Frame range (first, last) averaged as the dark spectrum.
+            dark_before_activation: Use the frames before the detected activation
+                as the dark range (needs a previous ``analyze_data``).
+            baseline: Baseline removal: None, 'polynomial' or 'rolling_min'.
+            spike_rejection: Replace cosmic-ray spikes by the running median along time.
+
+        Returns:
+            The applied configuration.
+        """
+        if dark_frames is None and dark_before_activation:
+            activate_time = self.activation_frames[0]
+            if activate_time is None:
+                logger.info("Activation time unknown, dark subtraction skipped")
+            else:
+                dark_frames = (0, activate_time - 1)
+        config = PreprocessConfig(dark_frames=dark_frames, baseline=baseline, spike_rejection=spike_rejection)
+        self.analyzer.set_preprocessing(config if config.enabled else None)
+        return config
+
+    def set_binning(self, size: int = 1, mode: str = 'mean', by: str = 'count') -> Optional[FrameBinning]:
+        """
+        Co-add consecutive frames at ingest, trading time resolution for speed and SNR.
+
+        Args:
+            size: Frames per bin (1 disables binning).
+            mode: 'mean' or 'sum'.
+            by: 'count' (every ``size`` files read) or 'frames' (every ``size`` frame numbers).
+
+        Returns:
+            The applied binning, or None when disabled.
+        """
+        binning = FrameBinning(size=size, mode=mode, by=by)
+        self.analyzer.set_binning(binning)
+        return self.analyzer.binning
+
+    def set_async_ingest(self, max_in_flight: Optional[int] = None, source=None) -> Optional[AsyncIngest]:
+        """
+        Read run folders with concurrent, order-preserving file reads.
+
+        Meant for network-mounted folders, where per-file latency dominates.
+
+        Args:
+            max_in_flight: Files read at the same time; None or 1 reads sequentially.
+            source: Optional file source (e.g. ``LatencyShim`` to simulate a slow mount).
+
+        Returns:
+            The applied configuration, or None when reading sequentially.
+        """
+        ingest = None
+        if max_in_flight is not None and max_in_flight > 1:
+            ingest = AsyncIngest(max_in_flight=max_in_flight, source=source or LocalFiles())
+        self.analyzer.set_async_ingest(ingest)
+        return ingest
+
+    def set_wavelength_grid(self, start: Optional[float] = None, stop: Optional[float] = None,
+                            step: Optional[float] = None) -> Optional[np.ndarray]:
+        """
+        Resample every loaded or streamed run onto a common wavelength grid.
+
+        Runs from different spectrometers or calibrations then share their
+        wavelength columns and can be compared directly.
+
+        Args:
+            start: First wavelength of the grid (nm); None disables resampling.
+            stop: Last wavelength of the grid (nm).
+            step: Grid spacing (nm).
+
+        Returns:
+            The grid, or None when resampling is disabled.
+        """
+        if start is None or stop is None or step is None:
+            self.analyzer.set_wavelength_grid(None)
+            return None
+        grid = regular_grid(start, stop, step)
+        self.analyzer.set_wavelength_grid(grid)
+        return grid
+
+    def save_timing_report(self, save_folder_path: str, base_name: str) -> str:
+        """
+        Save the stage timings of the current run as JSON.
+
+        Args:
+            save_folder_path: Directory where the report should be saved.
+            base_name: Base name used for the report file.
+
+        Returns:
+            Path of the report.
+        """
+        output_directory = self.prepare_output_directory(save_folder_path)
+        return self.profiler.save_report(os.path.join(output_directory, f"{base_name}_timing.json"))
+
+    @instrumented_stage('load_and_process_data')
     def load_and_process_data(self, base_path: str, base_name: str, start_index: int, end_index: int) -> None:
         """
         Load data from files and process them.
@@ -37,6 +255,7 @@ class OESController:
         try:
             logger.info("Generating file names...")
             file_names = self.analyzer.generate_file_names(base_name, start_index, end_index)
+            self._account_files([os.path.join(base_path, f) for f in file_names])
 
             logger.info("Reading and processing data...")
             self.analyzer.read_file_to_data(file_names, base_path)
@@ -46,8 +265,10 @@ class OESController:
             logger.error(f"Error during data loading and processing: {e}")
             raise
     
+    @instrumented_stage('execute_OES_analysis')
     def execute_OES_analysis(self, folder_path, save_folder_path, base_name, file_paths,initial_start,
-                initial_end, wavebands, thresholds, skip_range_nm, filter_enabled, intensity_threshold):
+                initial_end, wavebands, thresholds, skip_range_nm, filter_enabled, intensity_threshold,
+                band_width: Optional[float] = None, smoothing: Optional[Tuple[int, int]] = None):
             try:
                                 
                 # activate_time, end_time = self.analyzer.detect_activate_time(detect_wave, thresholds, start_index)
@@ -56,6 +277,7 @@ class OESController:
                 #     raise ValueError("Could not detect activation time.")
 
                 self.analyzer.set_files(file_paths)
+                self._account_files(file_paths)
                 # 執行分析
                 logger.info("開始分析...")
                 output_directory = self.prepare_output_directory(save_folder_path)
@@ -65,23 +287,43 @@ class OESController:
                     thresholds=thresholds,
                     base_name=base_name,
                     skip_range_nm=skip_range_nm,
-                    output_directory=output_directory
+                    output_directory=output_directory,
+                    band_width=band_width,
+                    smoothing=smoothing
                 )
+                # 過濾前的解離結果, 與匯出的活頁簿一致
+                dissociation = {}
+                if self.analyzer.has_data():
+                    dissociation = {t: self.analyzer.find_significant_differences(t) for t in thresholds}
+
+                # 指紋取自過濾前的原始資料 (過濾會就地修改立方體), 不同過濾設定的分析也可比較
+                self._fingerprint_run()
 
                 # 檢查是否需要過濾低強度波段
                 if filter_enabled:
                     self.analyzer.filter_low_intensity(intensity_threshold)
 
                 # 找出並顯示峰值點
-                peak_points = self.analyzer.find_peak_points(self.analyzer.all_values)
-
-                # 生成全波段圖
-                output_path = self.analyzer.allSpectrum_plot(
-                    self.analyzer.all_values,
-                    skip_range_nm,
-                    output_directory,
-                    base_name.split('_')[1]  # 取得檔案前段名稱
-                )
+                peak_points = self.analyzer.find_peak_points()
+
+                # 範圍內沒有可讀的檔案時不繪圖, 也不寫入歷史紀錄
+                output_path = None
+                if self.analyzer.has_data():
+                    # 生成全波段圖
+                    output_path = self.analyzer.allSpectrum_plot(
+                        self.analyzer.get_cube(),
+                        skip_range_nm,
+                        output_directory,
+                        base_name.split('_')[1],  # 取得檔案前段名稱
+                        output_suffix="_filtered" if filter_enabled else ""
+                    )
+
+                    frames = self.analyzer.manifest.frames
+                    run_id = self._record_run(RunSummary(
+                        analysis='OES_analyze', run_path=folder_path, base_name=base_name,
+                        first_frame=int(frames[0]), last_frame=int(frames[-1]), output_directory=output_directory,
+                        peaks=peak_points, dissociation=dissociation))
+                    self._index_fingerprint(run_id, folder_path, base_name)
                 
                 return excel_file, specific_excel_file, output_path, peak_points
 
@@ -90,6 +332,130 @@ class OESController:
                 raise RuntimeError(f"分析過程發生錯誤: {str(e)}")
                 
 
+    def get_spectrum_view(self, skip_range_nm: Optional[float] = None, wavebands: Optional[List[float]] = None):
+        """
+        Data for the interactive spectrum canvas.
+
+        Args:
+            skip_range_nm: If given, re-pick the marked peaks for this skip range.
+            wavebands: Wavebands whose time series should be shown.
+
+        Returns:
+            Tuple of (SpectrumEnvelope, frame numbers, {waveband: series}).
+        """
+        envelope = self.analyzer.last_envelope
+        if envelope is None:
+            raise ValueError("No spectrum to show. Please run the analysis first.")
+        if skip_range_nm is not None:
+            envelope = envelope.with_skip_range(skip_range_nm)
+
+        frames, series = None, {}
+        if wavebands and self.analyzer.has_data():
+            frames, series = self.analyzer.waveband_series(wavebands)
+        return envelope, frames, series
+
+    def get_activation_confidence(self) -> Optional[Tuple[float, float]]:
+        """
+        Confidence scores of the last change-point activation detection.
+
+        Returns:
+            (activation score, end score) in noise standard deviations, or None
+            when the last detection used the 'diff' rule.
+        """
+        points = self.analyzer.last_change_points
+        if points is None:
+            return None
+        return float(points.activate_scores[0]), float(points.end_scores[0])
+
+    def get_correlated_lines(self, query_wavelengths: List[float], k: int = 10,
+                             frame_range: Optional[Tuple[int, int]] = None,
+                             min_difference: Optional[float] = None) -> List[dict]:
+        """
+        The lines that move with each query wavelength in the loaded run.
+
+        Args:
+            query_wavelengths: Wavelengths to find partners for.
+            k: Number of partners per query.
+            frame_range: Frame numbers (first, last) to correlate over (default: all,
+                e.g. ``activation_frames`` for the active period).
+            min_difference: Only consider wavelengths whose max-min difference exceeds this.
+
+        Returns:
+            List of records with '波段', '相關波段' and '相關係數', strongest first per query.
+        """
+        if not self.analyzer.has_data():
+            raise ValueError("No data loaded. Please run the analysis first.")
+        partners = self.analyzer.correlated_wavelengths(query_wavelengths, k, frame_range, min_difference)
+        return [
+            {'波段': query, '相關波段': partner, '相關係數': correlation}
+            for query, matches in partners.items() for partner, correlation in matches
+        ]
+
+    def get_peak_table(self) -> List[dict]:
+        """
+        Peak point of every wavelength of the loaded run, highest first.
+
+        Returns:
+            List of records with '波段', '最大值', '檔案名' and '時間點'.
+        """
+        if not self.analyzer.has_data():
+            raise ValueError("No data loaded. Please run the analysis first.")
+        return self.analyzer.find_peak_points()
+
+    def get_dissociation_table(self, threshold: float) -> List[dict]:
+        """
+        All wavelengths whose max-min difference exceeds a threshold.
+
+        Args:
+            threshold: Dissociation threshold.
+
+        Returns:
+            List of records with '波段', '最小值', '最大值' and '差值', by wavelength.
+        """
+        if not self.analyzer.has_data():
+            raise ValueError("No data loaded. Please run the analysis first.")
+        differences = self.analyzer.find_significant_differences(threshold)
+        return [
+            {'波段': value, '最小值': min_value, '最大值': max_value, '差值': max_value - min_value}
+            for value, (min_value, max_value, _) in sorted(differences.items())
+        ]
+
+    def get_plot_preview(self) -> Optional[bytes]:
+        """Return the low-dpi PNG preview of the last all-spectrum figure."""
+        return self.analyzer.last_preview
+
+    def wait_for_plots(self, timeout: Optional[float] = None) -> None:
+        """Wait until the full-resolution figures have been written to disk."""
+        self.analyzer.wait_for_plots(timeout)
+
+    def render_heatmap(self, wavebands: Optional[List[float]] = None,
+                       save_folder_path: Optional[str] = None, base_name: str = '') -> bytes:
+        """
+        Render the loaded run as a time x wavelength heatmap.
+
+        Detected activation/end frames from the last ``analyze_data`` call and
+        the given wavebands are drawn as overlay markers.
+
+        Args:
+            wavebands: Wavebands to mark.
+            save_folder_path: If given, also save a full-resolution PNG there.
+            base_name: Base name used for the saved file.
+
+        Returns:
+            PNG preview of the heatmap.
+        """
+        try:
+            output_directory = self.prepare_output_directory(save_folder_path) if save_folder_path else None
+            return self.analyzer.heatmap_plot(
+                output_directory,
+                base_name,
+                marker_frames=list(self.activation_frames),
+                marker_wavebands=wavebands
+            )
+        except Exception as e:
+            logger.error(f"Error rendering heatmap: {e}")
+            raise
+
     def scan_file_indices(self, folder_path: str) -> Tuple[Optional[str], Optional[int], Optional[int]]:
         """
         Scan the folder to find the range of indices for the given base name.
@@ -101,31 +467,19 @@ class OESController:
             A tuple containing the start and end indices.
         """
         try:
-            files = os.listdir(folder_path)
-            spectrum_files = [f for f in files if f.endswith('.txt') and '_S' in f]
-            
-            if not spectrum_files:
+            manifest = RunManifest.scan(folder_path)
+            if manifest is None:
                 return None, None, None
-            
-            base_name = spectrum_files[0].split('_S')[0]            
-            indices = []
-            for file in spectrum_files:
-                if file.startswith(base_name):
-                    try:
-                        index = int(file.split('_S')[-1].replace('.txt', ''))
-                        indices.append(index)
-                    except ValueError:
-                        continue
-            
-            if not indices:
-                return None, None, None
-                
-            return base_name, min(indices), max(indices)
-        
+
+            return manifest.base_name, int(manifest.frames[0]), int(manifest.frames[-1])
+
         except Exception as e:
             logger.error(f"Error finding spectrum files: {e}")
             return None, None, None
-    def analyze_data(self, detect_wave: float, threshold: float, section_count: int,base_name: str, base_path: str, start_index: int ) -> pd.DataFrame:
+    @instrumented_stage('analyze_data')
+    def analyze_data(self, detect_wave: float, threshold: float, section_count: int,base_name: str, base_path: str, start_index: int,
+                     band_width: Optional[float] = None, smoothing: Optional[Tuple[int, int]] = None,
+                     reference_wave: Optional[float] = None, method: str = 'diff') -> 'pd.DataFrame':
         """
         Analyze the processed data and return a DataFrame of results.
 
@@ -133,38 +487,82 @@ class OESController:
             detect_wave: Wave length to analyze.
             threshold: Threshold for activation detection.
             section_count: Number of sections for analysis.
+            band_width: If given, analyze the band ``detect_wave ± band_width/2``
+                integrated per frame instead of a single pixel (``threshold`` is
+                then in band-area units).
+            smoothing: Optional Savitzky-Golay ``(window, order)`` for the band integration.
+            reference_wave: If given, analyze the line ratio ``detect_wave / reference_wave``
+                (e.g. Hα/Ar; ``threshold`` is then a ratio step).
+            method: Activation detection: 'diff' (first frame-to-frame jump above
+                ``threshold``) or 'changepoint' (two-window mean shift, robust to
+                noise and slow ramps; ``threshold`` is the minimum shift).
 
         Returns:
             DataFrame containing the analysis results.
         """
         try:
             logger.info("Detecting activation and analyzing data...")
+            loaded = self.analyzer.data_manifest
+            if reference_wave is not None:
+                pair = (detect_wave, reference_wave)
+                ratios = self.analyzer.loaded_ratio_traces([pair], band_width, smoothing)
+                activation = self.analyzer.detect_ratio_activate_time(ratios, pair, threshold, method)
+                sectioned_data = self._analyze_trace(ratios.trace(pair), ratios.frames, activation, section_count)
+                return self._finish_analysis(sectioned_data, base_name, base_path, loaded, detect_wave)
+            if band_width is not None:
+                bands = self.analyzer.loaded_band_traces([detect_wave], band_width, smoothing)
+                activation = self.analyzer.detect_band_activate_time(bands, detect_wave, threshold, method)
+                sectioned_data = self._analyze_trace(bands.trace(detect_wave), bands.frames, activation, section_count)
+                return self._finish_analysis(sectioned_data, base_name, base_path, loaded, detect_wave)
 
             # Ensure the data for the specific wave exists
             if detect_wave not in self.analyzer._all_data:
                 raise ValueError(f"Wave length {detect_wave} not found in the data.")
             # 1. find active time point and end time point
-            activate_time, end_time = self.analyzer.detect_activate_time(detect_wave, threshold, start_index)
-            print(activate_time,end_time)
+            activate_time, end_time = self.analyzer.detect_activate_time(detect_wave, threshold, start_index, method)
+            logger.debug(f"Activation frames: {activate_time}, {end_time}")
+            self.activation_frames = (activate_time, end_time)
             if activate_time is None or end_time is None:
                 raise ValueError("Could not detect activation time.")
 
             # 2. read data of active time period 
             activate_time_file = self.analyzer.generate_file_names(base_name, activate_time + 10, end_time - 10)
             activate_time_data = self.analyzer.read_file_to_data(activate_time_file, base_path)
+            self._account_files([os.path.join(base_path, f) for f in activate_time_file])
 
             wave_data = activate_time_data[detect_wave]
             sectioned_data = self.analyzer.analyze_sections(wave_data, section_count)
-
-            # Store and return results
-            self.analysis_results = self.analyzer.prepare_results_dataframe(sectioned_data)
-            logger.info("Data analysis completed successfully.")
-            return self.analysis_results
+            return self._finish_analysis(sectioned_data, base_name, base_path, loaded, detect_wave)
 
         except Exception as e:
             logger.error(f"Error during data analysis: {e}")
             raise
 
+    def _finish_analysis(self, sectioned_data, base_name: str, base_path: str, loaded: Optional[RunManifest],
+                         detect_wave: float) -> 'pd.DataFrame':
+        """Store the section results, record them in the catalog and return them as a DataFrame."""
+        self.analysis_results = self.analyzer.prepare_results_dataframe(sectioned_data)
+        logger.info("Data analysis completed successfully.")
+        self._record_run(RunSummary(
+            analysis='analyze_data', run_path=base_path, base_name=base_name,
+            first_frame=int(loaded.frames[0]) if loaded is not None else None,
+            last_frame=int(loaded.frames[-1]) if loaded is not None else None,
+            detect_wave=detect_wave, activation=self.activation_frames, stability=sectioned_data))
+        return self.analysis_results
+
+    def _analyze_trace(self, trace: np.ndarray, frames: np.ndarray,
+                       activation: Tuple[Optional[int], Optional[int]], section_count: int) -> dict:
+        """Section statistics of the active period of a band or ratio trace of the loaded files."""
+        activate_time, end_time = activation
+        self.activation_frames = (activate_time, end_time)
+        if activate_time is None or end_time is None:
+            raise ValueError("Could not detect activation time.")
+
+        # 已載入的幀即包含啟動區間, 直接取用不需重新讀檔; 未定義的比值不列入統計
+        rows = (frames >= activate_time + 10) & (frames <= end_time - 10) & np.isfinite(trace)
+        return self.analyzer.analyze_sections(trace[rows], section_count)
+
+    @instrumented_stage('save_results_to_excel')
     def save_results_to_excel(self, base_path: str, threshold: float, base_name: str) -> None:
         """
         Save the analysis results to an Excel file.
@@ -180,10 +578,13 @@ class OESController:
             if self.analysis_results is None:
                 raise ValueError("No analysis results to save. Please run the analysis first.")
 
+            import pandas as pd  # Excel 後端只在儲存時載入
+
             excel_path = os.path.join(base_path, f'{base_name}.xlsx')
 
             with pd.ExcelWriter(excel_path) as writer:
                 self.analysis_results.to_excel(writer, sheet_name=f"Threshold_{threshold}", index=False)
+            self._account_files([excel_path])
 
             logger.info(f"Results successfully saved to {excel_path}")
 
@@ -198,6 +599,7 @@ class OESController:
             os.makedirs(output_directory, exist_ok=True)
             return output_directory
         
+    @instrumented_stage('extract_specific_waveband_data')
     def extract_specific_waveband_data(self, folder_path: str, base_name: str, wavebands: List[float], save_folder_path: str) -> None:
         """
         Extract specific waveband data from all files and save to Excel.
@@ -223,6 +625,7 @@ class OESController:
                 return
             
             logger.info(f"Found {len(spectrum_files)} files to process.")
+            self._account_files([os.path.join(folder_path, f) for f in spectrum_files])
 
             for file_name in spectrum_files:
                 file_path = os.path.join(folder_path, file_name)
@@ -236,8 +639,12 @@ class OESController:
                                 all_data[spectral_data.time_point][waveband] = spectral_data.intensity
                 except Exception as e:
                     logger.error(f"Error processing file {file_name}: {e}")
-            
+                self.analyzer.diagnostics.file_done(self.analyzer.status_callback)
+            self.analyzer.diagnostics.flush(self.analyzer.status_callback)
+
             # Save to Excel
+            import pandas as pd
+
             output_file = os.path.join(save_folder_path, f"{base_name}_特定波段數據.xlsx")
             df = pd.DataFrame.from_dict(all_data, orient='index').reset_index()
             df.columns = ['Time Point'] + [f'{wb} nm' for wb in wavebands]
@@ -245,4 +652,274 @@ class OESController:
             logger.info(f"特定波段數據已被存至 {output_file}")
 
         except Exception as e:
-            logger.error(f"Error scanning files in {folder_path}: {e}")
\ No newline at end of file
+            logger.error(f"Error scanning files in {folder_path}: {e}")
+
+    @instrumented_stage('decompose_run')
+    def decompose_run(self, save_folder_path: str, base_name: str, n_components: int = 5,
+                      reference_path: Optional[str] = None) -> Tuple[str, str, Screening]:
+        """
+        Decompose the loaded run and flag abnormal frames.
+
+        Without a reference, the run is screened against its own components;
+        with ``reference_path`` (components saved by an earlier call), it is
+        projected onto the reference run's components in one matrix multiply.
+
+        Args:
+            save_folder_path: Directory where the results should be saved.
+            base_name: Base name used for the output files.
+            n_components: Number of components to fit (without a reference).
+            reference_path: Components ``.npz`` of a reference run.
+
+        Returns:
+            Tuple of (workbook path, components path, Screening).
+        """
+        if not self.analyzer.has_data():
+            raise ValueError("No data loaded. Please run the analysis first.")
+        if reference_path is not None:
+            components = SpectralComponents.load(reference_path)
+        else:
+            components = self.analyzer.decompose(n_components)
+        screening = self.analyzer.screen_run(components)
+        logger.info(f"{int(screening.flagged.sum())} of {len(screening.errors)} frames flagged")
+
+        output_directory = self.prepare_output_directory(save_folder_path)
+        excel_file = self.analyzer.export_decomposition(components, screening, base_name, output_directory)
+        components_file = components.save(os.path.join(output_directory, f"{base_name}_components.npz"))
+        self._account_files([excel_file, components_file])
+        return excel_file, components_file, screening
+
+    @instrumented_stage('export_line_ratios')
+    def export_line_ratios(self, pairs: List[Tuple[float, float]], save_folder_path: str, base_name: str,
+                           band_width: Optional[float] = None) -> str:
+        """
+        Save the line-ratio traces of the loaded run (one column per pair) to Excel.
+
+        Args:
+            pairs: (numerator, denominator) wavelengths, e.g. [(656.28, 750.39)].
+            save_folder_path: Directory where the results should be saved.
+            base_name: Base name used for the output file.
+            band_width: If given, divide integrated bands instead of single pixels.
+
+        Returns:
+            Path of the workbook.
+        """
+        if not self.analyzer.has_data():
+            raise ValueError("No data loaded. Please run the analysis first.")
+        import pandas as pd
+
+        ratios = self.analyzer.ratio_traces(pairs, band_width)
+        output_directory = self.prepare_output_directory(save_folder_path)
+        output_file = os.path.join(output_directory, f"{base_name}_譜線比值.xlsx")
+        df = pd.DataFrame(ratios.ratios, columns=ratios.labels())
+        df.insert(0, 'Time Point', ratios.frames)
+        df.to_excel(output_file, index=False)
+        self._account_files([output_file])
+        logger.info(f"譜線比值已被存至 {output_file}")
+        return output_file
+
+    @instrumented_stage('parallel_stages')
+    def run_parallel_stages(self, thresholds: Optional[List[float]] = None, wavebands: Optional[List[float]] = None,
+                            line_centers: Optional[List[float]] = None, band_centers: Optional[List[float]] = None,
+                            band_width: Optional[float] = None, extra_stages: Optional[Dict[str, Stage]] = None,
+                            max_workers: Optional[int] = None, chunked: bool = False) -> Dict[str, Any]:
+        """
+        Run independent analyses of the current cube concurrently in worker processes.
+
+        The cube is shared, not pickled: a streamed cube file is mapped by
+        every worker, an in-memory cube is copied once into a shared memory
+        segment that is released when all stages are done (or one failed).
+
+        Args:
+            thresholds: Dissociation thresholds, one stage each ('dissociation_<t>').
+            wavebands: Restrict the dissociation records to these wavebands.
+            line_centers: Lines to fit ('line_fits', see ``OESAnalyzer.line_fits``).
+            band_centers: Bands to integrate ('band_traces').
+            band_width: Band width for ``band_centers``.
+            extra_stages: More ``{name: (function, args, kwargs)}`` stages; functions
+                must be module-level and take the cube as first argument.
+            max_workers: Worker processes (default: one per CPU).
+            chunked: Analyze the streamed cube of ``execute_chunked_analysis``
+                instead of the loaded (pre-processed) one.
+
+        Returns:
+            ``{stage name: result}``.
+        """
+        if chunked:
+            if self.chunked_analyzer is None:
+                raise ValueError("No chunked cube. Please run the chunked analysis first.")
+            cube = self.chunked_analyzer.cube
+        else:
+            cube = self.analyzer.get_analysis_cube()
+
+        stages: Dict[str, Stage] = {}
+        for threshold in thresholds or []:
+            stages[f"dissociation_{threshold:g}"] = (
+                dissociation_stage, (threshold, tuple(wavebands) if wavebands else None), {})
+        if line_centers:
+            stages['line_fits'] = (fit_lines, (list(line_centers),), {})
+        if band_centers:
+            if band_width is None:
+                raise ValueError("band_width is required with band_centers")
+            stages['band_traces'] = (integrate_bands, (list(band_centers), band_width), {})
+        stages.update(extra_stages or {})
+
+        results = run_stages(cube, stages, max_workers)
+        logger.info(f"{len(results)} stages finished in parallel")
+        return results
+
+    @instrumented_stage('export_line_fits')
+    def export_line_fits(self, centers: List[float], save_folder_path: str, base_name: str,
+                         search_nm: float = 1.0, profile: str = 'gaussian') -> str:
+        """
+        Save the fitted centroid, FWHM and area of several lines per frame to Excel.
+
+        Args:
+            centers: Nominal line wavelengths, e.g. [656.28, 486.13].
+            save_folder_path: Directory where the results should be saved.
+            base_name: Base name used for the output file.
+            search_nm: Half width of the window searched for each line's peak.
+            profile: 'gaussian' or 'lorentzian'.
+
+        Returns:
+            Path of the workbook (one sheet per fitted quantity).
+        """
+        if not self.analyzer.has_data():
+            raise ValueError("No data loaded. Please run the analysis first.")
+        import pandas as pd
+
+        fits = self.analyzer.line_fits(centers, search_nm, profile=profile)
+        output_directory = self.prepare_output_directory(save_folder_path)
+        output_file = os.path.join(output_directory, f"{base_name}_譜線擬合.xlsx")
+        labels = [f"{center:g}" for center in fits.centers]
+        with pd.ExcelWriter(output_file) as writer:
+            for sheet, values in (('中心波長', fits.centroids), ('半高寬', fits.fwhm), ('面積', fits.areas)):
+                df = pd.DataFrame(values, columns=labels)
+                df.insert(0, 'Time Point', fits.frames)
+                df.to_excel(writer, sheet_name=sheet, index=False)
+        self._account_files([output_file])
+        logger.info(f"譜線擬合結果已被存至 {output_file}")
+        return output_file
+
+    def export_cube(self, folder_path: str, base_name: str, start_index: int, end_index: int,
+                    save_folder_path: str, fmt: str = 'npy') -> str:
+        """
+        Export every frame x every wavelength of a run to a columnar file.
+
+        Args:
+            folder_path: Path to the folder containing the data files.
+            base_name: Base name of the files to process.
+            start_index: Starting index of the files.
+            end_index: Ending index of the files.
+            save_folder_path: Directory where the results should be saved.
+            fmt: 'npy' or 'parquet'.
+
+        Returns:
+            Path of the exported file.
+        """
+        try:
+            file_names = self.analyzer.generate_file_names(base_name, start_index, end_index)
+            self.analyzer.set_files([os.path.join(folder_path, f) for f in file_names])
+            self.analyzer.gather_values()
+
+            output_directory = self.prepare_output_directory(save_folder_path)
+            output_path = self.analyzer.export_cube(output_directory, base_name, fmt=fmt)
+            logger.info(f"光譜立方體已匯出至 {output_path}")
+            return output_path
+
+        except Exception as e:
+            logger.error(f"Error exporting cube: {e}")
+            raise
+
+    def build_cube_file(self, folder_path: str, base_name: str, start_index: int, end_index: int,
+                        save_folder_path: str) -> ChunkedCubeAnalyzer:
+        """
+        Stream a run into a memory-mapped cube file and open it for chunked analysis.
+
+        Args:
+            folder_path: Path to the folder containing the data files.
+            base_name: Base name of the files to process.
+            start_index: Starting index of the files.
+            end_index: Ending index of the files.
+            save_folder_path: Directory where the cube file is written.
+
+        Returns:
+            ChunkedCubeAnalyzer over the written cube.
+        """
+        file_names = self.analyzer.generate_file_names(base_name, start_index, end_index)
+        output_directory = self.prepare_output_directory(save_folder_path)
+        cube_path = write_cube_file(
+            [os.path.join(folder_path, f) for f in file_names],
+            os.path.join(output_directory, f"{base_name}_cube"),
+            dtype=self.storage_dtype or np.float32,
+            diagnostics=self.analyzer.diagnostics,
+            status_callback=self.analyzer.status_callback,
+            wavelength_grid=self.analyzer.resampler.target if self.analyzer.resampler is not None else None,
+            binning=self.analyzer.binning,
+            ingest=self.analyzer.async_ingest
+        )
+        self.chunked_analyzer = ChunkedCubeAnalyzer(cube_path, self.memory_budget_mb)
+        logger.info(f"Chunked mode: {self.chunked_analyzer.block_rows} frames per block "
+                    f"(budget {self.memory_budget_mb} MB)")
+        return self.chunked_analyzer
+
+    def execute_chunked_analysis(self, folder_path, save_folder_path, base_name, start_index, end_index,
+                                 wavebands, thresholds, skip_range_nm):
+        """
+        Out-of-core equivalent of ``execute_OES_analysis`` for runs larger than RAM.
+
+        Returns:
+            Tuple of (excel file, specific excel file, figure path, peak points).
+        """
+        try:
+            logger.info("開始分析 (分塊模式)...")
+            chunked = self.build_cube_file(folder_path, base_name, start_index, end_index, save_folder_path)
+            output_directory = self.prepare_output_directory(save_folder_path)
+
+            excel_file, specific_excel_file = self.analyzer.export_difference_workbooks(
+                wavebands, thresholds, base_name, output_directory, source=chunked
+            )
+
+            peak_points = chunked.find_peak_points()
+            wavelengths, envelope, _ = chunked.envelope()
+            output_path = self.analyzer.plot_envelope(
+                wavelengths, envelope, peak_points, skip_range_nm, output_directory,
+                base_name.split('_')[1]  # 取得檔案前段名稱
+            )
+            frames = chunked.manifest.frames
+            self._record_run(RunSummary(
+                analysis='OES_analyze_chunked', run_path=folder_path, base_name=base_name,
+                first_frame=int(frames[0]), last_frame=int(frames[-1]), output_directory=output_directory,
+                peaks=peak_points, dissociation={t: chunked.find_significant_differences(t) for t in thresholds}))
+            return excel_file, specific_excel_file, output_path, peak_points
+
+        except Exception as e:
+            logger.error(e)
+            raise RuntimeError(f"分析過程發生錯誤: {str(e)}")
+
+    def analyze_data_chunked(self, detect_wave: float, threshold: float, section_count: int,
+                             start_index: int) -> 'pd.DataFrame':
+        """
+        Out-of-core equivalent of ``analyze_data`` on the cube opened by ``build_cube_file``.
+
+        Returns:
+            DataFrame containing the analysis results.
+        """
+        try:
+            if self.chunked_analyzer is None:
+                raise ValueError("No cube file loaded. Please build the cube first.")
+            chunked = self.chunked_analyzer
+
+            activate_time, end_time = chunked.detect_activate_time(detect_wave, threshold, start_index)
+            if activate_time is None or end_time is None:
+                raise ValueError("Could not detect activation time.")
+
+            start_row, end_row = chunked.frame_rows(activate_time + 10, end_time - 10)
+            sectioned_data = chunked.analyze_sections(detect_wave, section_count, start_row, end_row)
+
+            self.analysis_results = self.analyzer.prepare_results_dataframe(sectioned_data)
+            logger.info("Data analysis completed successfully.")
+            return self.analysis_results
+
+        except Exception as e:
+            logger.error(f"Error during data analysis: {e}")
+            raise
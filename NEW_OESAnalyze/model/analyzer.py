@@ -1,10 +1,27 @@
 import os
-from typing import List, Dict, Tuple, Optional, Callable
+from typing import List, Dict, Tuple, Optional, Callable, TYPE_CHECKING
 import logging
 from dataclasses import dataclass
-import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
+from model.cube import (SpectralCube, save_cube, storage_dtype, missing_value, missing_mask,
+                        to_float, to_storage, parse_frame_number)
+from model.renderer import PlotService, SpectrumEnvelope, HeatmapRenderer
+from model.manifest import (RunManifest, column_extrema, peak_point_records,
+                            significant_difference_records)
+from model.diagnostics import IngestDiagnostics, SKIPPED_LINE, MISSING_FILE, EMPTY_FILE, READ_ERROR
+from model.preprocess import PreprocessConfig
+from model.bands import BandTraces, integrate_bands
+from model.ratios import RatioTraces, line_ratios
+from model.linefit import LineFits, fit_lines, DEFAULT_SEARCH_NM, DEFAULT_FIT_POINTS
+from model.correlation import correlation_matrix, top_partners
+from model.decomposition import SpectralComponents, Screening, DEFAULT_COMPONENTS, DEFAULT_FLAG_SIGMA
+from model.resample import GridResampler
+from model.binning import FrameBinning, BinnedFrame
+from model.async_ingest import AsyncIngest, IngestedSpectrum
+from model.changepoint import ChangePoints, detect_change_points, DEFAULT_WINDOW, DEFAULT_MIN_SCORE
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 # Configure logging
 logging.basicConfig(
@@ -27,11 +44,102 @@ class OESAnalyzer:
     spectral data from OES measurements.
     """
 
-    def __init__(self):
-        """Initialize the OES Analyzer."""
+    def __init__(self, storage_dtype: str = 'float64'):
+        """
+        Initialize the OES Analyzer.
+
+        Args:
+            storage_dtype: dtype of the gathered cube: 'float64', 'float32' (half
+                the memory) or 'int32' (raw counts, rounded). Statistics are
+                accumulated in float64 regardless.
+        """
+        self.storage_dtype = storage_dtype
         self._all_data: Dict[float, List[float]] = {}
+        self.data_manifest: Optional[RunManifest] = None
+        self.selected_files: List[str] = []
+        self.manifest: Optional[RunManifest] = None
+        self._cube: Optional[SpectralCube] = None
+        self._extrema: Optional[Dict[str, np.ndarray]] = None
+        self.preprocessing: Optional[PreprocessConfig] = None
+        self._processed: Optional[SpectralCube] = None
+        self.last_change_points: Optional[ChangePoints] = None
+        self.resampler: Optional[GridResampler] = None
+        self.binning: Optional[FrameBinning] = None
+        self.async_ingest: Optional[AsyncIngest] = None
+        self.plot_service = PlotService()
+        self.last_preview: Optional[bytes] = None
+        self.last_envelope: Optional[SpectrumEnvelope] = None
+        self._heatmap_renderer: Optional[HeatmapRenderer] = None
+        self.diagnostics = IngestDiagnostics()
+        self.status_callback: Optional[Callable[[str], None]] = None
         logger.info("OES Analyzer initialized")
 
+    def set_status_callback(self, callback: Optional[Callable[[str], None]]):
+        """Set where aggregated ingest summaries are sent (default: the log)."""
+        self.status_callback = callback
+
+    def set_preprocessing(self, config: Optional[PreprocessConfig]):
+        """
+        Set the pre-processing applied before the analyses (None disables it).
+
+        The processed cube is computed lazily, the first time an analysis
+        needs it, and cached until the data or the configuration changes.
+        The raw cube (``get_cube``, exports, heatmap) is never modified.
+        """
+        self.preprocessing = config
+        self._processed = None
+        self._extrema = None
+
+    def set_wavelength_grid(self, grid: Optional[np.ndarray]):
+        """
+        Resample gathered spectra onto a fixed wavelength grid (None keeps the native grid).
+
+        With a grid set, files from another spectrometer or calibration are
+        interpolated instead of leaving their wavelengths unmatched, so runs
+        gathered with the same grid line up column by column. The resampler
+        (and its per-calibration weights cache) is kept while the grid is unchanged.
+        """
+        if grid is None:
+            self.resampler = None
+        elif self.resampler is None or not self.resampler.matches(np.asarray(grid, dtype=np.float64)):
+            self.resampler = GridResampler(grid)
+
+    def set_binning(self, binning: Optional[FrameBinning]):
+        """
+        Co-add consecutive frames while reading (None or a size of 1 disables it).
+
+        Frames are combined as they are read, so the full-resolution run is
+        never held in memory; ``manifest.frame_range`` maps every row back
+        to its original frames.
+        """
+        self.binning = binning if binning is not None and binning.enabled else None
+
+    def set_async_ingest(self, ingest: Optional[AsyncIngest]):
+        """
+        Read files concurrently (None reads them one after the other).
+
+        For high-latency (network) folders: up to ``ingest.max_in_flight``
+        files are fetched at once and parsed on a process pool, while frames
+        are still consumed in order.
+        """
+        self.async_ingest = ingest
+
+    def _read_async(self, paths: List[str], add_file: Callable[[str, Tuple[np.ndarray, np.ndarray]], None],
+                    min_wavelength: float) -> None:
+        """Ingest ``paths`` with ``async_ingest``, recording problems like the sequential readers."""
+        def on_spectrum(spectrum: IngestedSpectrum):
+            for line in spectrum.skipped:
+                self.diagnostics.record(SKIPPED_LINE, spectrum.path, line)
+            if spectrum.error is not None:
+                self.diagnostics.record(spectrum.error, spectrum.path, spectrum.detail)
+            elif len(spectrum.wavelengths) == 0:
+                self.diagnostics.record(EMPTY_FILE, spectrum.path)
+            else:
+                add_file(spectrum.path, (spectrum.wavelengths, spectrum.intensities))
+            self.diagnostics.file_done(self.status_callback)
+
+        self.async_ingest.read(paths, on_spectrum, min_wavelength)
+
     @staticmethod
     def generate_file_names(base_name: str, start: int, end: int, extension: str = '.txt') -> List[str]:
         """
@@ -68,13 +176,17 @@ class OESAnalyzer:
                     try:
                         time_point, intensity = map(float, line.strip().split(';'))
                         data.append(SpectralData(time_point, intensity))
-                    except ValueError as e:
-                        logger.warning(f"Skipping invalid line in {file_path}: {e}")
+                    except ValueError:
+                        # 逐行記錄會拖慢讀取, 改為計數並於每批檔案後彙總
+                        self.diagnostics.record(SKIPPED_LINE, file_path, line.strip())
                         continue
 
             logger.debug(f"Successfully read {len(data)} data points from {file_path}")
             return data
 
+        except FileNotFoundError:
+            self.diagnostics.record(MISSING_FILE, file_path)
+            raise
         except Exception as e:
             logger.error(f"Error reading file {file_path}: {e}")
             raise
@@ -91,21 +203,62 @@ class OESAnalyzer:
             Dictionary mapping time points to lists of intensity values
         """
         self._all_data.clear()
+        read_files, last_frames = [], []
+        binner = self.binning.binner() if self.binning is not None else None
+
+        def add_bin(binned: Optional[BinnedFrame]):
+            if binned is not None:
+                for wavelength, intensity in zip(binned.wavelengths.tolist(), binned.values.tolist()):
+                    if not np.isnan(intensity):
+                        self._all_data.setdefault(wavelength, []).append(intensity)
+                read_files.append(os.path.basename(binned.path))
+                last_frames.append(binned.last_frame)
+
+        def add_file(file_path: str, row: Tuple[np.ndarray, np.ndarray]):
+            if binner is not None:
+                add_bin(binner.add(parse_frame_number(file_path), file_path, *row))
+                return
+            for wavelength, intensity in zip(row[0].tolist(), row[1].tolist()):
+                self._all_data.setdefault(wavelength, []).append(intensity)
+            read_files.append(os.path.basename(file_path))
 
-        for file_name in file_names:
+        sequential = file_names
+        if self.async_ingest is not None:
+            # read_data 不限制波長下限
+            self._read_async([os.path.join(base_path, f) for f in file_names], add_file, -np.inf)
+            sequential = []
+
+        for file_name in sequential:
             try:
                 file_path = os.path.join(base_path, file_name)
                 data = self.read_data(file_path)
+                if not data:
+                    self.diagnostics.record(EMPTY_FILE, file_path)
+                elif binner is not None:
+                    add_bin(binner.add(parse_frame_number(file_name), file_path,
+                                       np.array([d.time_point for d in data]),
+                                       np.array([d.intensity for d in data])))
+                    data = []
 
                 for spectral_data in data:
                     if spectral_data.time_point not in self._all_data:
                         self._all_data[spectral_data.time_point] = []
                     self._all_data[spectral_data.time_point].append(spectral_data.intensity)
-            
+                if data:
+                    read_files.append(file_name)
+
+            except FileNotFoundError:
+                pass  # 已計入 diagnostics
             except Exception as e:
                 logger.error(f"Error processing file {file_name}: {e}")
-                continue
+            self.diagnostics.file_done(self.status_callback)
 
+        if binner is not None:
+            add_bin(binner.flush())
+        self.diagnostics.flush(self.status_callback)
+        self.data_manifest = RunManifest.from_paths(read_files) if read_files else None
+        if binner is not None and self.data_manifest is not None:
+            self.data_manifest.last_frames = np.array(last_frames, dtype=np.int64)
         logger.info(f"Processed {len(file_names)} files with {len(self._all_data)} time points")
         return self._all_data
     
@@ -126,156 +279,462 @@ class OESAnalyzer:
                             if value >= 195.0:
                                 values[value] = float(parts[1])
                         except ValueError:
-                            logger.info(f"Skipping line due to ValueError: {line.strip()}")
+                            self.diagnostics.record(SKIPPED_LINE, file_path, line.strip())
         except FileNotFoundError:
-            logger.info(f"The file at {file_path} was not found.")
+            self.diagnostics.record(MISSING_FILE, file_path)
         except Exception as e:
-            logger.info(f"An error occurred: {e}")
+            self.diagnostics.record(READ_ERROR, file_path, str(e))
         return values
     
-    def gather_values(self) -> Dict:
-        """收集所有文件的數據"""
-        self.all_values = {}
-        for file_path in self.selected_files:
-            file_values = self.read_values_by_line(file_path)
-            if not file_values:
-                logger.info(f"No valid data found in {file_path}")
-                continue
-            for value, measurement in file_values.items():
-                if value not in self.all_values:
-                    self.all_values[value] = []
-                self.all_values[value].append((os.path.basename(file_path), measurement))
-        # logger.info(self.all_values)
-        return self.all_values
-
-    def find_peak_points(self, data: Dict[float, List[Tuple[str, float]]]) -> List[dict]:
-        """找出每個波段的最高點"""
-        peak_points = []
-        for value, measurements in data.items():
-            measurements_only = [m[1] for m in measurements]
-            max_value = max(measurements_only)
-            max_index = measurements_only.index(max_value)
-            file_name = measurements[max_index][0]
-            
-            peak_points.append({
-                '波段': value,
-                '最大值': max_value,
-                '檔案名': file_name,
-                '時間點': file_name.split('S')[-1].split('.')[0]
-            })
-        # logger.info(peak_points)
-        # 按最大值排序
-        return sorted(peak_points, key=lambda x: x['最大值'], reverse=True)
-    
+    def gather_values(self) -> Optional[SpectralCube]:
+        """
+        收集所有文件的數據
+
+        Frame numbers are parsed once into ``manifest`` and the values are
+        stored as a cube whose rows are aligned with it (files without data
+        get no row).
+
+        Returns:
+            SpectralCube of the selected files, or None when no file holds data
+        """
+        self._cube = None
+        self._processed = None
+        self._extrema = None
+        self.manifest = None
+        paths, rows, last_frames = [], [], []
+        binner = self.binning.binner() if self.binning is not None else None
+
+        def add_bin(binned: Optional[BinnedFrame]):
+            if binned is not None:
+                paths.append(binned.path)
+                rows.append((binned.wavelengths, binned.values))
+                last_frames.append(binned.last_frame)
+
+        def add_file(file_path: str, row: Tuple[np.ndarray, np.ndarray]):
+            if binner is None:
+                paths.append(file_path)
+                rows.append(row)
+            else:
+                # 邊讀邊合併, 只保留合併後的幀
+                add_bin(binner.add(parse_frame_number(file_path), file_path, *row))
+
+        if self.async_ingest is not None:
+            self._read_async(self.selected_files, add_file, 195.0)
+        else:
+            for file_path in self.selected_files:
+                file_values = self.read_values_by_line(file_path)
+                if not file_values:
+                    if os.path.exists(file_path):
+                        self.diagnostics.record(EMPTY_FILE, file_path)
+                else:
+                    add_file(file_path, (np.fromiter(file_values.keys(), dtype=np.float64, count=len(file_values)),
+                                         np.fromiter(file_values.values(), dtype=np.float64,
+                                                     count=len(file_values))))
+                self.diagnostics.file_done(self.status_callback)
+        if binner is not None:
+            add_bin(binner.flush())
+        self.diagnostics.flush(self.status_callback)
+
+        if not rows:
+            logger.info("No valid data found in the selected files")
+            return None
+
+        self.manifest = RunManifest.from_paths(paths)
+        if binner is not None:
+            self.manifest.last_frames = np.array(last_frames, dtype=np.int64)
+        if self.resampler is not None:
+            wavelengths = self.resampler.target
+        else:
+            wavelengths = np.unique(np.concatenate([row_wavelengths for row_wavelengths, _ in rows]))
+        dtype = storage_dtype(self.storage_dtype)
+        intensities = np.full((len(rows), len(wavelengths)), missing_value(dtype), dtype=dtype)
+        calibrations: Dict[bytes, List[int]] = {}
+        for i, (row_wavelengths, row_values) in enumerate(rows):
+            columns = np.minimum(np.searchsorted(wavelengths, row_wavelengths), len(wavelengths) - 1)
+            matched = wavelengths[columns] == row_wavelengths
+            if matched.all() or len(row_wavelengths) < 2:
+                intensities[i, columns[matched]] = to_storage(row_values[matched], dtype)
+            else:
+                calibrations.setdefault(row_wavelengths.tobytes(), []).append(i)
+        # 其他校正的檔案依波長網格分組, 每組一次內插
+        for indices in calibrations.values():
+            block = np.stack([rows[i][1] for i in indices])
+            intensities[indices] = to_storage(self.resampler.resample(rows[indices[0]][0], block), dtype)
+        if calibrations:
+            logger.info(f"Resampled {sum(map(len, calibrations.values()))} files from "
+                        f"{len(calibrations)} other wavelength calibrations")
+
+        self._cube = SpectralCube(wavelengths=wavelengths, frames=self.manifest.frames,
+                                  intensities=intensities, base_name=self.manifest.base_name,
+                                  last_frames=self.manifest.last_frames)
+        return self._cube
+
+    def has_data(self) -> bool:
+        """True when values have been gathered."""
+        return self._cube is not None
+
+    def get_cube(self) -> SpectralCube:
+        """
+        Return the time x wavelength cube of the gathered values.
+
+        Returns:
+            SpectralCube of the current run (rows aligned with ``manifest``)
+        """
+        if self._cube is None:
+            raise ValueError("No data loaded. Please gather values first.")
+        return self._cube
+
+    @property
+    def all_values(self) -> Dict[float, List[Tuple[str, float]]]:
+        """
+        The gathered values as ``{wavelength: [(file_name, intensity), ...]}``.
+
+        Built from the cube on every access; kept for callers that expect the
+        mapping. Prefer ``get_cube``.
+        """
+        if self._cube is None:
+            return {}
+        file_names = self.manifest.file_names()
+        values = {}
+        for col, wavelength in enumerate(self._cube.wavelengths.tolist()):
+            column = to_float(self._cube.intensities[:, col])
+            present = np.flatnonzero(~np.isnan(column))
+            values[wavelength] = [(file_names[row], float(column[row])) for row in present]
+        return values
+
+    def _analysis_cube(self) -> SpectralCube:
+        """The cube the analyses run on: the raw cube, pre-processed when configured."""
+        cube = self.get_cube()
+        if self.preprocessing is None or not self.preprocessing.enabled:
+            return cube
+        if self._processed is None:
+            self._processed = self.preprocessing.apply(cube)
+        return self._processed
+
+    def get_analysis_cube(self) -> SpectralCube:
+        """Public access to the (pre-processed when configured) cube the analyses run on."""
+        return self._analysis_cube()
+
+    def _column_extrema(self) -> Dict[str, np.ndarray]:
+        if self._extrema is None:
+            self._extrema = column_extrema(self._analysis_cube().intensities)
+        return self._extrema
+
+    def export_cube(self, output_directory: str, base_name: str, fmt: str = 'npy') -> str:
+        """
+        Export the whole run (every frame x every wavelength) to a columnar file.
+
+        Args:
+            output_directory: Directory to write into
+            base_name: Base name used for the output file
+            fmt: 'npy' (memory-mappable, with JSON sidecar) or 'parquet'
+
+        Returns:
+            Path of the written data file
+        """
+        os.makedirs(output_directory, exist_ok=True)
+        path = os.path.join(output_directory, f"{base_name}_cube")
+        return save_cube(self.get_cube(), path, fmt=fmt)
+
+    def correlated_wavelengths(self, query_wavelengths: List[float], k: int = 10,
+                               frame_range: Optional[Tuple[int, int]] = None,
+                               min_difference: Optional[float] = None,
+                               exclude_nm: float = 1.0) -> Dict[float, List[Tuple[float, float]]]:
+        """
+        Find the wavelengths whose intensity moves with each query wavelength.
+
+        The correlation matrix of the (pre-selected) wavelengths over the frame
+        range is one matrix multiply of the centered, normalized cube.
+
+        Args:
+            query_wavelengths: Wavelengths to find partners for (e.g. from
+                ``find_significant_differences``)
+            k: Number of partners per query
+            frame_range: Frame numbers (first, last) to correlate over (default: all)
+            min_difference: Only correlate wavelengths whose max-min difference in
+                the frame range exceeds this (the queries are always kept)
+            exclude_nm: Partners within this distance of the query (the same
+                line) are skipped
+
+        Returns:
+            ``{query wavelength: [(partner wavelength, correlation), ...]}``, strongest first
+        """
+        cube = self._analysis_cube()
+        intensities = cube.intensities
+        if frame_range is not None:
+            rows = (cube.frames >= frame_range[0]) & (cube.frames <= frame_range[1])
+            if rows.sum() < 3:
+                raise ValueError(f"Too few frames in range {frame_range[0]}-{frame_range[1]}")
+            intensities = intensities[rows]
+
+        queries = []
+        for wavelength in query_wavelengths:
+            try:
+                queries.append(cube.wavelength_index(wavelength))
+            except KeyError:
+                logger.info(f"Wave length {wavelength} not found in data")
+        if not queries:
+            return {}
+
+        selected = np.ones(cube.n_wavelengths, dtype=bool)
+        if min_difference is not None:
+            extrema = column_extrema(intensities)
+            selected = extrema['max'] - extrema['min'] > min_difference
+        selected[queries] = True
+        columns = np.flatnonzero(selected)
+        logger.info(f"Correlating {len(columns)} of {cube.n_wavelengths} wavelengths over {len(intensities)} frames")
+
+        dtype = np.float32 if intensities.dtype.itemsize <= 4 else np.float64
+        correlation = correlation_matrix(intensities[:, columns], dtype)
+        return top_partners(correlation, cube.wavelengths[columns], np.searchsorted(columns, queries), k, exclude_nm)
+
+    def waveband_series(self, wavebands: List[float]) -> Tuple[np.ndarray, Dict[float, np.ndarray]]:
+        """
+        Time series of the given wavebands from the gathered values.
+
+        Args:
+            wavebands: Wavelengths to extract (wavebands not in the data are skipped)
+
+        Returns:
+            Tuple of (frame numbers, {waveband: intensity per frame})
+        """
+        cube = self._analysis_cube()
+        series = {}
+        for waveband in wavebands:
+            try:
+                series[waveband] = cube.column(waveband)
+            except KeyError:
+                logger.info(f"Wave length {waveband} not found in data")
+        return cube.frames, series
+
+    def band_traces(self, centers: List[float], widths, smoothing: Optional[Tuple[int, int]] = None) -> BandTraces:
+        """
+        Integrated band areas per frame of the gathered values (pre-processed when configured).
+
+        Args:
+            centers: Band centers in nm
+            widths: Band widths in nm (one per band, or one for all)
+            smoothing: Optional Savitzky-Golay ``(window, order)`` applied before integrating
+
+        Returns:
+            BandTraces aligned with ``manifest``
+        """
+        return integrate_bands(self._analysis_cube(), centers, widths, smoothing, self.manifest)
+
+    def loaded_band_traces(self, centers: List[float], widths,
+                           smoothing: Optional[Tuple[int, int]] = None) -> BandTraces:
+        """
+        Integrated band areas per frame of the files read by ``read_file_to_data``.
+
+        Only wavelengths present in every read file are used.
+        """
+        return integrate_bands(self._loaded_cube(), centers, widths, smoothing, self.data_manifest)
+
+    def line_fits(self, centers: List[float], search_nm: float = DEFAULT_SEARCH_NM,
+                  points: int = DEFAULT_FIT_POINTS, profile: str = 'gaussian') -> LineFits:
+        """
+        Sub-pixel centroid, FWHM and area per frame of several lines, all frames at once.
+
+        Args:
+            centers: Nominal line wavelengths
+            search_nm: Half width of the window searched for each line's peak
+            points: Pixels used by each fit (odd)
+            profile: 'gaussian' or 'lorentzian'
+
+        Returns:
+            LineFits aligned with ``manifest``
+        """
+        return fit_lines(self._analysis_cube(), centers, search_nm, points, profile, self.manifest)
+
+    def _loaded_cube(self) -> SpectralCube:
+        """Cube of the files read by ``read_file_to_data`` (wavelengths present in every file)."""
+        if not self._all_data or self.data_manifest is None:
+            raise ValueError("No data loaded. Please load data first.")
+        n_files = len(self.data_manifest)
+        wavelengths = sorted(w for w, values in self._all_data.items() if len(values) == n_files)
+        if len(wavelengths) < len(self._all_data):
+            logger.info(f"{len(self._all_data) - len(wavelengths)} wavelengths missing in some files are skipped")
+        intensities = np.array([self._all_data[w] for w in wavelengths], dtype=np.float64).T
+        return SpectralCube(wavelengths=np.array(wavelengths), frames=self.data_manifest.frames,
+                            intensities=intensities, base_name=self.data_manifest.base_name,
+                            last_frames=self.data_manifest.last_frames)
+
+    def ratio_traces(self, pairs: List[Tuple[float, float]], band_width: Optional[float] = None,
+                     smoothing: Optional[Tuple[int, int]] = None) -> RatioTraces:
+        """
+        Line-ratio traces (e.g. Hα/Ar) of the gathered values, all pairs at once.
+
+        Args:
+            pairs: (numerator, denominator) wavelengths
+            band_width: If given, divide integrated bands of this width instead of pixels
+            smoothing: Optional Savitzky-Golay ``(window, order)`` for the band integration
+
+        Returns:
+            RatioTraces aligned with ``manifest``
+        """
+        source = self._analysis_cube()
+        if band_width is not None:
+            source = self.band_traces(np.unique(pairs).tolist(), band_width, smoothing)
+        return line_ratios(source, pairs, self.manifest)
+
+    def loaded_ratio_traces(self, pairs: List[Tuple[float, float]], band_width: Optional[float] = None,
+                            smoothing: Optional[Tuple[int, int]] = None) -> RatioTraces:
+        """``ratio_traces`` of the files read by ``read_file_to_data``."""
+        source = self._loaded_cube()
+        if band_width is not None:
+            source = integrate_bands(source, np.unique(pairs).tolist(), band_width, smoothing, self.data_manifest)
+        return line_ratios(source, pairs, self.data_manifest)
+
+    def find_peak_points(self, data=None) -> List[dict]:
+        """
+        找出每個波段的最高點
+
+        Args:
+            data: SpectralCube or ``{wavelength: [(file_name, intensity), ...]}``
+                mapping (default: the gathered values)
+
+        Returns:
+            Peak point records, highest first
+        """
+        if data is None and not self.has_data():
+            return []
+        if data is None or data is self._cube:
+            cube, extrema, manifest = self._analysis_cube(), self._column_extrema(), self.manifest
+        else:
+            cube = data if isinstance(data, SpectralCube) else SpectralCube.from_all_values(data)
+            extrema = column_extrema(cube.intensities)
+            manifest = RunManifest.from_cube(cube)
+        return peak_point_records(cube.wavelengths, extrema, manifest)
+
     def find_specific_wavebands_differences(self, wavebands: List[float], threshold: float = 200) -> Dict:
         """分析特定波段的差異"""
-        specific_differences = {}
-        for value, measurements in self.all_values.items():
-            # logger.info(value,measurements)
-            if value in wavebands:
-                measurements_only = [m[1] for m in measurements]
-                min_measurement = min(measurements_only)
-                max_measurement = max(measurements_only)
-                if abs(max_measurement - min_measurement) > threshold:
-                    largest_diff = max(measurements, key=lambda x: abs(x[1] - min_measurement))
-                    filename = largest_diff[0]
-                    file_second = filename.split('S')[-1].split('.')[0]
-                    specific_differences[value] = (min_measurement, max_measurement, largest_diff, file_second)
-            
-        return specific_differences
+        if not self.has_data():
+            return {}
+        return significant_difference_records(self._analysis_cube().wavelengths, self._column_extrema(),
+                                              self.manifest, threshold, wavebands)
 
     def find_significant_differences(self, threshold: float = 200) -> Dict:
         """分析所有波段的顯著差異"""
-        significant_differences = {}
-        for value, measurements in self.all_values.items():
-            measurements_only = [m[1] for m in measurements]
-            min_measurement = min(measurements_only)
-            max_measurement = max(measurements_only)
-            if abs(max_measurement - min_measurement) > threshold:
-                largest_diff = max(measurements, key=lambda x: abs(x[1] - min_measurement))
-                significant_differences[value] = (min_measurement, max_measurement, largest_diff)
-        return significant_differences
-
-    def allSpectrum_plot(self, data1, skip_range_nm, output_directory, file_name, intensity_threshold=None):
+        if not self.has_data():
+            return {}
+        return significant_difference_records(self._analysis_cube().wavelengths, self._column_extrema(),
+                                              self.manifest, threshold)
+
+    def allSpectrum_plot(self, data1, skip_range_nm, output_directory, file_name, intensity_threshold=None,
+                         output_suffix: str = ''):
         """繪製全波段圖形並標記出最高波段"""
         try:
+            if data1 is not None and data1 is self._cube:
+                cube, extrema = self._analysis_cube(), self._column_extrema()
+            else:
+                cube = data1 if isinstance(data1, SpectralCube) else SpectralCube.from_all_values(data1)
+                extrema = column_extrema(cube.intensities)
+            wavelengths1, y1 = cube.wavelengths, extrema['max']
+
             # 過濾低於指定強度的波型
             if intensity_threshold is not None:
-                data1 = {k: v for k, v in data1.items() if any(m[1] > intensity_threshold for m in v)}
-            
+                keep = y1 > intensity_threshold
+                cube = SpectralCube(wavelengths1[keep], cube.frames, cube.intensities[:, keep], cube.base_name)
+                extrema = {key: values[keep] for key, values in extrema.items()}
+                wavelengths1, y1 = cube.wavelengths, extrema['max']
+
             # 找出每個數據集的最大值點
-            peaks1 = self.find_peak_points(data1)
+            manifest = self.manifest if data1 is self._cube else RunManifest.from_cube(cube)
+            peaks1 = peak_point_records(wavelengths1, extrema, manifest)
 
-            # 取得最大值的波長
-            max_peak1 = peaks1[0]  # 已經按最大值排序，所以第一個就是最大的
-            sorted_peaks = sorted(peaks1, key=lambda x: x['最大值'], reverse=True)
+            return self.plot_envelope(wavelengths1, y1, peaks1, skip_range_nm, output_directory, file_name,
+                                      output_suffix)
 
-            # 準備數據
-            wavelengths1 = sorted(data1.keys())
-            y1 = [max(m[1] for m in data1[w]) for w in wavelengths1]
-        
-            # 創建圖表
-            plt.figure(figsize=(10, 6))
+        except Exception as e:
+            logger.info(f"生成比較圖時發生錯誤: {str(e)}")
+            return None
 
-            # 添加最大值波段信息到標題
-            title_text = (f'ALL_Spectrum & Higher Peaks \n'
-                        f'Max_peak: {max_peak1["波段"]:.1f}nm')
-            plt.title(title_text)
-            
-            # 繪製線條
-            plt.plot(wavelengths1, y1, color='red', label='Highest_data', linewidth=1)
+    def plot_envelope(self, wavelengths1, y1, peaks1: List[dict], skip_range_nm, output_directory, file_name,
+                      output_suffix: str = ''):
+        """
+        Draw a precomputed max-envelope and mark the highest peaks.
 
-            marked_peaks = []
-            for index, peak in enumerate(sorted_peaks):
-                if len(marked_peaks) >= 3:
-                    break
-                
-                # 檢查是否需要跳過範圍
-                if not any(abs(peak['波段'] - marked_peak['波段']) <= skip_range_nm for marked_peak in marked_peaks):
-                    # 調整標註位置以避免重疊
-                    offset = len(marked_peaks) * 10  # 根據已標註的數量調整偏移量
-                    rotation_angle = 0 if index == 0 else 45  # 最高波段不旋轉，其他旋轉45度
-                    plt.annotate(f'Peak: {peak["波段"]:.1f} nm, intensity: {peak["最大值"]:.1f}',
-                                xy=(peak['波段'], peak['最大值']),
-                                xytext=(7, offset), textcoords='offset points', 
-                                arrowprops=dict(arrowstyle='->', lw=1.5),
-                                rotation=rotation_angle)  # 根據條件設置旋轉角度
-                    marked_peaks.append(peak)
-
-            x_ticks = [peak['波段'] for peak in marked_peaks]
-            plt.xticks(ticks=x_ticks, labels=[f'{wavelengths1:.1f}nm' for wavelengths1 in x_ticks], rotation=45)        
-            
-            # 設置圖表屬性
-            plt.xlabel('Wavelength(nm)')
-            plt.ylabel('Intensity(Cts)')
-            # plt.legend()
-            
-            # 建構檔案名稱
-            output_file_name = f"{file_name}_allspectrum_highestPeaks.png"
+        The low-dpi preview is rendered immediately into ``last_preview``;
+        the 300-dpi file is written in the background (see ``wait_for_plots``).
+
+        Args:
+            wavelengths1: Wavelength axis
+            y1: Max intensity per wavelength
+            peaks1: Peak points as returned by ``find_peak_points``
+            skip_range_nm: Minimum distance between marked peaks
+            output_directory: Directory to save the figure
+            file_name: Prefix of the figure file name
+            output_suffix: Suffix appended to the figure file name (e.g. '_filtered')
+
+        Returns:
+            Path the figure is written to, or None on failure
+        """
+        try:
+            envelope = SpectrumEnvelope.from_peaks(wavelengths1, y1, peaks1, skip_range_nm)
+            self.last_envelope = envelope
 
-            # 保存圖表
+            # 建構檔案名稱
+            output_file_name = f"{file_name}_allspectrum_highestPeaks{output_suffix}.png"
             output_path = os.path.join(output_directory, output_file_name)
-            plt.savefig(output_path, dpi=300, bbox_inches='tight')
-            plt.close()
-        
-            logger.info(f"已生成最大值比較圖：{output_path}")
+
+            # 先產生低解析度預覽, 高解析度檔案於背景寫出
+            self.last_preview, future = self.plot_service.render(envelope, output_path)
+            future.add_done_callback(self._log_plot_failure)
             return output_path
-        
+
         except Exception as e:
             logger.info(f"生成比較圖時發生錯誤: {str(e)}")
             return None
 
+    @staticmethod
+    def _log_plot_failure(future) -> None:
+        if future.exception() is not None:
+            logger.info(f"生成比較圖時發生錯誤: {str(future.exception())}")
+
+    def wait_for_plots(self, timeout: Optional[float] = None) -> None:
+        """Wait until every background figure write has finished."""
+        self.plot_service.wait(timeout)
+
+    def heatmap_plot(self, output_directory: Optional[str] = None, file_name: str = '',
+                     marker_frames: Optional[List[int]] = None,
+                     marker_wavebands: Optional[List[float]] = None) -> bytes:
+        """
+        Draw the whole run as a time x wavelength heatmap.
+
+        Args:
+            output_directory: If given, also save a full-resolution PNG there
+            file_name: Prefix of the figure file name
+            marker_frames: Frames to mark (e.g. activation and end frames)
+            marker_wavebands: Wavelengths to mark (e.g. the selected wavebands)
+
+        Returns:
+            Low-dpi PNG preview of the heatmap
+        """
+        cube = self.get_cube()
+        if self._heatmap_renderer is None:
+            self._heatmap_renderer = HeatmapRenderer()
+        self._heatmap_renderer.draw(cube.wavelengths, cube.frames, to_float(cube.intensities, np.float32),
+                                    marker_frames, marker_wavebands)
+
+        if output_directory is not None:
+            output_path = os.path.join(output_directory, f"{file_name}_heatmap.png")
+            self._heatmap_renderer.save(output_path)
+            logger.info(f"已生成時間-波長熱圖：{output_path}")
+        return self._heatmap_renderer.to_png()
+
     def analyze_sections(self, wave_data: List[float], section: int) -> Dict[str, Dict[str, float]]:
         """
         Analyze wave data in sections.
 
         Args:
-            wave_data: List of wave data points
+            wave_data: List of wave data points (a pixel series or a band trace)
             section: Number of sections
 
         Returns:
             Dictionary containing analysis results for each section
         """
+        # 以 float64 累加, 儲存型別為 float32/int32 時仍保有精度
+        wave_data = to_float(wave_data, np.float64)
         section_size = len(wave_data) // section
         sectioned_data = {}
 
@@ -309,9 +768,46 @@ class OESAnalyzer:
         return sectioned_data
 
     def OES_analyze_and_export(self, wavebands: List[float], thresholds: List[float], 
-                           base_name, skip_range_nm: float, output_directory: str) -> Tuple[str, str]:
-        """執行分析並導出結果"""
+                           base_name, skip_range_nm: float, output_directory: str,
+                           band_width: Optional[float] = None,
+                           smoothing: Optional[Tuple[int, int]] = None) -> Tuple[str, str]:
+        """
+        執行分析並導出結果
+
+        With ``band_width`` the specific wavebands are integrated over
+        ``waveband ± band_width/2`` instead of read from a single pixel.
+        """
         self.gather_values()
+        specific_source = None
+        if band_width is not None and self.has_data():
+            specific_source = self.band_traces(wavebands, band_width, smoothing)
+        return self.export_difference_workbooks(wavebands, thresholds, base_name, output_directory,
+                                                specific_source=specific_source)
+
+    def export_difference_workbooks(self, wavebands: List[float], thresholds: List[float],
+                                    base_name, output_directory: str, source=None,
+                                    specific_source=None) -> Tuple[str, str]:
+        """
+        Write the specific-waveband and all-waveband dissociation workbooks.
+
+        Args:
+            wavebands: Specific wavebands to report
+            thresholds: One sheet is written per threshold
+            base_name: Prefix of the workbook names
+            output_directory: Directory to save the workbooks
+            source: Object providing ``find_specific_wavebands_differences`` and
+                ``find_significant_differences`` (default: this analyzer; a
+                ChunkedCubeAnalyzer in chunked mode)
+            specific_source: Source of the specific-waveband workbook (default:
+                ``source``; BandTraces for integrated bands)
+
+        Returns:
+            Tuple of (all-waveband workbook path, specific-waveband workbook path)
+        """
+        import pandas as pd  # Excel 後端只在匯出時載入
+
+        source = self if source is None else source
+        specific_source = source if specific_source is None else specific_source
         # 使用傳遞的 output_directory
         os.makedirs(output_directory, exist_ok=True)
         # 處理特定波段數據
@@ -319,7 +815,7 @@ class OESAnalyzer:
         # logger.info(specific_excel_name)
         with pd.ExcelWriter(specific_excel_name) as specific_writer:
             for threshold in thresholds:
-                specific_differences = self.find_specific_wavebands_differences(wavebands, threshold)
+                specific_differences = specific_source.find_specific_wavebands_differences(wavebands, threshold)
                 if specific_differences:
                     specific_data = []
                     for value, (min_measurement, max_measurement, largest_diff, _) in sorted(specific_differences.items()):
@@ -339,7 +835,7 @@ class OESAnalyzer:
         excel_name = os.path.join(output_directory, f"{base_name}_全部解離波段.xlsx")
         with pd.ExcelWriter(excel_name) as writer:
             for threshold in thresholds:
-                significant_differences = self.find_significant_differences(threshold)
+                significant_differences = source.find_significant_differences(threshold)
                 if significant_differences:
                     data = []
                     for value, (min_measurement, max_measurement, largest_diff) in sorted(significant_differences.items()):
@@ -357,20 +853,79 @@ class OESAnalyzer:
 
         return excel_name, specific_excel_name
 
+    def decompose(self, n_components: int = DEFAULT_COMPONENTS, frame_range: Optional[Tuple[int, int]] = None,
+                  flag_sigma: float = DEFAULT_FLAG_SIGMA) -> SpectralComponents:
+        """
+        Principal components of the gathered run (randomized truncated SVD).
+
+        Args:
+            n_components: Number of components to keep
+            frame_range: Frame numbers (first, last) to fit on (default: all)
+            flag_sigma: Reconstruction-error flag threshold, in robust standard deviations
+
+        Returns:
+            SpectralComponents, usable as the reference for ``screen_run``
+        """
+        cube = self._analysis_cube()
+        rows = None
+        if frame_range is not None:
+            rows = (cube.frames >= frame_range[0]) & (cube.frames <= frame_range[1])
+        return SpectralComponents.fit(cube, n_components, rows, flag_sigma)
+
+    def screen_run(self, components: SpectralComponents) -> Screening:
+        """Project the gathered run onto (reference) components and flag abnormal frames."""
+        return components.screen(self._analysis_cube(), self.manifest)
+
+    def export_decomposition(self, components: SpectralComponents, screening: Screening, base_name,
+                             output_directory: str) -> str:
+        """
+        Write component spectra, per-frame scores and reconstruction errors to one workbook.
+
+        Args:
+            components: Components the run was projected onto
+            screening: Result of ``screen_run``
+            base_name: Prefix of the workbook name
+            output_directory: Directory to save the workbook
+
+        Returns:
+            Path of the workbook
+        """
+        import pandas as pd
+
+        os.makedirs(output_directory, exist_ok=True)
+        excel_name = os.path.join(output_directory, f"{base_name}_成分分析.xlsx")
+        names = [f"成分{j + 1}" for j in range(len(components.components))]
+        with pd.ExcelWriter(excel_name) as writer:
+            pd.DataFrame({
+                '成分': names,
+                '奇異值': components.singular_values,
+                '解釋變異比例': components.explained_variance_ratio,
+            }).to_excel(writer, sheet_name='摘要', index=False)
+
+            spectra = pd.DataFrame(components.components.T, columns=names)
+            spectra.insert(0, '波段', components.wavelengths)
+            spectra.to_excel(writer, sheet_name='成分光譜', index=False)
+
+            scores = pd.DataFrame(screening.scores, columns=names)
+            scores.insert(0, '時間點', screening.manifest.frames)
+            scores['重建誤差'] = screening.errors
+            scores['異常'] = screening.flagged
+            scores.to_excel(writer, sheet_name='幀分數', index=False)
+        return excel_name
+
     def filter_low_intensity(self, threshold: float):
         """將低於指定強度的波段設置為0"""
-        if not self.all_values:
+        if self._cube is None:
             print("all_values is empty")
             return
-        
-        for value, measurements in self.all_values.items():
-            # print(f"Processing value: {value}, measurements: {measurements}")
-            for i, (file_name, intensity) in enumerate(measurements):
-                # print(f"File: {file_name}, Intensity: {intensity}")
-                if intensity < threshold:
-                    self.all_values[value][i] = (file_name, 0.0)
 
-    def prepare_results_dataframe(self, sectioned_data: Dict[str, Dict[str, float]]) -> pd.DataFrame:
+        # 缺值維持缺值
+        intensities = self._cube.intensities
+        intensities[(intensities < threshold) & ~missing_mask(intensities)] = 0
+        self._processed = None
+        self._extrema = None
+
+    def prepare_results_dataframe(self, sectioned_data: Dict[str, Dict[str, float]]) -> 'pd.DataFrame':
         """
         Prepare results DataFrame from sectioned data.
 
@@ -380,6 +935,8 @@ class OESAnalyzer:
         Returns:
             DataFrame containing formatted results
         """
+        import pandas as pd
+
         results = []
         for section_name, stats in sectioned_data.items():
             results.append([
@@ -391,23 +948,122 @@ class OESAnalyzer:
 
         return pd.DataFrame(results, columns=['區段', '平均值', '標準差', '穩定度'])
 
-    def detect_activate_time(self, max_wave: float, threshold: float, start_index: int) -> Tuple[Optional[int], Optional[int]]:
+    def detect_activate_time(self, max_wave: float, threshold: float, start_index: int, method: str = 'diff',
+                             window: int = DEFAULT_WINDOW) -> Tuple[Optional[int], Optional[int]]:
         """
         Find activation time points.
 
         Args:
             max_wave: Wave length to analyze
-            threshold: Threshold for activation detection
-            start_index: Starting index for the analysis
+            threshold: Threshold for activation detection ('changepoint': minimum mean shift)
+            start_index: Frame number of the first value, used when the frames
+                of the loaded files are unknown
+            method: 'diff' (first frame-to-frame jump above ``threshold``) or
+                'changepoint' (most significant two-window mean shift, robust to
+                noisy frames and slow ramps; scores in ``last_change_points``)
+            window: Frames averaged on each side of a split ('changepoint')
 
         Returns:
-            Tuple of activation start and end times
+            Tuple of activation start and end frame numbers
         """
         if max_wave not in self._all_data:
             logger.error(f"Wave length {max_wave} not found in data")
             return None, None
 
         time_series = self._all_data[max_wave]
+        # 每個檔案都有此波長時, 直接以幀號陣列對應時間點
+        frames, last_frames = None, None
+        if self.data_manifest is not None and len(self.data_manifest) == len(time_series):
+            frames, last_frames = self.data_manifest.frames, self.data_manifest.last_frames
+        return self._detect_activation(time_series, threshold, frames, start_index, method, window, last_frames)
+
+    def detect_band_activate_time(self, bands: BandTraces, center: float, threshold: float, method: str = 'diff',
+                                  window: int = DEFAULT_WINDOW) -> Tuple[Optional[int], Optional[int]]:
+        """
+        Find activation time points on an integrated band trace.
+
+        Args:
+            bands: Band traces (``band_traces`` or ``loaded_band_traces``)
+            center: Center of the band to analyze
+            threshold: Threshold for activation detection, in band-area units
+            method: 'diff' or 'changepoint' (see ``detect_activate_time``)
+            window: Frames averaged on each side of a split ('changepoint')
+
+        Returns:
+            Tuple of activation start and end frame numbers
+        """
+        return self._detect_activation(bands.trace(center), threshold, bands.frames, 0, method, window)
+
+    def detect_ratio_activate_time(self, ratios: RatioTraces, pair: Tuple[float, float], threshold: float,
+                                   method: str = 'diff',
+                                   window: int = DEFAULT_WINDOW) -> Tuple[Optional[int], Optional[int]]:
+        """
+        Find activation time points on a line-ratio trace.
+
+        Args:
+            ratios: Ratio traces (``ratio_traces`` or ``loaded_ratio_traces``)
+            pair: (numerator, denominator) of the ratio to analyze
+            threshold: Threshold for activation detection, as a ratio step
+            method: 'diff' or 'changepoint' (see ``detect_activate_time``)
+            window: Frames averaged on each side of a split ('changepoint')
+
+        Returns:
+            Tuple of activation start and end frame numbers
+        """
+        return self._detect_activation(ratios.trace(pair), threshold, ratios.frames, 0, method, window)
+
+    def waveband_change_points(self, wavebands: List[float], window: int = DEFAULT_WINDOW,
+                               min_score: float = DEFAULT_MIN_SCORE) -> List[dict]:
+        """
+        Change points of several wavebands of the gathered values, detected at once.
+
+        Args:
+            wavebands: Wavelengths to analyze (wavebands not in the data are skipped)
+            window: Frames averaged on each side of a split
+            min_score: Minimum shift, in noise standard deviations
+
+        Returns:
+            One record per waveband with activation/end time points and their confidence scores
+        """
+        frames, series = self.waveband_series(wavebands)
+        if not series:
+            return []
+        points = detect_change_points(np.column_stack(list(series.values())), window, min_score)
+        records = []
+        for column, waveband in enumerate(series):
+            activate_time, end_time = points.activation(column, frames)
+            records.append({
+                '波段': waveband,
+                '啟動時間點': activate_time,
+                '結束時間點': end_time,
+                '啟動信心': round(float(points.activate_scores[column]), 2),
+                '結束信心': round(float(points.end_scores[column]), 2),
+            })
+        return records
+
+    def _detect_activation(self, time_series, threshold: float, frames: Optional[np.ndarray], start_index: int,
+                           method: str, window: int,
+                           last_frames: Optional[np.ndarray] = None) -> Tuple[Optional[int], Optional[int]]:
+        self.last_change_points = None
+        if method == 'diff':
+            return self._activation_frames(time_series, threshold, frames, start_index, last_frames)
+        if method != 'changepoint':
+            raise ValueError(f"Unknown activation detection method: {method}")
+
+        if frames is None:
+            frames = np.arange(len(time_series)) + start_index
+        points = detect_change_points(time_series, window, min_shift=threshold)
+        self.last_change_points = points
+        logger.info(f"Change points: activation score {points.activate_scores[0]:.1f}, "
+                    f"end score {points.end_scores[0]:.1f}")
+        return points.activation(0, frames)
+
+    @staticmethod
+    def _activation_frames(time_series, threshold: float, frames: Optional[np.ndarray], start_index: int,
+                           last_frames: Optional[np.ndarray] = None) -> Tuple[Optional[int], Optional[int]]:
+        # 合併幀時, 結束時間點取該列最後一個原始幀
+        if last_frames is None:
+            last_frames = frames
         activated = False
         activate_time = None
         end_time = None
@@ -416,11 +1072,11 @@ class OESAnalyzer:
             diff = time_series[i + 1] - time_series[i]
             
             if not activated and diff > threshold:
-                activate_time = i + 1 + start_index
+                activate_time = int(frames[i + 1]) if frames is not None else i + 1 + start_index
                 activated = True
                 logger.debug(f"Activation detected at index {activate_time}")
             elif activated and diff < -threshold:
-                end_time = i + 1 + start_index
+                end_time = int(last_frames[i + 1]) if last_frames is not None else i + 1 + start_index
                 logger.debug(f"Deactivation detected at index {end_time}")
                 break
                 
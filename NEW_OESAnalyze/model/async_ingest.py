@@ -0,0 +1,162 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import AsyncIterator, Callable, Iterable, List, Optional, Tuple
+import numpy as np
+from model.cube import parse_spectrum_text
+from model.diagnostics import MISSING_FILE, EMPTY_FILE, READ_ERROR
+
+logger = logging.getLogger(__name__)
+
+# 同時讀取 (或等待解析) 的檔案數上限
+DEFAULT_MAX_IN_FLIGHT = 16
+
+
+class LocalFiles:
+    """Blocking reads from the local (or network-mounted) filesystem."""
+
+    def read_bytes(self, path: str) -> bytes:
+        with open(path, 'rb') as file:
+            return file.read()
+
+
+class LatencyShim:
+    """
+    File source adding a fixed (plus random) delay to every read.
+
+    Stands in for a high-latency mount (NAS) when testing locally: the
+    delay blocks the reading thread like a slow ``open``/``read`` would.
+    """
+
+    def __init__(self, source=None, latency_s: float = 0.02, jitter_s: float = 0.0, seed: int = 0):
+        self.source = source or LocalFiles()
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        self._rng = np.random.default_rng(seed)
+
+    def read_bytes(self, path: str) -> bytes:
+        time.sleep(self.latency_s + self.jitter_s * self._rng.random())
+        return self.source.read_bytes(path)
+
+
+@dataclass
+class IngestedSpectrum:
+    """
+    One file's spectrum, or the diagnostics category of why it has none.
+
+    ``skipped`` holds the lines that looked like data (contain ``;``) but
+    could not be parsed, such as the header line.
+    """
+    path: str
+    wavelengths: np.ndarray
+    intensities: np.ndarray
+    error: Optional[str] = None
+    detail: str = ''
+    skipped: List[str] = field(default_factory=list)
+
+
+def _parse_bytes(data: bytes, min_wavelength: float) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+    """Parse one file's contents (runs in a parser process)."""
+    skipped = []
+    wavelengths, intensities = parse_spectrum_text(data.decode('utf-8'), min_wavelength, skipped)
+    return wavelengths, intensities, skipped
+
+
+async def iter_spectra(paths: Iterable[str], max_in_flight: int = DEFAULT_MAX_IN_FLIGHT, source=None,
+                       min_wavelength: float = 195.0, io_executor: Optional[Executor] = None,
+                       parse_executor: Optional[Executor] = None) -> AsyncIterator[IngestedSpectrum]:
+    """
+    Read and parse spectrum files concurrently, yielding them in input order.
+
+    At most ``max_in_flight`` files are being fetched or parsed at any time:
+    a new read starts whenever the oldest file has been yielded, so memory
+    stays bounded and frame order is preserved while slow reads overlap.
+
+    Args:
+        paths: Spectrum files in frame order
+        max_in_flight: Concurrency limit
+        source: Object with a blocking ``read_bytes(path)`` (default: ``LocalFiles``)
+        min_wavelength: Wavelengths below this value are dropped
+        io_executor: Executor running the blocking reads (default: the loop's)
+        parse_executor: Executor running ``parse_spectrum_text`` (default: the loop's)
+
+    Yields:
+        IngestedSpectrum per path; files without any data line carry ``EMPTY_FILE``
+    """
+    if max_in_flight < 1:
+        raise ValueError("max_in_flight must be at least 1")
+    loop = asyncio.get_running_loop()
+    source = source or LocalFiles()
+    empty = np.empty(0)
+
+    async def load(path: str) -> IngestedSpectrum:
+        try:
+            data = await loop.run_in_executor(io_executor, source.read_bytes, path)
+        except FileNotFoundError:
+            return IngestedSpectrum(path, empty, empty, MISSING_FILE)
+        except OSError as e:
+            return IngestedSpectrum(path, empty, empty, READ_ERROR, str(e))
+        try:
+            wavelengths, intensities, skipped = await loop.run_in_executor(parse_executor, _parse_bytes, data,
+                                                                           min_wavelength)
+        except (UnicodeDecodeError, ValueError) as e:
+            return IngestedSpectrum(path, empty, empty, READ_ERROR, str(e))
+        if len(wavelengths) == 0:
+            return IngestedSpectrum(path, empty, empty, EMPTY_FILE, skipped=skipped)
+        return IngestedSpectrum(path, wavelengths, intensities, skipped=skipped)
+
+    remaining = iter(paths)
+    pending = deque(asyncio.ensure_future(load(path)) for path in islice(remaining, max_in_flight))
+    try:
+        while pending:
+            spectrum = await pending.popleft()
+            following = next(remaining, None)
+            if following is not None:
+                pending.append(asyncio.ensure_future(load(following)))
+            yield spectrum
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+@dataclass
+class AsyncIngest:
+    """
+    Configuration of the concurrent ingest mode.
+
+    Reads run on a thread pool (they wait on I/O and release the GIL);
+    parsing runs on a process pool, since the regular-expression parse
+    holds the GIL and would otherwise not overlap with itself. Each file's
+    bytes and parsed arrays are pickled between the processes, which is
+    small next to the parse itself.
+
+    Attributes:
+        max_in_flight: Files fetched or parsed at the same time
+        source: File source (default: the filesystem; ``LatencyShim`` for tests)
+        parse_workers: Parser processes (default: one per CPU)
+    """
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT
+    source: object = field(default_factory=LocalFiles)
+    parse_workers: Optional[int] = None
+
+    def read(self, paths: Iterable[str], callback: Callable[[IngestedSpectrum], None],
+             min_wavelength: float = 195.0) -> None:
+        """
+        Ingest ``paths`` and call ``callback`` once per file, in input order.
+
+        The callback runs on the calling thread's event loop between reads, so
+        it can fill a cube or feed a binner without any locking.
+        """
+        async def run():
+            async for spectrum in iter_spectra(paths, self.max_in_flight, self.source, min_wavelength,
+                                               io_pool, parse_pool):
+                callback(spectrum)
+
+        with ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix='oes-read') as io_pool, \
+                ProcessPoolExecutor(max_workers=self.parse_workers or os.cpu_count() or 1) as parse_pool:
+            asyncio.run(run())
@@ -0,0 +1,159 @@
+import logging
+from dataclasses import dataclass
+from typing import Optional, Sequence, Tuple
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from model.cube import SpectralCube, to_float
+from model.manifest import RunManifest, column_extrema, significant_difference_records
+
+logger = logging.getLogger(__name__)
+
+# 每次累積和處理的幀數, 限制 float64 暫存陣列的大小
+BAND_BLOCK_ROWS = 1024
+
+
+def savgol_coefficients(window: int, order: int) -> np.ndarray:
+    """
+    Savitzky-Golay smoothing coefficients (value at the window center).
+
+    Args:
+        window: Window width in pixels (odd)
+        order: Polynomial order (< window)
+
+    Returns:
+        Convolution kernel of length ``window``
+    """
+    if window % 2 == 0 or order >= window:
+        raise ValueError(f"Savitzky-Golay needs an odd window larger than the order (got {window}, {order})")
+    offsets = np.arange(window) - window // 2
+    # 最小平方擬合多項式後取中心點的值, 即偽逆矩陣的第一列
+    return np.linalg.pinv(np.vander(offsets, order + 1, increasing=True))[0]
+
+
+def savgol_smooth(intensities: np.ndarray, window: int = 11, order: int = 2) -> np.ndarray:
+    """
+    Savitzky-Golay smoothing of every frame along the wavelength axis.
+
+    All frames are smoothed by one contraction of the sliding windows with
+    the kernel (a single convolution over the whole block). Edges are padded
+    with the edge values.
+
+    Args:
+        intensities: Float array of shape (n_frames, n_wavelengths)
+        window: Window width in pixels (odd)
+        order: Polynomial order
+
+    Returns:
+        Smoothed array of the same shape
+    """
+    kernel = savgol_coefficients(window, order).astype(intensities.dtype)
+    half = window // 2
+    padded = np.pad(intensities, ((0, 0), (half, half)), mode='edge')
+    return sliding_window_view(padded, window, axis=1) @ kernel
+
+
+def band_edges(wavelengths: np.ndarray, centers: Sequence[float],
+               widths: Sequence[float]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Pixel range [first, end) of every band.
+
+    A band covers the pixels whose wavelength lies within ``center ± width/2``;
+    a band narrower than one pixel falls back to the pixel nearest its center.
+
+    Returns:
+        Tuple of (first pixel, end pixel) arrays
+    """
+    centers = np.asarray(centers, dtype=np.float64)
+    half_widths = np.broadcast_to(np.asarray(widths, dtype=np.float64), centers.shape) / 2
+    first = np.searchsorted(wavelengths, centers - half_widths, side='left')
+    end = np.searchsorted(wavelengths, centers + half_widths, side='right')
+
+    empty = end <= first
+    if empty.any():
+        nearest = np.abs(wavelengths[None, :] - centers[empty, None]).argmin(axis=1)
+        first[empty], end[empty] = nearest, nearest + 1
+    return first, end
+
+
+@dataclass
+class BandTraces:
+    """
+    Integrated intensity of several wavebands per frame.
+
+    ``areas[i, j]`` is the area of band ``j`` in frame ``manifest.frames[i]``
+    (intensity x nm). Use ``trace`` for one band or ``as_cube`` to feed the
+    per-wavelength analyses with bands in place of pixels.
+    """
+    centers: np.ndarray
+    widths: np.ndarray
+    areas: np.ndarray
+    manifest: RunManifest
+
+    @property
+    def frames(self) -> np.ndarray:
+        return self.manifest.frames
+
+    def index(self, center: float) -> int:
+        """Column of the band closest to ``center``."""
+        return int(np.abs(self.centers - center).argmin())
+
+    def trace(self, center: float) -> np.ndarray:
+        """Area per frame of the band closest to ``center``."""
+        return self.areas[:, self.index(center)]
+
+    def find_specific_wavebands_differences(self, wavebands, threshold: float = 200):
+        """Dissociation of the bands centered on ``wavebands`` (``OESAnalyzer`` format)."""
+        return significant_difference_records(self.centers, column_extrema(self.areas), self.manifest,
+                                              threshold, wavebands)
+
+    def find_significant_differences(self, threshold: float = 200):
+        """Dissociation of all bands (``OESAnalyzer`` format)."""
+        return significant_difference_records(self.centers, column_extrema(self.areas), self.manifest, threshold)
+
+    def as_cube(self) -> SpectralCube:
+        """The traces as a cube with one 'wavelength' (the band center) per band."""
+        return SpectralCube(wavelengths=self.centers, frames=self.frames, intensities=self.areas,
+                            base_name=self.manifest.base_name, last_frames=self.manifest.last_frames)
+
+
+def integrate_bands(cube: SpectralCube, centers: Sequence[float], widths: Sequence[float],
+                    smoothing: Optional[Tuple[int, int]] = None,
+                    manifest: Optional[RunManifest] = None) -> BandTraces:
+    """
+    Integrate many wavebands of every frame at once.
+
+    Each frame is optionally Savitzky-Golay smoothed, weighted by the pixel
+    width and summed cumulatively along the wavelength axis, so every band
+    is the difference of two cumulative values: O(1) per band per frame
+    regardless of its width. Missing values count as zero.
+
+    Args:
+        cube: Spectral cube (any storage dtype)
+        centers: Band centers in nm
+        widths: Band widths in nm (one per band, or a single width for all)
+        smoothing: Optional Savitzky-Golay ``(window, order)``
+        manifest: Manifest of the cube rows (default: built from the cube)
+
+    Returns:
+        BandTraces with one column per band
+    """
+    centers = np.asarray(centers, dtype=np.float64)
+    widths = np.broadcast_to(np.asarray(widths, dtype=np.float64), centers.shape).copy()
+    wavelengths = cube.wavelengths
+    first, end = band_edges(wavelengths, centers, widths)
+    pixel_widths = np.gradient(wavelengths) if len(wavelengths) > 1 else np.ones(1)
+
+    n_frames = cube.intensities.shape[0]
+    areas = np.empty((n_frames, len(centers)), dtype=np.float64)
+    cumulative = np.zeros((min(BAND_BLOCK_ROWS, n_frames), len(wavelengths) + 1), dtype=np.float64)
+    for start in range(0, n_frames, BAND_BLOCK_ROWS):
+        block = np.nan_to_num(to_float(cube.intensities[start:start + BAND_BLOCK_ROWS], np.float64), nan=0.0)
+        if smoothing is not None:
+            block = savgol_smooth(block, *smoothing)
+        rows = len(block)
+        np.cumsum(block * pixel_widths, axis=1, out=cumulative[:rows, 1:])
+        areas[start:start + rows] = cumulative[:rows, end] - cumulative[:rows, first]
+
+    if manifest is None:
+        manifest = RunManifest.from_cube(cube)
+    return BandTraces(centers=centers, widths=widths, areas=areas, manifest=manifest)
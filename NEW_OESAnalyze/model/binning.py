@@ -0,0 +1,142 @@
+import logging
+from dataclasses import dataclass
+from typing import Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BIN_MODES = ('mean', 'sum')
+# 'count': 每 size 個讀到的檔案一組; 'frames': 依幀號分組 (每 size 個幀號, 缺檔不補)
+BIN_BY = ('count', 'frames')
+
+
+@dataclass
+class BinnedFrame:
+    """
+    One co-added frame: the frames ``first_frame..last_frame`` combined.
+
+    ``values`` is NaN where no frame of the bin had a value.
+    """
+    first_frame: int
+    last_frame: int
+    n_frames: int
+    path: str
+    wavelengths: np.ndarray
+    values: np.ndarray
+
+
+@dataclass
+class FrameBinning:
+    """
+    Co-adding of consecutive frames at ingest time.
+
+    Attributes:
+        size: Frames per bin (1 disables binning)
+        mode: 'mean' (average, same units as a frame) or 'sum' (co-added counts)
+        by: 'count' (every ``size`` files read) or 'frames' (every ``size``
+            frame numbers, so a bin with missing files holds fewer frames)
+    """
+    size: int = 1
+    mode: str = 'mean'
+    by: str = 'count'
+
+    def __post_init__(self):
+        if self.size < 1:
+            raise ValueError("Bin size must be at least 1")
+        if self.mode not in BIN_MODES:
+            raise ValueError(f"Unknown binning mode: {self.mode}")
+        if self.by not in BIN_BY:
+            raise ValueError(f"Unknown binning key: {self.by}")
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 1
+
+    def binner(self) -> 'FrameBinner':
+        return FrameBinner(self)
+
+
+class FrameBinner:
+    """
+    Streaming accumulator: frames go in one at a time, a ``BinnedFrame`` comes
+    out whenever a bin is complete, so only one bin is ever held in memory.
+    """
+
+    def __init__(self, binning: FrameBinning):
+        self.binning = binning
+        self._key: Optional[int] = None
+        self._origin: Optional[int] = None
+        self._seen = 0
+        self._reset()
+
+    def _reset(self):
+        self._first = self._last = None
+        self._path = ''
+        self._count = 0
+        self._wavelengths: Optional[np.ndarray] = None
+        self._sum: Optional[np.ndarray] = None
+        self._present: Optional[np.ndarray] = None
+
+    def _bin_key(self, frame: int) -> int:
+        if self.binning.by == 'count':
+            return self._seen // self.binning.size
+        if self._origin is None:
+            self._origin = frame
+        return (frame - self._origin) // self.binning.size
+
+    def add(self, frame: int, path: str, wavelengths: np.ndarray, values: np.ndarray) -> Optional[BinnedFrame]:
+        """
+        Add one frame.
+
+        Args:
+            frame: Frame number (``_S####``)
+            path: File of the frame
+            wavelengths: Ascending wavelengths of the frame
+            values: Intensities (NaN where missing)
+
+        Returns:
+            The previous bin when this frame starts a new one, else None
+        """
+        key = self._bin_key(frame)
+        self._seen += 1
+        completed = self.flush() if self._key is not None and key != self._key else None
+        self._key = key
+
+        values = np.asarray(values, dtype=np.float64)
+        present = ~np.isnan(values)
+        if self._wavelengths is None:
+            self._first, self._path, self._wavelengths = frame, path, wavelengths
+            self._sum = np.where(present, values, 0.0)
+            self._present = present.astype(np.int64)
+        else:
+            if not np.array_equal(self._wavelengths, wavelengths):
+                self._merge_axis(wavelengths)
+            columns = np.searchsorted(self._wavelengths, wavelengths)
+            self._sum[columns] += np.where(present, values, 0.0)
+            self._present[columns] += present
+        self._last = frame
+        self._count += 1
+        return completed
+
+    def _merge_axis(self, wavelengths: np.ndarray):
+        # 同一組內波長不同 (罕見): 改用聯集波長
+        axis = np.union1d(self._wavelengths, wavelengths)
+        columns = np.searchsorted(axis, self._wavelengths)
+        total, present = np.zeros(len(axis)), np.zeros(len(axis), dtype=np.int64)
+        total[columns], present[columns] = self._sum, self._present
+        self._wavelengths, self._sum, self._present = axis, total, present
+
+    def flush(self) -> Optional[BinnedFrame]:
+        """Emit the bin in progress (call once after the last frame)."""
+        if self._wavelengths is None:
+            return None
+        with np.errstate(invalid='ignore', divide='ignore'):
+            values = self._sum / self._present
+        values[self._present == 0] = np.nan
+        if self.binning.mode == 'sum':
+            # 缺值以同組平均補足, 無缺值時即為總和
+            values *= self._count
+        binned = BinnedFrame(first_frame=self._first, last_frame=self._last, n_frames=self._count,
+                             path=self._path, wavelengths=self._wavelengths, values=values)
+        self._reset()
+        return binned
@@ -0,0 +1,290 @@
+"""
+Local SQLite catalog of analyzed runs.
+
+Every analysis adds one row per run with its peaks, dissociation bands per
+threshold, activation frames and section stability, so cross-run questions
+("which runs had a 656 nm max above 30k last month") are indexed queries
+instead of opening hundreds of workbooks.
+
+Usage (from the NEW_OESAnalyze directory):
+    python -m model.catalog runs --since 2024-09-01
+    python -m model.catalog peaks 656.3 --min-intensity 30000 --since 2024-09-01
+    python -m model.catalog dissociation 777 --threshold 1000
+    python -m model.catalog show 12
+"""
+import os
+import re
+import sys
+import json
+import sqlite3
+import logging
+import argparse
+from contextlib import closing
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CATALOG_PATH = os.environ.get(
+    'OES_CATALOG', os.path.join(os.path.expanduser('~'), '.oes_analyze', 'run_catalog.sqlite'))
+# 每個 run 保存的最高峰值數量
+CATALOG_PEAKS = 20
+# 查詢波段時允許的誤差 (nm), 不同光譜儀的像素位置略有差異
+DEFAULT_TOLERANCE_NM = 0.5
+_DATE_PATTERN = re.compile(r'(\d{4}-\d{2}-\d{2})')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    analysis TEXT NOT NULL,
+    run_path TEXT NOT NULL,
+    base_name TEXT NOT NULL,
+    run_date TEXT NOT NULL,
+    analyzed_at TEXT NOT NULL,
+    first_frame INTEGER,
+    last_frame INTEGER,
+    detect_wave REAL,
+    activate_frame INTEGER,
+    end_frame INTEGER,
+    output_directory TEXT
+);
+CREATE TABLE IF NOT EXISTS peaks (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    rank INTEGER NOT NULL,
+    wavelength REAL NOT NULL,
+    intensity REAL NOT NULL,
+    frame INTEGER
+);
+CREATE TABLE IF NOT EXISTS dissociation (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    threshold REAL NOT NULL,
+    wavelength REAL NOT NULL,
+    min_value REAL NOT NULL,
+    max_value REAL NOT NULL,
+    difference REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS stability (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    section TEXT NOT NULL,
+    mean REAL,
+    std REAL,
+    stability REAL
+);
+CREATE INDEX IF NOT EXISTS runs_by_date ON runs(run_date);
+CREATE INDEX IF NOT EXISTS runs_by_base_name ON runs(base_name);
+CREATE INDEX IF NOT EXISTS peaks_by_wavelength ON peaks(wavelength, intensity);
+CREATE INDEX IF NOT EXISTS dissociation_by_wavelength ON dissociation(wavelength, threshold);
+CREATE INDEX IF NOT EXISTS stability_by_run ON stability(run_id);
+"""
+
+
+def run_date_of(base_name: str, default: Optional[str] = None) -> str:
+    """Measurement date in a base name such as ``Spectrum_T2024-09-26`` (default: today)."""
+    match = _DATE_PATTERN.search(base_name)
+    if match is not None:
+        return match.group(1)
+    return default or datetime.now().date().isoformat()
+
+
+@dataclass
+class RunSummary:
+    """Per-run summary stored in the catalog by one analysis."""
+    analysis: str
+    run_path: str
+    base_name: str
+    first_frame: Optional[int] = None
+    last_frame: Optional[int] = None
+    detect_wave: Optional[float] = None
+    activation: Tuple[Optional[int], Optional[int]] = (None, None)
+    output_directory: Optional[str] = None
+    # find_peak_points 格式的紀錄, 由高到低
+    peaks: List[dict] = field(default_factory=list)
+    # {門檻: find_significant_differences 的結果}
+    dissociation: Dict[float, Dict] = field(default_factory=dict)
+    # {區段: {'mean', 'std', '穩定度'}}
+    stability: Dict[str, Dict[str, float]] = field(default_factory=dict)
+
+
+class RunCatalog:
+    """
+    SQLite catalog of run summaries.
+
+    Each call opens its own short-lived connection, so the catalog can be
+    used from the GUI thread and from worker threads alike.
+    """
+
+    def __init__(self, path: str = DEFAULT_CATALOG_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self._connect()) as connection:
+            connection.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path)
+        connection.row_factory = sqlite3.Row
+        connection.execute('PRAGMA foreign_keys = ON')
+        return connection
+
+    def add_run(self, summary: RunSummary) -> int:
+        """
+        Store one run summary.
+
+        Args:
+            summary: Summary produced by an analysis
+
+        Returns:
+            Id of the new run row
+        """
+        analyzed_at = datetime.now().isoformat(timespec='seconds')
+        activate_frame, end_frame = summary.activation
+        with closing(self._connect()) as connection, connection:
+            cursor = connection.execute(
+                'INSERT INTO runs (analysis, run_path, base_name, run_date, analyzed_at, first_frame, last_frame, '
+                'detect_wave, activate_frame, end_frame, output_directory) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (summary.analysis, os.path.abspath(summary.run_path), summary.base_name,
+                 run_date_of(summary.base_name, analyzed_at[:10]), analyzed_at, summary.first_frame,
+                 summary.last_frame, summary.detect_wave, activate_frame, end_frame, summary.output_directory))
+            run_id = cursor.lastrowid
+            connection.executemany(
+                'INSERT INTO peaks (run_id, rank, wavelength, intensity, frame) VALUES (?, ?, ?, ?, ?)',
+                [(run_id, rank, peak['波段'], peak['最大值'], int(peak['時間點']))
+                 for rank, peak in enumerate(summary.peaks[:CATALOG_PEAKS], start=1)])
+            connection.executemany(
+                'INSERT INTO dissociation (run_id, threshold, wavelength, min_value, max_value, difference) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                [(run_id, threshold, wavelength, record[0], record[1], record[1] - record[0])
+                 for threshold, differences in summary.dissociation.items()
+                 for wavelength, record in differences.items()])
+            connection.executemany(
+                'INSERT INTO stability (run_id, section, mean, std, stability) VALUES (?, ?, ?, ?, ?)',
+                [(run_id, section, float(stats['mean']), float(stats['std']), float(stats['穩定度']))
+                 for section, stats in summary.stability.items()])
+        logger.info(f"Run {summary.base_name} recorded in catalog as #{run_id}")
+        return run_id
+
+    @staticmethod
+    def _date_filter(since: Optional[str], until: Optional[str]) -> Tuple[str, list]:
+        clauses, params = [], []
+        if since is not None:
+            clauses.append('runs.run_date >= ?')
+            params.append(since)
+        if until is not None:
+            clauses.append('runs.run_date <= ?')
+            params.append(until)
+        return ''.join(f' AND {clause}' for clause in clauses), params
+
+    def _query(self, sql: str, params) -> List[dict]:
+        with closing(self._connect()) as connection:
+            return [dict(row) for row in connection.execute(sql, params)]
+
+    def runs(self, since: Optional[str] = None, until: Optional[str] = None, base_name: Optional[str] = None,
+             limit: int = 100) -> List[dict]:
+        """Recorded runs, newest measurement first (dates as ``YYYY-MM-DD``)."""
+        where, params = self._date_filter(since, until)
+        if base_name is not None:
+            where += ' AND runs.base_name = ?'
+            params.append(base_name)
+        return self._query(f'SELECT * FROM runs WHERE 1 = 1{where} ORDER BY run_date DESC, id DESC LIMIT ?',
+                           params + [limit])
+
+    def runs_with_peak(self, wavelength: float, min_intensity: Optional[float] = None,
+                       since: Optional[str] = None, until: Optional[str] = None,
+                       tolerance: float = DEFAULT_TOLERANCE_NM) -> List[dict]:
+        """
+        Runs whose stored peaks include ``wavelength`` (± tolerance), optionally above an intensity.
+
+        Returns:
+            One record per matching peak with the run's base name, date and path
+        """
+        where, params = self._date_filter(since, until)
+        if min_intensity is not None:
+            where += ' AND peaks.intensity >= ?'
+            params.append(min_intensity)
+        return self._query(
+            'SELECT runs.id AS run_id, runs.base_name, runs.run_date, runs.run_path, peaks.wavelength, '
+            'peaks.intensity, peaks.frame, peaks.rank FROM peaks JOIN runs ON runs.id = peaks.run_id '
+            f'WHERE peaks.wavelength BETWEEN ? AND ?{where} ORDER BY peaks.intensity DESC',
+            [wavelength - tolerance, wavelength + tolerance] + params)
+
+    def dissociation_runs(self, wavelength: float, threshold: Optional[float] = None,
+                          since: Optional[str] = None, until: Optional[str] = None,
+                          tolerance: float = DEFAULT_TOLERANCE_NM) -> List[dict]:
+        """Runs in which ``wavelength`` (± tolerance) dissociated, optionally at one threshold."""
+        where, params = self._date_filter(since, until)
+        if threshold is not None:
+            where += ' AND dissociation.threshold = ?'
+            params.append(threshold)
+        return self._query(
+            'SELECT runs.id AS run_id, runs.base_name, runs.run_date, runs.run_path, dissociation.threshold, '
+            'dissociation.wavelength, dissociation.min_value, dissociation.max_value, dissociation.difference '
+            'FROM dissociation JOIN runs ON runs.id = dissociation.run_id '
+            f'WHERE dissociation.wavelength BETWEEN ? AND ?{where} ORDER BY dissociation.difference DESC',
+            [wavelength - tolerance, wavelength + tolerance] + params)
+
+    def run_details(self, run_id: int) -> Optional[dict]:
+        """Everything stored for one run, or None when the id is unknown."""
+        runs = self._query('SELECT * FROM runs WHERE id = ?', [run_id])
+        if not runs:
+            return None
+        details = runs[0]
+        details['peaks'] = self._query('SELECT rank, wavelength, intensity, frame FROM peaks '
+                                       'WHERE run_id = ? ORDER BY rank', [run_id])
+        details['dissociation'] = self._query('SELECT threshold, wavelength, min_value, max_value, difference '
+                                              'FROM dissociation WHERE run_id = ? ORDER BY threshold, wavelength',
+                                              [run_id])
+        details['stability'] = self._query('SELECT section, mean, std, stability FROM stability '
+                                           'WHERE run_id = ?', [run_id])
+        return details
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--catalog', default=DEFAULT_CATALOG_PATH, help='Catalog file')
+    parser.add_argument('--json', action='store_true', help='Print machine-readable results')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    runs = commands.add_parser('runs', help='List recorded runs')
+    runs.add_argument('--base-name')
+    runs.add_argument('--limit', type=int, default=100)
+    peaks = commands.add_parser('peaks', help='Runs with a peak at a wavelength')
+    peaks.add_argument('wavelength', type=float)
+    peaks.add_argument('--min-intensity', type=float)
+    dissociation = commands.add_parser('dissociation', help='Runs in which a wavelength dissociated')
+    dissociation.add_argument('wavelength', type=float)
+    dissociation.add_argument('--threshold', type=float)
+    for command in (runs, peaks, dissociation):
+        command.add_argument('--since', help='First run date (YYYY-MM-DD)')
+        command.add_argument('--until', help='Last run date (YYYY-MM-DD)')
+    for command in (peaks, dissociation):
+        command.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE_NM)
+    show = commands.add_parser('show', help='Everything stored for one run')
+    show.add_argument('run_id', type=int)
+    args = parser.parse_args(argv)
+
+    catalog = RunCatalog(args.catalog)
+    if args.command == 'runs':
+        rows = catalog.runs(args.since, args.until, args.base_name, args.limit)
+    elif args.command == 'peaks':
+        rows = catalog.runs_with_peak(args.wavelength, args.min_intensity, args.since, args.until, args.tolerance)
+    elif args.command == 'dissociation':
+        rows = catalog.dissociation_runs(args.wavelength, args.threshold, args.since, args.until, args.tolerance)
+    else:
+        details = catalog.run_details(args.run_id)
+        if details is None:
+            print(f"No run #{args.run_id}", file=sys.stderr)
+            return 1
+        print(json.dumps(details, ensure_ascii=False, indent=2))
+        return 0
+
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+    else:
+        for row in rows:
+            print('  '.join(f"{key}={value}" for key, value in row.items()))
+        print(f"{len(rows)} rows")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,381 @@
+import os
+import logging
+from typing import List, Dict, Tuple, Optional, Iterator, Callable
+import numpy as np
+from model.cube import (SpectralCube, FRAME_PATTERN, parse_frame_number, read_spectrum_file,
+                        write_sidecar, load_cube, storage_dtype, to_float, to_storage)
+from model.diagnostics import IngestDiagnostics, MISSING_FILE, EMPTY_FILE
+from model.manifest import RunManifest, peak_point_records, significant_difference_records
+from model.resample import GridResampler
+from model.binning import FrameBinning, BinnedFrame
+from model.async_ingest import AsyncIngest, IngestedSpectrum
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MEMORY_BUDGET_MB = 256
+# 每個區塊在計算時約需要的暫存複本數 (float64 轉換、比較遮罩、讀取緩衝等)
+_WORKING_COPIES = 5
+
+
+def _align_row(resampler: GridResampler, wavelengths: np.ndarray, intensities: np.ndarray) -> np.ndarray:
+    """
+    Place one file's intensities onto the cube's wavelength axis.
+
+    Wavelengths of the axis missing from the file stay NaN; a file from
+    another calibration (wavelengths not on the axis) is interpolated.
+    """
+    axis = resampler.target
+    if np.array_equal(axis, wavelengths):
+        return intensities
+    index = np.clip(np.searchsorted(axis, wavelengths), 0, len(axis) - 1)
+    matched = axis[index] == wavelengths
+    if not matched.all() and len(wavelengths) > 1:
+        return resampler.resample(wavelengths, intensities)[0]
+    row = np.full(len(axis), np.nan)
+    row[index[matched]] = intensities[matched]
+    return row
+
+
+def write_cube_file(file_paths: List[str], output_path: str, min_wavelength: float = 195.0,
+                    dtype=np.float32, diagnostics: Optional[IngestDiagnostics] = None,
+                    status_callback: Optional[Callable[[str], None]] = None,
+                    wavelength_grid: Optional[np.ndarray] = None,
+                    binning: Optional[FrameBinning] = None,
+                    ingest: Optional[AsyncIngest] = None) -> str:
+    """
+    Stream spectrum files into a memory-mapped ``.npy`` cube, one frame at a time.
+
+    Only a single frame is held in memory; missing or empty files are skipped.
+    The wavelength axis is ``wavelength_grid`` or else the first readable
+    file's; files from other calibrations are interpolated onto it.
+
+    Args:
+        file_paths: Spectrum files in frame order
+        output_path: Output path without extension
+        min_wavelength: Wavelengths below this value are dropped
+        dtype: Stored intensity dtype: float32 (default), float64 or int32
+        diagnostics: Collector for missing/empty files (default: a new one)
+        status_callback: Receives one summary per chunk of files (default: the log)
+        wavelength_grid: Optional common wavelength grid of the cube
+        binning: Optional co-adding of consecutive frames; only the bin in
+            progress is held in memory and the sidecar keeps each row's last frame
+        ingest: Optional concurrent reader for high-latency folders; frames
+            are still written in order
+
+    Returns:
+        Path of the written ``.npy`` file
+    """
+    diagnostics = diagnostics or IngestDiagnostics()
+    dtype = storage_dtype(dtype)
+    data_path = output_path + '.npy'
+    axis = None if wavelength_grid is None else np.asarray(wavelength_grid, dtype=np.float64)
+    resampler = None
+    cube = None
+    frames, last_frames = [], []
+    binner = binning.binner() if binning is not None and binning.enabled else None
+    max_rows = len(file_paths)
+    if binner is not None and binning.by == 'count':
+        max_rows = -(-len(file_paths) // binning.size)
+
+    def write_bin(binned: Optional[BinnedFrame]):
+        if binned is not None:
+            cube[len(frames)] = to_storage(binned.values, dtype)
+            frames.append(binned.first_frame)
+            last_frames.append(binned.last_frame)
+
+    def add_spectrum(spectrum: IngestedSpectrum):
+        nonlocal axis, resampler, cube
+        diagnostics.file_done(status_callback)
+        if spectrum.error is not None:
+            diagnostics.record(spectrum.error, spectrum.path, spectrum.detail)
+            return
+        if len(spectrum.wavelengths) == 0:
+            diagnostics.record(EMPTY_FILE, spectrum.path)
+            return
+
+        if cube is None:
+            axis = spectrum.wavelengths if axis is None else axis
+            resampler = GridResampler(axis)
+            cube = np.lib.format.open_memmap(data_path, mode='w+', dtype=dtype,
+                                             shape=(max_rows, len(axis)))
+        row = _align_row(resampler, spectrum.wavelengths, spectrum.intensities)
+        frame = parse_frame_number(spectrum.path)
+        if binner is None:
+            cube[len(frames)] = to_storage(row, dtype)
+            frames.append(frame)
+        else:
+            write_bin(binner.add(frame, spectrum.path, axis, row))
+
+    if ingest is not None:
+        ingest.read(file_paths, add_spectrum, min_wavelength)
+    else:
+        for file_path in file_paths:
+            try:
+                add_spectrum(IngestedSpectrum(file_path, *read_spectrum_file(file_path, min_wavelength)))
+            except FileNotFoundError:
+                add_spectrum(IngestedSpectrum(file_path, np.empty(0), np.empty(0), MISSING_FILE))
+
+    diagnostics.flush(status_callback)
+    if cube is None:
+        raise ValueError("No valid data found in the selected files")
+    if binner is not None:
+        write_bin(binner.flush())
+
+    n_rows = len(frames)
+    if n_rows < max_rows:
+        # 有檔案被跳過時, 以正確列數重寫 (逐區塊複製)
+        trimmed_path = output_path + '.tmp.npy'
+        trimmed = np.lib.format.open_memmap(trimmed_path, mode='w+', dtype=dtype, shape=(n_rows, len(axis)))
+        step = max(1, (64 << 20) // max(1, cube.itemsize * len(axis)))
+        for start in range(0, n_rows, step):
+            stop = min(start + step, n_rows)
+            trimmed[start:stop] = cube[start:stop]
+        trimmed.flush()
+        del cube, trimmed
+        os.replace(trimmed_path, data_path)
+    else:
+        cube.flush()
+        del cube
+
+    base_name = FRAME_PATTERN.match(os.path.basename(file_paths[0])).group('base')
+    write_sidecar(data_path, base_name, (n_rows, len(axis)), dtype, axis, np.array(frames, dtype=np.int64),
+                  np.array(last_frames, dtype=np.int64) if binner is not None else None)
+    logger.info(f"Streamed {n_rows} frames x {len(axis)} wavelengths into {data_path}")
+    return data_path
+
+
+class ChunkedCubeAnalyzer:
+    """
+    Out-of-core analyzer for runs that do not fit in memory.
+
+    Every analysis is a reduction over blocks of frames read from the cube
+    file into a reused buffer, sized so that the working set of one block
+    stays within ``memory_budget_mb``; the peak resident memory does not
+    grow with the size of the cube. Results have the same shape as the corresponding
+    ``OESAnalyzer`` methods so they can be exported the same way.
+    """
+
+    def __init__(self, cube_path: str, memory_budget_mb: float = DEFAULT_MEMORY_BUDGET_MB):
+        """
+        Initialize the chunked analyzer.
+
+        Args:
+            cube_path: Path to a ``.npy`` cube written by ``write_cube_file`` or ``save_cube``
+            memory_budget_mb: Upper bound for the working memory of one block
+        """
+        self.cube: SpectralCube = load_cube(cube_path, mmap=True)
+        self.manifest = RunManifest.from_cube(self.cube)
+        self.memory_budget_mb = memory_budget_mb
+        self._stats: Optional[Dict[str, np.ndarray]] = None
+
+    @property
+    def block_rows(self) -> int:
+        """Number of frames processed per block under the memory budget."""
+        row_bytes = self.cube.n_wavelengths * np.dtype(np.float64).itemsize * _WORKING_COPIES
+        return max(1, int(self.memory_budget_mb * (1 << 20)) // max(1, row_bytes))
+
+    def _iter_rows(self, start: int, end: int, step: int) -> Iterator[Tuple[int, np.ndarray]]:
+        """
+        Iterate over blocks of stored rows, read into one reused buffer.
+
+        The blocks are read from the file instead of sliced from the memory
+        map: pages touched through a map stay resident, so the process would
+        grow to the size of the cube however small the blocks are. A block
+        is only valid until the next one is read.
+        """
+        intensities = self.cube.intensities
+        if not isinstance(intensities, np.memmap) or not intensities.flags.c_contiguous:
+            for offset in range(start, end, step):
+                yield offset, intensities[offset:min(offset + step, end)]
+            return
+
+        buffer = np.empty((min(step, max(end - start, 0)), self.cube.n_wavelengths), dtype=intensities.dtype)
+        row_bytes = buffer.shape[1] * buffer.itemsize
+        with open(intensities.filename, 'rb') as file:
+            for offset in range(start, end, step):
+                block = buffer[:min(step, end - offset)]
+                file.seek(intensities.offset + offset * row_bytes)
+                if file.readinto(block) != block.nbytes:
+                    raise IOError(f"Cube file {intensities.filename} is truncated")
+                yield offset, block
+
+    def iter_blocks(self, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[int, np.ndarray]]:
+        """
+        Iterate over frame blocks as float64 arrays.
+
+        Args:
+            start: First row (inclusive)
+            end: Last row (exclusive), default: all rows
+
+        Yields:
+            Tuple of (row offset, block of shape (rows, n_wavelengths)); the
+            block may be reused by the next iteration
+        """
+        end = self.cube.n_frames if end is None else end
+        for offset, block in self._iter_rows(start, end, self.block_rows):
+            yield offset, to_float(block)
+
+    def iter_column(self, wavelength: float, start: int = 0,
+                    end: Optional[int] = None) -> Iterator[Tuple[int, np.ndarray]]:
+        """Iterate over blocks of a single wavelength's time series."""
+        col = self.cube.wavelength_index(wavelength)
+        end = self.cube.n_frames if end is None else end
+        # 單一波長仍需讀取整列; 只保留儲存型別的讀取緩衝 (預算的一半), 列數可比 block_rows 多
+        row_bytes = self.cube.n_wavelengths * self.cube.dtype.itemsize
+        step = max(1, int(self.memory_budget_mb * (1 << 19)) // max(1, row_bytes))
+        for offset, block in self._iter_rows(start, end, step):
+            yield offset, np.array(to_float(block[:, col]))
+
+    def column_stats(self) -> Dict[str, np.ndarray]:
+        """
+        Per-wavelength min, max and first argmin/argmax in a single chunked pass.
+
+        Returns:
+            Dictionary of arrays with keys 'min', 'max', 'argmin', 'argmax'
+        """
+        if self._stats is not None:
+            return self._stats
+
+        n_wavelengths = self.cube.n_wavelengths
+        min_values = np.full(n_wavelengths, np.inf)
+        max_values = np.full(n_wavelengths, -np.inf)
+        argmin = np.zeros(n_wavelengths, dtype=np.int64)
+        argmax = np.zeros(n_wavelengths, dtype=np.int64)
+
+        columns = np.arange(n_wavelengths)
+        for offset, block in self.iter_blocks():
+            missing = np.isnan(block)
+            low = np.where(missing, np.inf, block)
+            block_argmin = low.argmin(axis=0)
+            block_min = low[block_argmin, columns]
+            high = np.where(missing, -np.inf, block)
+            block_argmax = high.argmax(axis=0)
+            block_max = high[block_argmax, columns]
+
+            # 嚴格比較以保留第一次出現的位置
+            lower = block_min < min_values
+            min_values[lower] = block_min[lower]
+            argmin[lower] = block_argmin[lower] + offset
+            higher = block_max > max_values
+            max_values[higher] = block_max[higher]
+            argmax[higher] = block_argmax[higher] + offset
+
+        self._stats = {'min': min_values, 'max': max_values, 'argmin': argmin, 'argmax': argmax}
+        return self._stats
+
+    def file_name(self, row: int) -> str:
+        """Reconstruct the spectrum file name of a cube row."""
+        return self.manifest.file_name(row)
+
+    def envelope(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Max-envelope of the run, as drawn by ``allSpectrum_plot``.
+
+        Returns:
+            Tuple of (wavelengths, max intensities, frame number of each max)
+        """
+        stats = self.column_stats()
+        return self.cube.wavelengths, stats['max'], self.cube.frames[stats['argmax']]
+
+    def find_peak_points(self) -> List[dict]:
+        """Chunked equivalent of ``OESAnalyzer.find_peak_points``."""
+        return peak_point_records(self.cube.wavelengths, self.column_stats(), self.manifest)
+
+    def find_significant_differences(self, threshold: float = 200) -> Dict:
+        """Chunked equivalent of ``OESAnalyzer.find_significant_differences``."""
+        return significant_difference_records(self.cube.wavelengths, self.column_stats(), self.manifest, threshold)
+
+    def find_specific_wavebands_differences(self, wavebands: List[float], threshold: float = 200) -> Dict:
+        """Chunked equivalent of ``OESAnalyzer.find_specific_wavebands_differences``."""
+        return significant_difference_records(self.cube.wavelengths, self.column_stats(), self.manifest,
+                                              threshold, wavebands)
+
+    def detect_activate_time(self, max_wave: float, threshold: float,
+                             start_index: int) -> Tuple[Optional[int], Optional[int]]:
+        """
+        Chunked equivalent of ``OESAnalyzer.detect_activate_time``.
+
+        Frame-to-frame differences are evaluated per block, carrying the last
+        value of the previous block across the boundary. The rows found are
+        mapped to frame numbers through the cube's frame array, so missing
+        files do not shift the result (``start_index`` is accepted for
+        compatibility with ``OESAnalyzer.detect_activate_time``). For binned
+        cubes the end is the last frame co-added into the end row.
+        """
+        frames = self.cube.frames
+        last_frames = frames if self.cube.last_frames is None else self.cube.last_frames
+        activate_time = None
+        previous = None
+        for offset, series in self.iter_column(max_wave):
+            if previous is not None:
+                series = np.concatenate(([previous], series))
+                offset -= 1
+            previous = series[-1]
+            diff = np.diff(series)
+
+            if activate_time is None:
+                rising = np.flatnonzero(diff > threshold)
+                if len(rising) == 0:
+                    continue
+                activate_time = int(frames[int(rising[0]) + 1 + offset])
+                diff = diff[rising[0] + 1:]
+                offset += int(rising[0]) + 1
+
+            falling = np.flatnonzero(diff < -threshold)
+            if len(falling):
+                return activate_time, int(last_frames[int(falling[0]) + 1 + offset])
+
+        return activate_time, None
+
+    def frame_rows(self, start_frame: int, end_frame: int) -> Tuple[int, int]:
+        """Map an inclusive frame-number range to a [start, end) row range."""
+        frames = self.cube.frames
+        return int(np.searchsorted(frames, start_frame)), int(np.searchsorted(frames, end_frame, side='right'))
+
+    def analyze_sections(self, wavelength: float, section: int, start_row: int = 0,
+                         end_row: Optional[int] = None) -> Dict[str, Dict[str, float]]:
+        """
+        Chunked equivalent of ``OESAnalyzer.analyze_sections`` for one wavelength.
+
+        Mean and standard deviation are accumulated per section in float64 and
+        merged across blocks (Chan et al. pairwise update).
+        """
+        end_row = self.cube.n_frames if end_row is None else end_row
+        length = end_row - start_row
+        if length <= 0:
+            raise ValueError("Empty frame range for section analysis")
+        if length < section:
+            raise ValueError(f"Frame range holds {length} rows, fewer than the {section} sections")
+        section_size = length // section
+        bounds = [start_row + i * section_size for i in range(section)] + [end_row]
+
+        # [count, mean, M2] per section
+        accumulators = [[0, 0.0, 0.0] for _ in range(section)]
+        for offset, series in self.iter_column(wavelength, start_row, end_row):
+            for i in range(section):
+                lo, hi = max(bounds[i], offset), min(bounds[i + 1], offset + len(series))
+                if lo >= hi:
+                    continue
+                part = series[lo - offset:hi - offset]
+                n_b, mean_b = len(part), part.mean()
+                m2_b = np.square(part - mean_b).sum()
+                n_a, mean_a, m2_a = accumulators[i]
+                n = n_a + n_b
+                delta = mean_b - mean_a
+                accumulators[i] = [n, mean_a + delta * n_b / n, m2_a + m2_b + delta ** 2 * n_a * n_b / n]
+
+        sectioned_data = {}
+        for i, (n, mean, m2) in enumerate(accumulators):
+            std = np.sqrt(m2 / n)
+            sectioned_data[f'區段{i+1}'] = {'mean': mean, 'std': std, '穩定度': round((std / mean) * 100, 3)}
+
+        total_n = sum(a[0] for a in accumulators)
+        total_mean = sum(a[0] * a[1] for a in accumulators) / total_n
+        total_m2 = sum(a[2] + a[0] * (a[1] - total_mean) ** 2 for a in accumulators)
+        total_std = np.sqrt(total_m2 / total_n)
+        sectioned_data['總區段'] = {
+            'mean': total_mean,
+            'std': total_std,
+            '穩定度': round((total_std / total_mean) * 100, 3)
+        }
+        return sectioned_data
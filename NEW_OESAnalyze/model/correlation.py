@@ -0,0 +1,75 @@
+import logging
+from typing import Dict, List, Sequence, Tuple
+import numpy as np
+from model.cube import to_float
+
+logger = logging.getLogger(__name__)
+
+
+def correlation_matrix(intensities: np.ndarray, dtype=np.float64) -> np.ndarray:
+    """
+    Pearson correlation between all columns, as one matrix multiply.
+
+    Columns are centered and scaled to unit norm, so the correlation matrix
+    is ``Z.T @ Z`` (one BLAS call). Missing values are replaced by the
+    column mean, i.e. they do not contribute; constant columns give NaN.
+
+    Args:
+        intensities: Array of shape (n_frames, n_columns), any storage dtype
+        dtype: Compute dtype (float32 halves memory and time)
+
+    Returns:
+        Array of shape (n_columns, n_columns)
+    """
+    values = np.array(to_float(intensities, dtype))
+    missing = np.isnan(values)
+    if missing.any():
+        values[missing] = 0
+        # 全部缺值的欄位平均記為 0 (之後視為常數欄)
+        means = values.sum(axis=0) / np.maximum((~missing).sum(axis=0), 1)
+        values[missing] = np.broadcast_to(means, values.shape)[missing]
+    else:
+        means = values.mean(axis=0)
+    values -= means
+    norms = np.linalg.norm(values, axis=0)
+    constant = norms == 0
+    values /= np.where(constant, 1, norms)
+
+    correlation = values.T @ values
+    correlation[constant, :] = np.nan
+    correlation[:, constant] = np.nan
+    return correlation
+
+
+def top_partners(correlation: np.ndarray, wavelengths: np.ndarray, query_columns: Sequence[int], k: int = 10,
+                 exclude_nm: float = 0.0) -> Dict[float, List[Tuple[float, float]]]:
+    """
+    The ``k`` most correlated wavelengths of every query column.
+
+    Args:
+        correlation: Correlation matrix of the columns
+        wavelengths: Wavelength of every column
+        query_columns: Columns to report
+        k: Number of partners per query
+        exclude_nm: Partners closer than this to the query (the same line) are skipped
+
+    Returns:
+        ``{query wavelength: [(partner wavelength, correlation), ...]}``, strongest first
+    """
+    query_columns = np.asarray(query_columns)
+    rows = np.nan_to_num(correlation[query_columns], nan=-np.inf)
+    # 排除自身與同一譜線的相鄰像素
+    rows[np.abs(wavelengths[None, :] - wavelengths[query_columns, None]) <= exclude_nm] = -np.inf
+    rows[np.arange(len(query_columns)), query_columns] = -np.inf
+
+    k = min(k, rows.shape[1])
+    candidates = np.argpartition(-rows, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(-rows, candidates, axis=1).argsort(axis=1, kind='stable')
+    candidates = np.take_along_axis(candidates, order, axis=1)
+
+    partners = {}
+    for i, (query, columns) in enumerate(zip(query_columns, candidates)):
+        partners[float(wavelengths[query])] = [
+            (float(wavelengths[col]), float(correlation[query, col])) for col in columns if np.isfinite(rows[i, col])
+        ]
+    return partners
@@ -0,0 +1,330 @@
+import os
+import re
+import json
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Tuple, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 檔名格式: {base_name}_S0001.txt
+FRAME_PATTERN = re.compile(r'^(?P<base>.+)_S(?P<index>\d+)\.txt$')
+
+# 數據行格式: wavelength;intensity
+_NUMBER = r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?'
+LINE_PATTERN = re.compile(rf'^\s*({_NUMBER})\s*;\s*({_NUMBER})\s*(?:;.*)?$', re.M)
+
+CUBE_FORMAT_VERSION = 1
+CUBE_FORMATS = ('npy', 'parquet')
+
+# 儲存型別: 光譜儀強度為整數計數時可用 int32
+STORAGE_DTYPES = ('float64', 'float32', 'int32')
+# 整數沒有 NaN, 以最小值表示缺值
+INT_MISSING = np.iinfo(np.int32).min
+
+
+def storage_dtype(dtype) -> np.dtype:
+    """Validate a storage dtype ('float64', 'float32' or 'int32')."""
+    dtype = np.dtype(dtype)
+    if dtype.name not in STORAGE_DTYPES:
+        raise ValueError(f"Unsupported storage dtype: {dtype.name} (use one of {', '.join(STORAGE_DTYPES)})")
+    return dtype
+
+
+def missing_value(dtype):
+    """Value that marks a missing measurement in an array of ``dtype``."""
+    return np.nan if np.dtype(dtype).kind == 'f' else INT_MISSING
+
+
+def missing_mask(values: np.ndarray) -> np.ndarray:
+    """True where a stored value is missing."""
+    values = np.asarray(values)
+    return np.isnan(values) if values.dtype.kind == 'f' else values == INT_MISSING
+
+
+def to_float(values, dtype=np.float64) -> np.ndarray:
+    """Stored values as floats with NaN for missing (no copy when already ``dtype``)."""
+    values = np.asarray(values)
+    if values.dtype.kind == 'f':
+        return values.astype(dtype, copy=False)
+    result = values.astype(dtype)
+    result[values == INT_MISSING] = np.nan
+    return result
+
+
+def to_storage(values, dtype) -> np.ndarray:
+    """
+    Convert values to a storage dtype.
+
+    Integer storage rounds to the nearest count and stores missing values
+    (NaN) as ``INT_MISSING``.
+    """
+    dtype = np.dtype(dtype)
+    values = np.asarray(values)
+    if values.dtype == dtype:
+        return values
+    if dtype.kind == 'f':
+        return to_float(values, dtype)
+    values = to_float(values)
+    missing = np.isnan(values)
+    result = np.rint(np.where(missing, 0.0, values)).astype(dtype)
+    result[missing] = INT_MISSING
+    return result
+
+
+def parse_frame_number(file_name: str) -> int:
+    """
+    Parse the frame number from a spectrum file name.
+
+    Args:
+        file_name: File name (or path) such as ``Spectrum_T2024_S0012.txt``
+
+    Returns:
+        Frame number as an integer
+    """
+    match = FRAME_PATTERN.match(os.path.basename(file_name))
+    if match is None:
+        raise ValueError(f"Not a spectrum file name: {file_name}")
+    return int(match.group('index'))
+
+
+def _skipped_lines(text: str, n_data: int) -> List[str]:
+    """Lines holding a ``;`` that are not data lines (headers, malformed values)."""
+    # 分號總數減去數據行數, 即略過的行 (及數據行多餘分號) 的分號數; 用完即停止, 標頭通常在第一行
+    remaining = text.count(';') - n_data
+    skipped, position = [], 0
+    while remaining > 0:
+        index = text.find(';', position)
+        if index < 0:
+            break
+        start = text.rfind('\n', 0, index) + 1
+        end = text.find('\n', index)
+        end = len(text) if end < 0 else end
+        line = text[start:end]
+        if LINE_PATTERN.match(line) is None:
+            skipped.append(line.strip())
+            remaining -= line.count(';')
+        else:
+            remaining -= line.count(';') - 1
+        position = end + 1
+    return skipped
+
+
+def parse_spectrum_text(text: str, min_wavelength: float = 195.0,
+                        skipped: Optional[List[str]] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Parse the ``wavelength;intensity`` lines of one spectrum file.
+
+    Lines that do not hold two numbers (headers, comments) are skipped.
+
+    Args:
+        text: File contents
+        min_wavelength: Wavelengths below this value are dropped
+        skipped: Optional list receiving the skipped lines that contain a ``;``
+            (what the line-by-line readers record as skipped lines)
+
+    Returns:
+        Tuple of (wavelengths, intensities) as float64 arrays
+    """
+    pairs = LINE_PATTERN.findall(text)
+    if skipped is not None:
+        skipped.extend(_skipped_lines(text, len(pairs)))
+    if not pairs:
+        return np.empty(0), np.empty(0)
+    values = np.array(pairs, dtype=np.float64)
+    keep = values[:, 0] >= min_wavelength
+    return values[keep, 0], values[keep, 1]
+
+
+def read_spectrum_file(file_path: str, min_wavelength: float = 195.0) -> Tuple[np.ndarray, np.ndarray]:
+    """Read one spectrum file into (wavelengths, intensities) arrays."""
+    with open(file_path, 'r', encoding='utf-8') as file:
+        return parse_spectrum_text(file.read(), min_wavelength)
+
+
+@dataclass
+class SpectralCube:
+    """
+    Dense time x wavelength intensity array of one run.
+
+    Rows are frames (ordered as they were read), columns are wavelengths
+    in ascending order. Missing measurements are stored as NaN. In a
+    binned cube, row ``i`` co-adds frames ``frames[i]..last_frames[i]``.
+    """
+    wavelengths: np.ndarray
+    frames: np.ndarray
+    intensities: np.ndarray
+    base_name: str = ''
+    last_frames: Optional[np.ndarray] = None
+
+    @property
+    def n_frames(self) -> int:
+        return self.intensities.shape[0]
+
+    @property
+    def n_wavelengths(self) -> int:
+        return self.intensities.shape[1]
+
+    def wavelength_index(self, wavelength: float) -> int:
+        """
+        Find the column of an exact wavelength.
+
+        Args:
+            wavelength: Wavelength in nm
+
+        Returns:
+            Column index in ``intensities``
+        """
+        index = int(np.searchsorted(self.wavelengths, wavelength))
+        if index >= self.n_wavelengths or self.wavelengths[index] != wavelength:
+            raise KeyError(f"Wave length {wavelength} not found in cube")
+        return index
+
+    @property
+    def dtype(self) -> np.dtype:
+        """Storage dtype of the intensities."""
+        return self.intensities.dtype
+
+    def column(self, wavelength: float) -> np.ndarray:
+        """Return the time series of one wavelength (float, NaN where missing)."""
+        return to_float(self.intensities[:, self.wavelength_index(wavelength)])
+
+    @classmethod
+    def from_all_values(cls, all_values: Dict[float, List[Tuple[str, float]]],
+                        base_name: str = '', dtype=np.float64) -> 'SpectralCube':
+        """
+        Build a cube from the ``{wavelength: [(file_name, intensity), ...]}`` mapping.
+
+        Args:
+            all_values: Mapping produced by ``OESAnalyzer.gather_values``
+            base_name: Base name of the run
+            dtype: Storage dtype of the intensity array
+
+        Returns:
+            SpectralCube with one row per file
+        """
+        wavelengths = np.array(sorted(all_values.keys()), dtype=np.float64)
+
+        # 依檔案出現順序建立列索引
+        row_of: Dict[str, int] = {}
+        for measurements in all_values.values():
+            for file_name, _ in measurements:
+                if file_name not in row_of:
+                    row_of[file_name] = len(row_of)
+
+        intensities = np.full((len(row_of), len(wavelengths)), missing_value(dtype), dtype=dtype)
+        for col, wavelength in enumerate(wavelengths):
+            measurements = all_values[wavelength]
+            rows = [row_of[file_name] for file_name, _ in measurements]
+            intensities[rows, col] = to_storage([m[1] for m in measurements], dtype)
+
+        frames = np.array([parse_frame_number(name) for name in row_of], dtype=np.int64)
+        if not base_name and row_of:
+            base_name = FRAME_PATTERN.match(next(iter(row_of))).group('base')
+
+        return cls(wavelengths=wavelengths, frames=frames, intensities=intensities, base_name=base_name)
+
+
+def _sidecar_path(npy_path: str) -> str:
+    return os.path.splitext(npy_path)[0] + '.json'
+
+
+def write_sidecar(data_path: str, base_name: str, shape, dtype,
+                  wavelengths: np.ndarray, frames: np.ndarray,
+                  last_frames: Optional[np.ndarray] = None) -> str:
+    """Write the JSON sidecar (axes and metadata) of a ``.npy`` cube."""
+    sidecar = {
+        'format_version': CUBE_FORMAT_VERSION,
+        'base_name': base_name,
+        'shape': list(shape),
+        'dtype': np.dtype(dtype).str,
+        'wavelengths': np.asarray(wavelengths).tolist(),
+        'frames': np.asarray(frames).tolist(),
+    }
+    if last_frames is not None:
+        sidecar['last_frames'] = np.asarray(last_frames).tolist()
+    sidecar_path = _sidecar_path(data_path)
+    with open(sidecar_path, 'w', encoding='utf-8') as file:
+        json.dump(sidecar, file, ensure_ascii=False)
+    return sidecar_path
+
+
+def save_cube(cube: SpectralCube, path: str, fmt: str = 'npy', dtype=None) -> str:
+    """
+    Export a cube to a columnar file.
+
+    ``npy``: the intensity array is written as a C-ordered ``.npy`` file that can
+    be memory-mapped, with a ``.json`` sidecar holding the wavelength axis and
+    frame indices. ``parquet``: one float column per wavelength plus a ``frame``
+    column (requires pyarrow or fastparquet).
+
+    Args:
+        cube: Cube to export
+        path: Output path without extension
+        fmt: 'npy' or 'parquet'
+        dtype: Stored intensity dtype (default: float32 for float cubes, the
+            cube's own dtype for integer cubes)
+
+    Returns:
+        Path of the written data file
+    """
+    if fmt not in CUBE_FORMATS:
+        raise ValueError(f"Unsupported cube format: {fmt}")
+
+    if dtype is None:
+        dtype = np.float32 if cube.dtype.kind == 'f' else cube.dtype
+    data = np.ascontiguousarray(to_storage(cube.intensities, storage_dtype(dtype)))
+
+    if fmt == 'npy':
+        data_path = path + '.npy'
+        np.save(data_path, data)
+        write_sidecar(data_path, cube.base_name, data.shape, data.dtype, cube.wavelengths, cube.frames,
+                      cube.last_frames)
+    else:
+        import pandas as pd
+        data_path = path + '.parquet'
+        # parquet 以 NaN 表示缺值
+        data = to_float(data, np.float64 if data.dtype.kind == 'i' else data.dtype)
+        columns = {repr(float(w)): data[:, i] for i, w in enumerate(cube.wavelengths)}
+        df = pd.DataFrame(columns)
+        df.insert(0, 'frame', cube.frames)
+        df.attrs['base_name'] = cube.base_name
+        try:
+            df.to_parquet(data_path, index=False)
+        except ImportError as e:
+            raise ImportError("Parquet export requires pyarrow or fastparquet") from e
+
+    logger.info(f"Exported cube {data.shape} to {data_path}")
+    return data_path
+
+
+def load_cube(path: str, mmap: bool = True) -> SpectralCube:
+    """
+    Load a cube written by ``save_cube``.
+
+    Args:
+        path: Path to the ``.npy`` or ``.parquet`` file
+        mmap: Memory-map ``.npy`` data instead of reading it (default: True)
+
+    Returns:
+        SpectralCube (intensities are read-only when memory-mapped)
+    """
+    if path.endswith('.parquet'):
+        import pandas as pd
+        df = pd.read_parquet(path)
+        frames = df.pop('frame').to_numpy(dtype=np.int64)
+        wavelengths = np.array([float(c) for c in df.columns], dtype=np.float64)
+        return SpectralCube(wavelengths=wavelengths, frames=frames,
+                            intensities=df.to_numpy(), base_name=df.attrs.get('base_name', ''))
+
+    with open(_sidecar_path(path), 'r', encoding='utf-8') as file:
+        sidecar = json.load(file)
+    intensities = np.load(path, mmap_mode='r' if mmap else None)
+    return SpectralCube(
+        wavelengths=np.array(sidecar['wavelengths'], dtype=np.float64),
+        frames=np.array(sidecar['frames'], dtype=np.int64),
+        intensities=intensities,
+        base_name=sidecar.get('base_name', ''),
+        last_frames=np.array(sidecar['last_frames'], dtype=np.int64) if 'last_frames' in sidecar else None,
+    )
@@ -0,0 +1,165 @@
+import logging
+from dataclasses import dataclass, field
+from typing import Optional, Tuple
+import numpy as np
+from model.cube import SpectralCube, to_float
+from model.manifest import RunManifest
+from model.resample import GridResampler
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COMPONENTS = 5
+# 重建誤差超過 中位數 + FLAG_SIGMA x 穩健標準差 的幀視為異常
+DEFAULT_FLAG_SIGMA = 5.0
+_MAD_TO_SIGMA = 1.4826
+
+
+def randomized_svd(matrix: np.ndarray, n_components: int, oversample: int = 10, n_iter: int = 4,
+                   seed: int = 0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Truncated SVD by random projection (Halko, Martinsson & Tropp).
+
+    The matrix is only touched by a few products with thin matrices, so the
+    cost is O(n_frames x n_wavelengths x (n_components + oversample)).
+
+    Args:
+        matrix: Array of shape (n_rows, n_columns)
+        n_components: Number of singular triplets to return
+        oversample: Extra random directions for accuracy
+        n_iter: Power iterations (sharpen the spectrum of slowly decaying matrices)
+        seed: Seed of the random projection (results are reproducible)
+
+    Returns:
+        Tuple of (U, singular values, Vt) truncated to ``n_components``
+    """
+    rank = min(n_components + oversample, *matrix.shape)
+    rng = np.random.default_rng(seed)
+    sample = matrix @ rng.standard_normal((matrix.shape[1], rank)).astype(matrix.dtype)
+    basis, _ = np.linalg.qr(sample)
+    for _ in range(n_iter):
+        # 每次乘法後重新正交化以維持數值穩定
+        basis, _ = np.linalg.qr(matrix.T @ basis)
+        basis, _ = np.linalg.qr(matrix @ basis)
+    u_small, singular_values, vt = np.linalg.svd(basis.T @ matrix, full_matrices=False)
+    u = basis @ u_small
+    return u[:, :n_components], singular_values[:n_components], vt[:n_components]
+
+
+@dataclass
+class Screening:
+    """Projection of one run onto reference components."""
+    manifest: RunManifest
+    scores: np.ndarray
+    errors: np.ndarray
+    threshold: float
+
+    @property
+    def flagged(self) -> np.ndarray:
+        """True for frames whose reconstruction error exceeds the threshold."""
+        return self.errors > self.threshold
+
+    def flagged_frames(self) -> np.ndarray:
+        return self.manifest.frames[self.flagged]
+
+
+@dataclass
+class SpectralComponents:
+    """
+    Principal components of a reference run.
+
+    ``components[j]`` is the spectrum of component ``j`` (unit norm);
+    ``error_threshold`` is the reconstruction error above which a frame is
+    flagged, derived from the reference run itself.
+    """
+    wavelengths: np.ndarray
+    mean: np.ndarray
+    components: np.ndarray
+    singular_values: np.ndarray
+    explained_variance_ratio: np.ndarray
+    error_threshold: float
+    _resampler: Optional[GridResampler] = field(default=None, repr=False, compare=False)
+
+    @classmethod
+    def fit(cls, cube: SpectralCube, n_components: int = DEFAULT_COMPONENTS,
+            rows: Optional[np.ndarray] = None,
+            flag_sigma: float = DEFAULT_FLAG_SIGMA) -> 'SpectralComponents':
+        """
+        Decompose a cube with a randomized truncated SVD.
+
+        Args:
+            cube: Reference run
+            n_components: Number of components to keep
+            rows: Optional mask or indices of the frames to fit on
+            flag_sigma: Flag threshold, in robust standard deviations above the
+                median reconstruction error of the reference frames
+
+        Returns:
+            SpectralComponents of the run
+        """
+        intensities = cube.intensities if rows is None else cube.intensities[rows]
+        dtype = np.float32 if intensities.dtype.itemsize <= 4 else np.float64
+        centered = np.array(to_float(intensities, dtype))
+        missing = np.isnan(centered)
+        centered[missing] = 0
+        mean = centered.sum(axis=0) / np.maximum((~missing).sum(axis=0), 1)
+        centered -= mean
+        centered[missing] = 0
+
+        _, singular_values, components = randomized_svd(centered, n_components)
+        total = float(np.einsum('ij,ij->', centered, centered, dtype=np.float64))
+        explained = singular_values.astype(np.float64) ** 2 / total if total > 0 else np.zeros(len(singular_values))
+
+        fitted = cls(wavelengths=cube.wavelengths.copy(), mean=mean, components=components,
+                     singular_values=singular_values, explained_variance_ratio=explained,
+                     error_threshold=np.inf)
+        errors = fitted._errors(centered, centered @ components.T)
+        median = float(np.median(errors))
+        fitted.error_threshold = median + flag_sigma * _MAD_TO_SIGMA * float(np.median(np.abs(errors - median)))
+        logger.info(f"{n_components} components explain {explained.sum():.1%} of the variance")
+        return fitted
+
+    @staticmethod
+    def _errors(centered: np.ndarray, scores: np.ndarray) -> np.ndarray:
+        # 成分為單位正交, 殘差平方和 = 總平方和 - 分數平方和, 不需重建整個立方體
+        residual = (np.einsum('ij,ij->i', centered, centered, dtype=np.float64)
+                    - np.einsum('ij,ij->i', scores, scores, dtype=np.float64))
+        return np.sqrt(np.maximum(residual, 0))
+
+    def screen(self, cube: SpectralCube, manifest: Optional[RunManifest] = None) -> Screening:
+        """
+        Project a run onto the components: scores are one matrix multiply.
+
+        Args:
+            cube: Run to screen; a run on another wavelength grid (another
+                spectrometer or calibration) is interpolated onto the reference grid
+            manifest: Manifest of the cube rows (default: built from the cube)
+
+        Returns:
+            Screening with per-frame scores, reconstruction errors and flags
+        """
+        if cube.wavelengths.shape != self.wavelengths.shape or not np.allclose(cube.wavelengths, self.wavelengths):
+            if self._resampler is None:
+                self._resampler = GridResampler(self.wavelengths)
+            cube = self._resampler.resample_cube(cube)
+        centered = np.array(to_float(cube.intensities, self.components.dtype))
+        centered -= self.mean
+        # 缺值以參考平均取代, 即對分數與誤差無貢獻
+        centered[np.isnan(centered)] = 0
+        scores = centered @ self.components.T
+        return Screening(manifest=manifest or RunManifest.from_cube(cube), scores=scores,
+                         errors=self._errors(centered, scores), threshold=self.error_threshold)
+
+    def save(self, path: str) -> str:
+        """Save the components (e.g. of a reference run) as ``.npz``."""
+        np.savez(path, wavelengths=self.wavelengths, mean=self.mean, components=self.components,
+                 singular_values=self.singular_values, explained_variance_ratio=self.explained_variance_ratio,
+                 error_threshold=self.error_threshold)
+        return path if path.endswith('.npz') else path + '.npz'
+
+    @classmethod
+    def load(cls, path: str) -> 'SpectralComponents':
+        with np.load(path) as data:
+            return cls(wavelengths=data['wavelengths'], mean=data['mean'], components=data['components'],
+                       singular_values=data['singular_values'],
+                       explained_variance_ratio=data['explained_variance_ratio'],
+                       error_threshold=float(data['error_threshold']))
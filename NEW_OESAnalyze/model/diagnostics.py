@@ -0,0 +1,88 @@
+import os
+import logging
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 每讀取這麼多檔案回報一次彙總
+INGEST_CHUNK_FILES = 200
+
+SKIPPED_LINE = 'skipped_line'
+MISSING_FILE = 'missing_file'
+EMPTY_FILE = 'empty_file'
+READ_ERROR = 'read_error'
+
+_LABELS = {
+    SKIPPED_LINE: '略過無效行',
+    MISSING_FILE: '找不到檔案',
+    EMPTY_FILE: '無有效數據檔案',
+    READ_ERROR: '讀取錯誤',
+}
+
+
+class IngestDiagnostics:
+    """
+    Counts ingest problems instead of reporting every one of them.
+
+    Problems are counted per category with a bounded number of examples.
+    ``flush`` sends one aggregated summary of everything recorded since the
+    previous flush to a status callback; callers flush once per chunk of
+    files, so a run with thousands of header lines produces a handful of
+    messages instead of thousands. ``totals`` keeps the counts of the whole
+    run.
+    """
+
+    def __init__(self, max_samples: int = 3, chunk_files: int = INGEST_CHUNK_FILES):
+        self.max_samples = max_samples
+        self.chunk_files = chunk_files
+        self.totals: Counter = Counter()
+        self.counts: Counter = Counter()
+        self.samples: Dict[str, List[str]] = {}
+        self.files = 0
+
+    def record(self, category: str, file_path: str, detail: str = '') -> None:
+        """Count one problem and keep it as an example while there is room."""
+        self.counts[category] += 1
+        self.totals[category] += 1
+        samples = self.samples.setdefault(category, [])
+        if len(samples) < self.max_samples:
+            name = os.path.basename(file_path)
+            samples.append(f'{name}: {detail}' if detail else name)
+
+    def file_done(self, callback: Optional[Callable[[str], None]] = None) -> None:
+        """Mark one file as read; flushes when a chunk of files is complete."""
+        self.files += 1
+        if self.files >= self.chunk_files:
+            self.flush(callback)
+
+    def summary(self) -> str:
+        """One-line summary of the problems recorded since the last flush."""
+        parts = []
+        for category, count in self.counts.items():
+            examples = '; '.join(self.samples.get(category, []))
+            parts.append(f'{_LABELS.get(category, category)} {count} (例: {examples})')
+        return f'已讀取 {self.files} 個檔案, ' + ', '.join(parts)
+
+    def flush(self, callback: Optional[Callable[[str], None]] = None) -> Optional[str]:
+        """
+        Send the summary of the current chunk and start a new chunk.
+
+        Args:
+            callback: Status sink (default: ``logger.info``)
+
+        Returns:
+            The summary, or None when the chunk had no problems
+        """
+        message = self.summary() if self.counts else None
+        if message is not None:
+            (callback or logger.info)(message)
+        self.counts = Counter()
+        self.samples = {}
+        self.files = 0
+        return message
+
+    def reset(self) -> None:
+        """Forget everything, including the run totals."""
+        self.totals = Counter()
+        self.flush(lambda message: None)
@@ -0,0 +1,243 @@
+import os
+import json
+import logging
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from model.cube import SpectralCube, missing_mask
+from model.manifest import column_extrema
+from model.changepoint import detect_change_points
+from model.resample import GridResampler
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_DIRECTORY = os.environ.get(
+    'OES_FINGERPRINTS', os.path.join(os.path.expanduser('~'), '.oes_analyze', 'fingerprints'))
+# 指紋的標準波長網格 (nm)
+CANONICAL_GRID = np.arange(200.0, 800.0, 1.0)
+# 純量特徵相對於 (單位長度) 包絡光譜形狀的權重
+SCALAR_WEIGHT = 0.1
+SCALAR_FEATURES = ('log_peak', 'activate_fraction', 'active_fraction')
+FINGERPRINT_SIZE = len(CANONICAL_GRID) + len(SCALAR_FEATURES)
+METRICS = ('cosine', 'euclidean')
+# 內插權重依光譜儀校正快取, 大量指紋只計算一次
+_CANONICAL = GridResampler(CANONICAL_GRID)
+
+_VECTORS_FILE = 'vectors.f32'
+_RUNS_FILE = 'runs.jsonl'
+_HEADER_FILE = 'index.json'
+# 計算範數時每次讀取的列數
+_NORM_BLOCK_ROWS = 8192
+
+
+def run_fingerprint(cube: SpectralCube, envelope: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Fixed-length fingerprint of a run.
+
+    The max-envelope spectrum resampled to ``CANONICAL_GRID`` and scaled to
+    unit length (the shape of the run), followed by weighted scalar features:
+    log10 of the highest peak, and the activation start and active duration
+    as fractions of the run, found by change-point detection on the total
+    intensity per frame.
+
+    Args:
+        cube: Run to fingerprint
+        envelope: Max intensity per wavelength, when already computed
+
+    Returns:
+        float32 vector of length ``FINGERPRINT_SIZE``
+    """
+    if envelope is None:
+        envelope = column_extrema(cube.intensities)['max']
+    envelope = np.where(np.isfinite(envelope), envelope, 0.0)
+    shape = np.nan_to_num(_CANONICAL.resample(cube.wavelengths, envelope)[0], nan=0.0)
+    norm = np.linalg.norm(shape)
+    if norm > 0:
+        shape /= norm
+
+    intensities = cube.intensities
+    total = np.where(missing_mask(intensities), 0, intensities).sum(axis=1, dtype=np.float64)
+    points = detect_change_points(total)
+    n_frames = max(len(total), 1)
+    start, end = int(points.activate_rows[0]), int(points.end_rows[0])
+    activate_fraction = start / n_frames if start >= 0 else 0.0
+    active_fraction = ((end if end >= 0 else n_frames) - start) / n_frames if start >= 0 else 0.0
+    log_peak = np.log10(max(float(envelope.max(initial=0.0)), 1.0)) / 5
+
+    scalars = SCALAR_WEIGHT * np.array([log_peak, activate_fraction, active_fraction])
+    return np.concatenate([shape, scalars]).astype(np.float32)
+
+
+class FingerprintIndex:
+    """
+    Append-only, array-backed index of run fingerprints.
+
+    Vectors are appended to one raw float32 file and run metadata to a JSON
+    lines file, so adding a run costs one small write. Opening the index
+    only counts the stored runs: the vector file is memory-mapped, rows
+    added since then are kept in an in-memory tail, and the metadata and
+    norms are read on the first query. Queries compare a batch of
+    fingerprints with all stored runs in one matrix multiply.
+    """
+
+    def __init__(self, directory: str = DEFAULT_INDEX_DIRECTORY, dimension: int = FINGERPRINT_SIZE):
+        self.directory = directory
+        self.dimension = dimension
+        os.makedirs(directory, exist_ok=True)
+        header_path = os.path.join(directory, _HEADER_FILE)
+        if os.path.exists(header_path):
+            with open(header_path, encoding='utf-8') as f:
+                stored = json.load(f)['dimension']
+            if stored != dimension:
+                raise ValueError(f"Index {directory} holds {stored}-d fingerprints, expected {dimension}")
+        else:
+            with open(header_path, 'w', encoding='utf-8') as f:
+                json.dump({'dimension': dimension}, f)
+        self._vectors_path = os.path.join(directory, _VECTORS_FILE)
+        self._runs_path = os.path.join(directory, _RUNS_FILE)
+        self._n_stored = self._repair()
+        self._stored: Optional[np.ndarray] = None
+        self._tail: List[np.ndarray] = []
+        self._runs: Optional[List[Dict]] = None
+        self._added_runs: List[Dict] = []
+        self._norms: Optional[np.ndarray] = None
+
+    def _repair(self) -> int:
+        """Number of complete runs; a write cut short (crash) is truncated away."""
+        vector_bytes = self.dimension * 4
+        vectors_size = os.path.getsize(self._vectors_path) if os.path.exists(self._vectors_path) else 0
+        run_ends = np.empty(0, dtype=np.int64)
+        if os.path.exists(self._runs_path):
+            with open(self._runs_path, 'rb') as f:
+                contents = np.frombuffer(f.read(), dtype=np.uint8)
+            run_ends = np.flatnonzero(contents == ord('\n')) + 1
+        count = min(vectors_size // vector_bytes, len(run_ends))
+        # 只保留向量與紀錄都完整寫入的部分
+        if vectors_size != count * vector_bytes:
+            os.truncate(self._vectors_path, count * vector_bytes)
+        runs_size = int(run_ends[count - 1]) if count else 0
+        if os.path.exists(self._runs_path) and len(contents) != runs_size:
+            os.truncate(self._runs_path, runs_size)
+        return count
+
+    def __len__(self) -> int:
+        return self._n_stored + len(self._tail)
+
+    def _stored_vectors(self) -> np.ndarray:
+        """Memory map of the runs stored when the index was opened (read-only)."""
+        if self._stored is None:
+            if self._n_stored == 0:
+                self._stored = np.empty((0, self.dimension), dtype=np.float32)
+            else:
+                self._stored = np.memmap(self._vectors_path, dtype=np.float32, mode='r',
+                                         shape=(self._n_stored, self.dimension))
+        return self._stored
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """All fingerprints (a copy when runs were added since opening)."""
+        if not self._tail:
+            return self._stored_vectors()
+        return np.concatenate([self._stored_vectors(), np.array(self._tail)])
+
+    @property
+    def runs(self) -> List[Dict]:
+        """Run metadata, in index order (read on first access)."""
+        if self._runs is None:
+            self._runs = []
+            if self._n_stored:
+                with open(self._runs_path, encoding='utf-8') as f:
+                    self._runs = [json.loads(line) for _, line in zip(range(self._n_stored), f)]
+        return self._runs + self._added_runs
+
+    def _blocks(self) -> List[np.ndarray]:
+        blocks = [self._stored_vectors()]
+        if self._tail:
+            blocks.append(np.array(self._tail))
+        return blocks
+
+    def norms(self) -> np.ndarray:
+        """Vector norms, computed on the first query and extended on every add."""
+        if self._norms is None:
+            stored = self._stored_vectors()
+            norms = np.empty(len(stored), dtype=np.float32)
+            # 分段讀取映射的檔案, 暫存記憶體不隨索引大小成長
+            for start in range(0, len(stored), _NORM_BLOCK_ROWS):
+                block = stored[start:start + _NORM_BLOCK_ROWS]
+                norms[start:start + len(block)] = np.sqrt(np.einsum('ij,ij->i', block, block))
+            self._norms = np.concatenate([norms, np.linalg.norm(np.array(self._tail), axis=1)]) \
+                if self._tail else norms
+        return self._norms
+
+    def add(self, fingerprint: np.ndarray, **metadata) -> int:
+        """
+        Append one run.
+
+        Args:
+            fingerprint: Vector from ``run_fingerprint``
+            **metadata: JSON-serializable run description (path, base name, catalog id...)
+
+        Returns:
+            Position of the run in the index
+        """
+        fingerprint = np.asarray(fingerprint, dtype=np.float32).reshape(self.dimension)
+        position = len(self)
+        with open(self._vectors_path, 'ab') as f:
+            f.write(fingerprint.tobytes())
+        with open(self._runs_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(metadata, ensure_ascii=False) + '\n')
+        self._tail.append(fingerprint)
+        self._added_runs.append(metadata)
+        if self._norms is not None:
+            self._norms = np.append(self._norms, np.float32(np.linalg.norm(fingerprint)))
+        return position
+
+    def distances(self, queries: np.ndarray, metric: str = 'cosine') -> np.ndarray:
+        """
+        Distances between a batch of fingerprints and every stored run.
+
+        Args:
+            queries: Array of shape (n_queries, dimension)
+            metric: 'cosine' (1 - cosine similarity) or 'euclidean'
+
+        Returns:
+            Array of shape (n_queries, n_runs)
+        """
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric: {metric}")
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        norms = self.norms()
+        query_norms = np.linalg.norm(queries, axis=1)
+        products = np.concatenate([queries @ block.T for block in self._blocks()], axis=1)
+        if metric == 'cosine':
+            scale = np.maximum(query_norms[:, None] * norms[None, :], np.finfo(np.float32).tiny)
+            return 1 - products / scale
+        squared = query_norms[:, None] ** 2 + norms[None, :] ** 2 - 2 * products
+        return np.sqrt(np.maximum(squared, 0))
+
+    def search(self, queries: np.ndarray, k: int = 5, metric: str = 'cosine',
+               exclude: Optional[int] = None) -> List[List[Tuple[Dict, float]]]:
+        """
+        The ``k`` nearest stored runs of every query fingerprint.
+
+        Args:
+            queries: One fingerprint or an array of shape (n_queries, dimension)
+            k: Number of neighbors
+            metric: 'cosine' or 'euclidean'
+            exclude: Index position to leave out (e.g. the query run itself)
+
+        Returns:
+            Per query, a list of (run metadata, distance), nearest first
+        """
+        if len(self) == 0:
+            return [[] for _ in np.atleast_2d(queries)]
+        distances = self.distances(queries, metric)
+        if exclude is not None:
+            distances[:, exclude] = np.inf
+        k = min(k, len(self) - (exclude is not None))
+        if k <= 0:
+            return [[] for _ in distances]
+        nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        order = np.take_along_axis(distances, nearest, axis=1).argsort(axis=1, kind='stable')
+        nearest = np.take_along_axis(nearest, order, axis=1)
+        runs = self.runs
+        return [[(runs[i], float(row[i])) for i in columns] for row, columns in zip(distances, nearest)]
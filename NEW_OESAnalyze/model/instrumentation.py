@@ -0,0 +1,177 @@
+import os
+import json
+import time
+import logging
+import functools
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from typing import Callable, Dict, Iterable, List, Optional
+
+try:
+    import resource  # 僅 POSIX 提供
+except ImportError:
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+
+def _peak_rss_bytes() -> Optional[int]:
+    """Peak resident set size of the process so far, if the platform reports it."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 回報, macOS 以 bytes 回報
+    return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+
+def file_sizes(paths: Iterable[str]) -> int:
+    """Total size in bytes of the existing files among ``paths``."""
+    total = 0
+    for path in paths:
+        try:
+            total += os.path.getsize(path)
+        except OSError:
+            continue
+    return total
+
+
+@dataclass
+class StageSpan:
+    """Timing and resource usage of one pipeline stage."""
+    name: str
+    started_at: float
+    depth: int = 0
+    wall_s: float = 0.0
+    cpu_s: float = 0.0
+    files: int = 0
+    bytes: int = 0
+    peak_traced_bytes: Optional[int] = None
+    peak_rss_bytes: Optional[int] = None
+    status: str = 'running'
+    error: Optional[str] = None
+    extra: Dict[str, float] = field(default_factory=dict)
+
+    def add(self, files: int = 0, bytes: int = 0, **extra) -> None:
+        """Account processed files/bytes (and any other counters) to this span."""
+        self.files += files
+        self.bytes += bytes
+        for key, value in extra.items():
+            self.extra[key] = self.extra.get(key, 0) + value
+
+
+class PipelineProfiler:
+    """
+    Collects StageSpans for the stages of one analysis run.
+
+    Spans record wall time, CPU time, files and bytes processed and peak
+    memory. Python-level peak allocations (which include NumPy arrays) are
+    tracked with tracemalloc when ``trace_memory`` is enabled; the process
+    peak RSS is recorded where the platform provides it. Listeners are
+    called with each finished span, e.g. to stream progress to the GUI.
+    """
+
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.run_label = ''
+        self.run_started_at = time.time()
+        self.spans: List[StageSpan] = []
+        self._stack: List[StageSpan] = []
+        self._listeners: List[Callable[[StageSpan], None]] = []
+
+    def add_listener(self, listener: Callable[[StageSpan], None]) -> None:
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[StageSpan], None]) -> None:
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def begin_run(self, label: str = '') -> None:
+        """Start a new run; spans of the previous run are discarded."""
+        self.run_label = label
+        self.run_started_at = time.time()
+        self.spans = []
+
+    @property
+    def current(self) -> Optional[StageSpan]:
+        """The innermost running span, if any."""
+        return self._stack[-1] if self._stack else None
+
+    @contextmanager
+    def span(self, name: str):
+        """
+        Measure a stage.
+
+        Usage:
+            with profiler.span('load_and_process_data') as span:
+                span.add(files=len(paths), bytes=file_sizes(paths))
+        """
+        span = StageSpan(name=name, started_at=time.time(), depth=len(self._stack))
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            if self._stack:
+                # 保留外層目前的峰值, 再重設給內層量測
+                parent = self._stack[-1]
+                parent.peak_traced_bytes = max(parent.peak_traced_bytes or 0, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+
+        self._stack.append(span)
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield span
+            span.status = 'ok'
+        except Exception as e:
+            span.status = 'error'
+            span.error = str(e)
+            raise
+        finally:
+            span.wall_s = time.perf_counter() - wall_start
+            span.cpu_s = time.process_time() - cpu_start
+            if self.trace_memory:
+                span.peak_traced_bytes = max(span.peak_traced_bytes or 0, tracemalloc.get_traced_memory()[1])
+            span.peak_rss_bytes = _peak_rss_bytes()
+            self._stack.pop()
+            if self._stack and span.peak_traced_bytes is not None:
+                parent = self._stack[-1]
+                parent.peak_traced_bytes = max(parent.peak_traced_bytes or 0, span.peak_traced_bytes)
+            self.spans.append(span)
+            self._notify(span)
+
+    def _notify(self, span: StageSpan) -> None:
+        for listener in list(self._listeners):
+            try:
+                listener(span)
+            except Exception as e:
+                logger.error(f"Timing listener failed: {e}")
+
+    def report(self) -> Dict:
+        """JSON-serializable report of the current run."""
+        return {
+            'run': self.run_label,
+            'started_at': self.run_started_at,
+            'spans': [asdict(span) for span in self.spans],
+        }
+
+    def save_report(self, path: str) -> str:
+        """Write the report of the current run as JSON."""
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(self.report(), file, ensure_ascii=False, indent=2)
+        logger.info(f"Timing report saved to {path}")
+        return path
+
+
+def instrumented_stage(name: str):
+    """
+    Decorator that measures a method as a pipeline stage.
+
+    The decorated object must have a ``profiler`` attribute (PipelineProfiler).
+    Inside the method, ``self.profiler.current.add(...)`` accounts files/bytes.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.profiler.span(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,179 @@
+import logging
+from dataclasses import dataclass
+from typing import Optional, Sequence
+import numpy as np
+from model.cube import SpectralCube, to_float
+from model.manifest import RunManifest
+from model.bands import band_edges
+
+logger = logging.getLogger(__name__)
+
+PROFILES = ('gaussian', 'lorentzian')
+QUANTITIES = ('centroid', 'fwhm', 'area', 'amplitude')
+# 在譜線中心 ± DEFAULT_SEARCH_NM 內尋找每幀的峰值像素
+DEFAULT_SEARCH_NM = 1.0
+# 擬合使用的像素數 (以峰值像素為中心, 奇數)
+DEFAULT_FIT_POINTS = 5
+_GAUSSIAN_FWHM = 2 * np.sqrt(2 * np.log(2))
+
+
+def parabola_projection(points: int) -> np.ndarray:
+    """
+    Least-squares projection onto ``a + b*x + c*x**2`` for ``points`` samples at x = -m..m.
+
+    The pixel offsets are the same for every frame and line, so one
+    (3, points) matrix fits all of them with a single product.
+    """
+    half = points // 2
+    offsets = np.arange(-half, half + 1, dtype=np.float64)
+    return np.linalg.pinv(np.vander(offsets, 3, increasing=True))
+
+
+@dataclass
+class LineFits:
+    """
+    Fitted line profiles of several lines per frame.
+
+    ``centroids[i, j]`` (nm), ``fwhm[i, j]`` (nm), ``areas[i, j]``
+    (intensity x nm) and ``amplitudes[i, j]`` (intensity above the local
+    background) describe line ``j`` in frame ``manifest.frames[i]``; NaN
+    where the profile could not be fitted (no peak, or a peak at the edge
+    of the search window).
+    """
+    centers: np.ndarray
+    profile: str
+    centroids: np.ndarray
+    fwhm: np.ndarray
+    areas: np.ndarray
+    amplitudes: np.ndarray
+    manifest: RunManifest
+
+    @property
+    def frames(self) -> np.ndarray:
+        return self.manifest.frames
+
+    def index(self, center: float) -> int:
+        """Column of the line closest to ``center``."""
+        return int(np.abs(self.centers - center).argmin())
+
+    def trace(self, center: float, quantity: str = 'centroid') -> np.ndarray:
+        """
+        One fitted quantity per frame of the line closest to ``center``.
+
+        Args:
+            center: Line wavelength
+            quantity: 'centroid', 'fwhm', 'area' or 'amplitude'
+        """
+        if quantity not in QUANTITIES:
+            raise ValueError(f"Unknown quantity: {quantity}")
+        values = {'centroid': self.centroids, 'fwhm': self.fwhm, 'area': self.areas,
+                  'amplitude': self.amplitudes}[quantity]
+        return values[:, self.index(center)]
+
+
+def _local_background(cube: SpectralCube, first: np.ndarray, end: np.ndarray, points: int) -> np.ndarray:
+    """
+    Background under every line per frame: the mean of ``points`` pixels on
+    both sides just outside the search window (fewer at the spectrum edges).
+    """
+    n_wavelengths = cube.n_wavelengths
+    offsets = np.arange(points)
+    sides = np.concatenate([first[:, None] - 1 - offsets, end[:, None] + offsets], axis=1)
+    usable = (sides >= 0) & (sides < n_wavelengths)
+    values = to_float(cube.intensities[:, np.clip(sides, 0, n_wavelengths - 1)])
+    usable = usable & ~np.isnan(values)
+    counts = usable.sum(axis=2)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(usable, values, 0).sum(axis=2) / counts
+
+
+def fit_lines(cube: SpectralCube, centers: Sequence[float], search_nm: float = DEFAULT_SEARCH_NM,
+              points: int = DEFAULT_FIT_POINTS, profile: str = 'gaussian',
+              manifest: Optional[RunManifest] = None) -> LineFits:
+    """
+    Fit a Gaussian or Lorentzian profile to every line in every frame at once.
+
+    Per frame and line, the peak pixel inside ``center ± search_nm`` and its
+    neighbours are taken above the local background (the pixels just
+    outside the search window).
+    A Gaussian is a parabola in ``log(y)`` and a Lorentzian a parabola in
+    ``1/y``, so every fit is the same linear least-squares projection: the
+    whole (frames x lines) batch is one product, without any iterative
+    optimizer. Centroids are sub-pixel, interpolated on the wavelength grid.
+
+    Args:
+        cube: Run to fit
+        centers: Nominal line wavelengths
+        search_nm: Half width of the window searched for the peak pixel
+        points: Pixels used by the fit (odd, at least 3)
+        profile: 'gaussian' or 'lorentzian'
+        manifest: Manifest of the cube rows (default: built from the cube)
+
+    Returns:
+        LineFits with one column per line
+    """
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown line profile: {profile}")
+    if points < 3 or points % 2 == 0:
+        raise ValueError("points must be an odd number of at least 3")
+    centers = np.asarray(centers, dtype=np.float64)
+    wavelengths = cube.wavelengths
+    n_wavelengths = len(wavelengths)
+    half = points // 2
+    if n_wavelengths < points:
+        raise ValueError(f"Cube has fewer than {points} wavelengths")
+
+    # 搜尋視窗至少涵蓋擬合所需的像素數
+    first, end = band_edges(wavelengths, centers, 2 * search_nm)
+    first = np.clip(np.minimum(first, end - points), 0, n_wavelengths - points)
+    end = np.maximum(end, first + points)
+    width = int((end - first).max())
+    window = first[:, None] + np.arange(width)
+    inside = window < end[:, None]
+    window = np.minimum(window, n_wavelengths - 1)
+
+    # 只轉換視窗內的欄位: (幀, 譜線, 視窗像素)
+    values = to_float(cube.intensities[:, window])
+    present = inside & ~np.isnan(values)
+    peak = np.where(present, values, -np.inf).argmax(axis=2)
+    background = _local_background(cube, first, end, points)
+    # 峰值像素及其左右各 half 個像素 (受限於陣列範圍)
+    peak_pixel = np.clip(first + peak, half, n_wavelengths - 1 - half)
+    columns = peak_pixel[..., None] + np.arange(-half, half + 1)
+    rows = np.arange(cube.n_frames)[:, None, None]
+    samples = to_float(cube.intensities[rows, columns]) - background[..., None]
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        positive = np.where(samples > 0, samples, np.nan)
+        transformed = np.log(positive) if profile == 'gaussian' else 1 / positive
+        a, b, c = np.moveaxis(transformed @ parabola_projection(points).T, -1, 0)
+        offset = -b / (2 * c)
+        vertex = a - b ** 2 / (4 * c)
+        if profile == 'gaussian':
+            valid = c < 0
+            amplitude = np.exp(vertex)
+            sigma = np.sqrt(-1 / (2 * c))
+            fwhm_pixels = _GAUSSIAN_FWHM * sigma
+            area_pixels = amplitude * sigma * np.sqrt(2 * np.pi)
+        else:
+            valid = (c > 0) & (vertex > 0)
+            amplitude = 1 / vertex
+            gamma = np.sqrt(vertex / c)
+            fwhm_pixels = 2 * gamma
+            area_pixels = np.pi * amplitude * gamma
+    # 頂點須落在擬合的像素範圍內
+    valid &= np.abs(offset) <= half
+
+    position = peak_pixel + offset
+    dispersion = np.gradient(wavelengths)[peak_pixel]
+    centroids = np.interp(np.where(valid, position, 0), np.arange(n_wavelengths), wavelengths)
+
+    def masked(quantity):
+        return np.where(valid, quantity, np.nan)
+
+    n_failed = int((~valid).sum())
+    if n_failed:
+        logger.info(f"{n_failed} of {valid.size} line fits failed (no resolvable peak)")
+    return LineFits(centers=centers, profile=profile, centroids=masked(centroids),
+                    fwhm=masked(fwhm_pixels * dispersion), areas=masked(area_pixels * dispersion),
+                    amplitudes=masked(amplitude), manifest=manifest or RunManifest.from_cube(cube))
@@ -0,0 +1,181 @@
+import os
+import logging
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from model.cube import FRAME_PATTERN, INT_MISSING, SpectralCube
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RunManifest:
+    """
+    Frame metadata of one run, parsed once from the ``{base}_S####.txt`` names.
+
+    ``frames[i]`` is the frame number of cube row ``i``; file names and time
+    points are rebuilt from it on demand, so lookups are array indexing
+    instead of string splitting, and base names containing ``S`` are safe.
+
+    For binned runs ``last_frames[i]`` is the last frame co-added into row
+    ``i``; time points and file names refer to the first frame of the bin.
+    """
+    base_name: str
+    frames: np.ndarray
+    index_width: int = 4
+    last_frames: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    @classmethod
+    def from_paths(cls, paths: Iterable[str]) -> 'RunManifest':
+        """
+        Parse the frame numbers of the given spectrum files (in the given order).
+
+        Args:
+            paths: File names or paths of one run
+
+        Returns:
+            RunManifest with one entry per path
+        """
+        base_name, width, frames = '', 4, []
+        for path in paths:
+            match = FRAME_PATTERN.match(os.path.basename(path))
+            if match is None:
+                raise ValueError(f"Not a spectrum file name: {path}")
+            if not frames:
+                base_name, width = match.group('base'), len(match.group('index'))
+            elif match.group('base') != base_name:
+                raise ValueError(f"{path} does not belong to run {base_name}")
+            frames.append(int(match.group('index')))
+        return cls(base_name, np.array(frames, dtype=np.int64), width)
+
+    @classmethod
+    def from_cube(cls, cube: SpectralCube) -> 'RunManifest':
+        """Manifest of a cube's rows, keeping the last frame of every bin."""
+        return cls(cube.base_name, cube.frames, last_frames=cube.last_frames)
+
+    @classmethod
+    def scan(cls, folder_path: str) -> Optional['RunManifest']:
+        """
+        Find the run in a folder.
+
+        When several runs share the folder, the one with the most files is
+        used. Frames are sorted ascending.
+
+        Args:
+            folder_path: Folder holding the spectrum files
+
+        Returns:
+            RunManifest of the run, or None when the folder holds no spectrum files
+        """
+        runs: Dict[str, List[int]] = {}
+        widths: Counter = Counter()
+        for name in os.listdir(folder_path):
+            match = FRAME_PATTERN.match(name)
+            if match is not None:
+                runs.setdefault(match.group('base'), []).append(int(match.group('index')))
+                widths[len(match.group('index'))] += 1
+        if not runs:
+            return None
+
+        base_name = max(sorted(runs), key=lambda base: len(runs[base]))
+        if len(runs) > 1:
+            logger.info(f"Found {len(runs)} runs in {folder_path}, using {base_name}")
+        return cls(base_name, np.sort(np.array(runs[base_name], dtype=np.int64)), widths.most_common(1)[0][0])
+
+    def frame_range(self, row: int) -> Tuple[int, int]:
+        """First and last original frame of a row (the same frame when not binned)."""
+        last = self.frames if self.last_frames is None else self.last_frames
+        return int(self.frames[row]), int(last[row])
+
+    def time_point(self, row: int) -> str:
+        """Zero-padded frame number of a row, as written in its file name."""
+        return str(int(self.frames[row])).zfill(self.index_width)
+
+    def file_name(self, row: int) -> str:
+        """File name of a row."""
+        return f"{self.base_name}_S{self.time_point(row)}.txt"
+
+    def file_names(self) -> List[str]:
+        return [self.file_name(row) for row in range(len(self))]
+
+
+def column_extrema(intensities: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Per-column min, max and first argmin/argmax, ignoring missing values.
+
+    Works in the storage dtype of ``intensities`` (float64, float32 or int32);
+    only the per-column results are promoted to float64.
+
+    Args:
+        intensities: Array of shape (n_frames, n_wavelengths)
+
+    Returns:
+        Dictionary of arrays with keys 'min', 'max', 'argmin', 'argmax'
+    """
+    columns = np.arange(intensities.shape[1])
+    if intensities.dtype.kind == 'f':
+        missing = np.isnan(intensities)
+        low = np.where(missing, np.inf, intensities).astype(intensities.dtype, copy=False)
+        high = np.where(missing, -np.inf, intensities).astype(intensities.dtype, copy=False)
+    else:
+        # INT_MISSING 是最小值, 求最大值時不需另外處理
+        low = np.where(intensities == INT_MISSING, np.iinfo(intensities.dtype).max, intensities)
+        high = intensities
+    argmin = low.argmin(axis=0)
+    argmax = high.argmax(axis=0)
+    return {'min': low[argmin, columns].astype(np.float64), 'max': high[argmax, columns].astype(np.float64),
+            'argmin': argmin, 'argmax': argmax}
+
+
+def measured_columns(extrema: Dict[str, np.ndarray]) -> np.ndarray:
+    """
+    Mask of the columns holding at least one value.
+
+    A column without data (e.g. a resampling grid wider than the measured
+    range) has +/-inf extrema, or the int32 sentinels with min > max.
+    """
+    return np.isfinite(extrema['max']) & np.isfinite(extrema['min']) & (extrema['min'] <= extrema['max'])
+
+
+def peak_point_records(wavelengths: np.ndarray, extrema: Dict[str, np.ndarray],
+                       manifest: RunManifest) -> List[dict]:
+    """Peak point of every wavelength with data, highest first (``find_peak_points`` format)."""
+    measured = np.flatnonzero(measured_columns(extrema))
+    order = measured[np.argsort(-extrema['max'][measured], kind='stable')]
+    return [{
+        '波段': float(wavelengths[col]),
+        '最大值': float(extrema['max'][col]),
+        '檔案名': manifest.file_name(extrema['argmax'][col]),
+        '時間點': manifest.time_point(extrema['argmax'][col]),
+    } for col in order]
+
+
+def significant_difference_records(wavelengths: np.ndarray, extrema: Dict[str, np.ndarray],
+                                   manifest: RunManifest, threshold: float,
+                                   wavebands: Optional[Iterable[float]] = None) -> Dict:
+    """
+    Wavelengths whose max-min difference exceeds a threshold.
+
+    Values are ``(min, max, (file name, max))`` like ``find_significant_differences``;
+    when ``wavebands`` is given only those are kept and the time point is
+    appended, like ``find_specific_wavebands_differences``.
+    """
+    # 沒有資料的欄位 (無限大或 int32 缺值) 不列入
+    selected = measured_columns(extrema) & (np.abs(extrema['max'] - extrema['min']) > threshold)
+    if wavebands is not None:
+        selected &= np.isin(wavelengths, list(wavebands))
+
+    differences = {}
+    for col in np.flatnonzero(selected):
+        row = extrema['argmax'][col]
+        # 所有值皆 >= 最小值, 與最小值差距最大者即為第一個最大值
+        largest_diff = (manifest.file_name(row), float(extrema['max'][col]))
+        record = (float(extrema['min'][col]), float(extrema['max'][col]), largest_diff)
+        if wavebands is not None:
+            record += (manifest.time_point(row),)
+        differences[float(wavelengths[col])] = record
+    return differences
@@ -0,0 +1,191 @@
+import logging
+from dataclasses import dataclass
+from typing import Optional, Tuple
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from model.cube import SpectralCube, to_float
+
+logger = logging.getLogger(__name__)
+
+BASELINE_METHODS = ('polynomial', 'rolling_min')
+# MAD 換算為常態分布標準差的係數
+_MAD_TO_SIGMA = 1.4826
+
+
+def subtract_dark(intensities: np.ndarray, dark_rows: np.ndarray) -> np.ndarray:
+    """
+    Subtract the mean spectrum of the dark rows from every frame.
+
+    Args:
+        intensities: Float array of shape (n_frames, n_wavelengths)
+        dark_rows: Boolean mask or indices of the dark frames
+
+    Returns:
+        Dark-subtracted array
+    """
+    dark = np.nanmean(intensities[dark_rows], axis=0)
+    return intensities - dark
+
+
+def polynomial_baseline(intensities: np.ndarray, wavelengths: np.ndarray, order: int = 3,
+                        iterations: int = 10) -> np.ndarray:
+    """
+    Iterative polynomial baseline of every frame, fitted in one matrix product per iteration.
+
+    After each fit, points above the baseline are clipped to it so emission
+    lines stop pulling the fit up (modified polyfit).
+
+    Args:
+        intensities: Float array of shape (n_frames, n_wavelengths)
+        wavelengths: Wavelength axis
+        order: Polynomial order
+        iterations: Number of clip-and-refit iterations
+
+    Returns:
+        Baseline array of the same shape
+    """
+    # 正規化到 [-1, 1] 以維持 Vandermonde 矩陣的數值穩定
+    x = np.asarray(wavelengths, dtype=np.float64)
+    x = (2 * x - x[0] - x[-1]) / max(x[-1] - x[0], 1e-12)
+    vander = np.vander(x, order + 1).astype(intensities.dtype)
+    pseudo_inverse = np.linalg.pinv(vander)  # (order + 1, n_wl)
+
+    missing = np.isnan(intensities)
+    work = np.where(missing, np.nanmin(intensities, axis=1, keepdims=True), intensities)
+    baseline = work
+    for _ in range(iterations):
+        # 所有幀的係數一次求出: (n_frames, order + 1)
+        baseline = (work @ pseudo_inverse.T) @ vander.T
+        work = np.minimum(work, baseline)
+    return baseline
+
+
+def rolling_min_baseline(intensities: np.ndarray, window: int = 51) -> np.ndarray:
+    """
+    Rolling-minimum baseline along the wavelength axis, smoothed with a moving average.
+
+    The minimum uses the van Herk/Gil-Werman block scheme, so the cost does
+    not depend on the window width.
+
+    Args:
+        intensities: Float array of shape (n_frames, n_wavelengths)
+        window: Window width in pixels (made odd)
+
+    Returns:
+        Baseline array of the same shape
+    """
+    window = max(1, window | 1)
+    half = window // 2
+    n_rows, n_cols = intensities.shape
+    filled = np.where(np.isnan(intensities), np.inf, intensities)
+    padded = np.pad(filled, ((0, 0), (half, half)), mode='edge')
+
+    # 補齊為 window 的倍數後分塊: 區塊內前綴最小值與後綴最小值
+    n_blocks = -(-padded.shape[1] // window)
+    padded = np.pad(padded, ((0, 0), (0, n_blocks * window - padded.shape[1])), constant_values=np.inf)
+    blocks = padded.reshape(n_rows, n_blocks, window)
+    prefix = np.minimum.accumulate(blocks, axis=2).reshape(n_rows, -1)
+    suffix = np.minimum.accumulate(blocks[:, :, ::-1], axis=2)[:, :, ::-1].reshape(n_rows, -1)
+    minimum = np.minimum(suffix[:, :n_cols], prefix[:, window - 1:window - 1 + n_cols])
+
+    # 以移動平均 (累積和) 平滑階梯
+    padded = np.pad(minimum, ((0, 0), (half + 1, half)), mode='edge')
+    cumulative = np.cumsum(padded, axis=1)
+    return (cumulative[:, window:] - cumulative[:, :-window]) / window
+
+
+def running_median(intensities: np.ndarray, window: int, block_bytes: int = 64 << 20) -> np.ndarray:
+    """Running median along the time axis (edges padded), computed in row blocks."""
+    half = window // 2
+    padded = np.pad(intensities, ((half, half), (0, 0)), mode='edge')
+    windows = sliding_window_view(padded, window, axis=0)
+    # 部分排序需要複製視窗, 分塊以限制暫存記憶體; NaN 會被排到最後
+    step = max(1, block_bytes // max(1, intensities.shape[1] * window * intensities.itemsize))
+    median = np.empty_like(intensities)
+    for start in range(0, intensities.shape[0], step):
+        median[start:start + step] = np.partition(windows[start:start + step], half, axis=-1)[..., half]
+    return median
+
+
+def reject_spikes(intensities: np.ndarray, window: int = 5, threshold: float = 5.0) -> Tuple[np.ndarray, int]:
+    """
+    Replace cosmic-ray spikes by the running median along time.
+
+    A value is a spike when it exceeds the running median of its wavelength
+    by more than ``threshold`` robust standard deviations (MAD of the
+    residuals of that wavelength).
+
+    Args:
+        intensities: Float array of shape (n_frames, n_wavelengths)
+        window: Running-median width in frames (made odd)
+        threshold: Spike threshold in robust standard deviations
+
+    Returns:
+        Tuple of (cleaned array, number of replaced values)
+    """
+    median = running_median(intensities, max(3, window | 1))
+
+    residual = intensities - median
+    sigma = _MAD_TO_SIGMA * np.nanmedian(np.abs(residual), axis=0)
+    sigma = np.where(sigma > 0, sigma, np.finfo(np.float64).eps)
+    # 宇宙射線只會造成正向尖峰
+    spikes = residual > threshold * sigma
+    return np.where(spikes, median, intensities), int(np.count_nonzero(spikes))
+
+
+@dataclass
+class PreprocessConfig:
+    """
+    Pre-processing applied to the cube before analyses see it.
+
+    Steps run in this order: spike rejection along time, dark subtraction,
+    baseline removal. Every step is vectorized over all wavelengths.
+    """
+    # 暗背景幀號範圍 (含頭尾), 例如啟動前的幀
+    dark_frames: Optional[Tuple[int, int]] = None
+    baseline: Optional[str] = None
+    polynomial_order: int = 3
+    rolling_window: int = 51
+    spike_rejection: bool = False
+    spike_window: int = 5
+    spike_threshold: float = 5.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.dark_frames is not None or self.baseline is not None or self.spike_rejection
+
+    def apply(self, cube: SpectralCube) -> SpectralCube:
+        """
+        Return a pre-processed copy of a cube (the input is not modified).
+
+        Args:
+            cube: Raw cube
+
+        Returns:
+            Processed float cube with the same axes
+        """
+        if self.baseline is not None and self.baseline not in BASELINE_METHODS:
+            raise ValueError(f"Unknown baseline method: {self.baseline}")
+
+        dtype = np.float32 if cube.dtype.itemsize <= 4 else np.float64
+        intensities = np.array(to_float(cube.intensities, dtype))
+
+        if self.spike_rejection:
+            intensities, n_spikes = reject_spikes(intensities, self.spike_window, self.spike_threshold)
+            logger.info(f"Spike rejection replaced {n_spikes} values")
+
+        if self.dark_frames is not None:
+            first, last = self.dark_frames
+            dark_rows = (cube.frames >= first) & (cube.frames <= last)
+            if not dark_rows.any():
+                raise ValueError(f"No frames in dark range {first}-{last}")
+            intensities = subtract_dark(intensities, dark_rows)
+
+        if self.baseline == 'polynomial':
+            intensities = intensities - polynomial_baseline(intensities, cube.wavelengths, self.polynomial_order)
+        elif self.baseline == 'rolling_min':
+            intensities = intensities - rolling_min_baseline(intensities, self.rolling_window)
+
+        return SpectralCube(wavelengths=cube.wavelengths, frames=cube.frames,
+                            intensities=intensities.astype(dtype, copy=False), base_name=cube.base_name,
+                            last_frames=cube.last_frames)
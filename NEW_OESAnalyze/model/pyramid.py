@@ -0,0 +1,71 @@
+import logging
+from typing import List, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class MinMaxPyramid:
+    """
+    Multi-resolution min/max summary of a 1-D signal for fast redraws.
+
+    Level 0 holds the raw samples; each further level halves the number of
+    samples, keeping the min and max of every pair so narrow peaks survive.
+    ``query`` picks the finest level that fits the requested point budget
+    for the visible x-range, so the cost of a redraw does not depend on the
+    length of the signal.
+    """
+
+    def __init__(self, x, y, min_points: int = 256):
+        """
+        Build the pyramid.
+
+        Args:
+            x: Ascending x values (wavelength or frame number)
+            y: Signal values
+            min_points: Stop halving once a level has at most this many samples
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        self.levels: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = [(x, y, y)]
+
+        while len(self.levels[-1][0]) > min_points:
+            xs, lo, hi = self.levels[-1]
+            if len(xs) % 2:
+                # 奇數長度時重複最後一點, 以免遺漏極值
+                xs, lo, hi = np.append(xs, xs[-1]), np.append(lo, lo[-1]), np.append(hi, hi[-1])
+            self.levels.append((xs[::2], np.fmin(lo[::2], lo[1::2]), np.fmax(hi[::2], hi[1::2])))
+
+    @property
+    def x_range(self) -> Tuple[float, float]:
+        x = self.levels[0][0]
+        return float(x[0]), float(x[-1])
+
+    def query(self, x0: float, x1: float, max_points: int = 2000) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return a decimated copy of the signal between x0 and x1.
+
+        Args:
+            x0: Left edge of the visible range
+            x1: Right edge of the visible range
+            max_points: Upper bound on the number of returned points
+
+        Returns:
+            Tuple of (x, y); above level 0 every bucket contributes its min and max
+        """
+        for level, (xs, lo, hi) in enumerate(self.levels):
+            # 多取一點, 讓線條延伸到視窗邊緣
+            i0 = max(0, int(np.searchsorted(xs, x0)) - 1)
+            i1 = min(len(xs), int(np.searchsorted(xs, x1, side='right')) + 1)
+            points = (i1 - i0) * (1 if level == 0 else 2)
+            if points <= max_points or level == len(self.levels) - 1:
+                break
+
+        if level == 0:
+            return xs[i0:i1], lo[i0:i1]
+
+        x = np.repeat(xs[i0:i1], 2)
+        y = np.empty(len(x))
+        y[0::2] = lo[i0:i1]
+        y[1::2] = hi[i0:i1]
+        return x, y
@@ -0,0 +1,103 @@
+import logging
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple, Union
+import numpy as np
+from model.cube import SpectralCube, to_float
+from model.manifest import RunManifest
+from model.bands import BandTraces
+
+logger = logging.getLogger(__name__)
+
+# 分母絕對值不大於此值時比值記為 NaN
+DEFAULT_MIN_DENOMINATOR = 1e-9
+
+
+def ratio_columns(values: np.ndarray, numerators: np.ndarray, denominators: np.ndarray,
+                  min_denominator: float = DEFAULT_MIN_DENOMINATOR) -> np.ndarray:
+    """
+    Divide column pairs of a (n_frames, n_columns) array in one operation.
+
+    Args:
+        values: Float array of shape (n_frames, n_columns)
+        numerators: Column index of every numerator
+        denominators: Column index of every denominator
+        min_denominator: Ratios whose denominator is not larger than this
+            (in absolute value) are NaN instead of inf or huge values
+
+    Returns:
+        Array of shape (n_frames, n_pairs)
+    """
+    denominator = values[:, denominators]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratios = values[:, numerators] / denominator
+    ratios[np.abs(denominator) <= min_denominator] = np.nan
+    return ratios
+
+
+@dataclass
+class RatioTraces:
+    """
+    Line-ratio time series of several wavelength (or band) pairs.
+
+    ``ratios[i, j]`` is ``pairs[j][0] / pairs[j][1]`` in frame
+    ``manifest.frames[i]``; NaN where the denominator is (close to) zero or
+    a value is missing.
+    """
+    pairs: np.ndarray
+    ratios: np.ndarray
+    manifest: RunManifest
+
+    @property
+    def frames(self) -> np.ndarray:
+        return self.manifest.frames
+
+    def labels(self) -> List[str]:
+        return [f"{numerator:g}/{denominator:g}" for numerator, denominator in self.pairs]
+
+    def index(self, pair: Tuple[float, float]) -> int:
+        """Column of the pair closest to ``pair``."""
+        return int(np.abs(self.pairs - np.asarray(pair, dtype=np.float64)).sum(axis=1).argmin())
+
+    def trace(self, pair: Tuple[float, float]) -> np.ndarray:
+        """Ratio per frame of one pair."""
+        return self.ratios[:, self.index(pair)]
+
+
+def line_ratios(source: Union[SpectralCube, BandTraces], pairs: Sequence[Tuple[float, float]],
+                manifest: Optional[RunManifest] = None,
+                min_denominator: float = DEFAULT_MIN_DENOMINATOR) -> RatioTraces:
+    """
+    Compute the ratio traces of many pairs over a whole run at once.
+
+    Only the columns used by the pairs are converted to float64, then all
+    ratios are one gather and one guarded division.
+
+    Args:
+        source: SpectralCube (pairs of exact wavelengths) or BandTraces
+            (pairs of band centers)
+        pairs: (numerator, denominator) wavelengths
+        manifest: Manifest of the cube rows (default: the bands' manifest or
+            one built from the cube)
+        min_denominator: Denominators not larger than this give NaN
+
+    Returns:
+        RatioTraces with one column per pair
+    """
+    pairs = np.asarray(pairs, dtype=np.float64).reshape(-1, 2)
+    wavelengths, inverse = np.unique(pairs, return_inverse=True)
+    inverse = inverse.reshape(pairs.shape)
+
+    if isinstance(source, BandTraces):
+        columns = [source.index(wavelength) for wavelength in wavelengths]
+        values = source.areas[:, columns]
+        manifest = manifest or source.manifest
+    else:
+        columns = [source.wavelength_index(wavelength) for wavelength in wavelengths]
+        values = to_float(source.intensities[:, columns], np.float64)
+        manifest = manifest or RunManifest.from_cube(source)
+
+    ratios = ratio_columns(values, inverse[:, 0], inverse[:, 1], min_denominator)
+    invalid = np.count_nonzero(np.isnan(ratios))
+    if invalid:
+        logger.info(f"{invalid} ratio values undefined (zero denominator or missing value)")
+    return RatioTraces(pairs=pairs, ratios=ratios, manifest=manifest)
@@ -0,0 +1,286 @@
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_DPI = 60
+FULL_DPI = 300
+MAX_MARKED_PEAKS = 3
+
+
+@dataclass
+class SpectrumEnvelope:
+    """Precomputed max-envelope of a run and the peaks to annotate on it."""
+    wavelengths: np.ndarray
+    intensities: np.ndarray
+    max_peak: dict
+    marked_peaks: List[dict] = field(default_factory=list)
+    peak_points: List[dict] = field(default_factory=list)
+
+    @classmethod
+    def from_peaks(cls, wavelengths, intensities, peak_points: List[dict],
+                   skip_range_nm: float) -> 'SpectrumEnvelope':
+        """
+        Build the envelope and pick up to three peaks at least ``skip_range_nm`` apart.
+
+        Args:
+            wavelengths: Wavelength axis
+            intensities: Max intensity per wavelength
+            peak_points: Peak points as returned by ``find_peak_points``
+            skip_range_nm: Minimum distance between marked peaks
+
+        Returns:
+            SpectrumEnvelope ready for rendering
+        """
+        sorted_peaks = sorted(peak_points, key=lambda x: x['最大值'], reverse=True)
+        marked_peaks = []
+        for peak in sorted_peaks:
+            if len(marked_peaks) >= MAX_MARKED_PEAKS:
+                break
+            # 檢查是否需要跳過範圍
+            if not any(abs(peak['波段'] - marked['波段']) <= skip_range_nm for marked in marked_peaks):
+                marked_peaks.append(peak)
+
+        return cls(
+            wavelengths=np.asarray(wavelengths, dtype=np.float64),
+            intensities=np.asarray(intensities, dtype=np.float64),
+            max_peak=sorted_peaks[0],
+            marked_peaks=marked_peaks,
+            peak_points=sorted_peaks,
+        )
+
+    def with_skip_range(self, skip_range_nm: float) -> 'SpectrumEnvelope':
+        """Re-pick the marked peaks for a new skip range, reusing the envelope arrays."""
+        return SpectrumEnvelope.from_peaks(self.wavelengths, self.intensities, self.peak_points, skip_range_nm)
+
+
+def annotate_peaks(ax, envelope: SpectrumEnvelope) -> list:
+    """
+    Annotate the marked peaks of an envelope and put x ticks on them.
+
+    Args:
+        ax: Matplotlib axes to draw on
+        envelope: Envelope holding the peaks to mark
+
+    Returns:
+        List of the created annotation artists
+    """
+    annotations = []
+    for i, peak in enumerate(envelope.marked_peaks):
+        # 調整標註位置以避免重疊, 最高波段不旋轉, 其他旋轉45度
+        annotations.append(ax.annotate(
+            f'Peak: {peak["波段"]:.1f} nm, intensity: {peak["最大值"]:.1f}',
+            xy=(peak['波段'], peak['最大值']),
+            xytext=(7, i * 10), textcoords='offset points',
+            arrowprops=dict(arrowstyle='->', lw=1.5),
+            rotation=0 if i == 0 else 45))
+
+    x_ticks = [peak['波段'] for peak in envelope.marked_peaks]
+    ax.set_xticks(x_ticks, labels=[f'{x:.1f}nm' for x in x_ticks], rotation=45)
+    return annotations
+
+
+class SpectrumRenderer:
+    """
+    Draws a SpectrumEnvelope on one reusable Agg figure.
+
+    The figure, axes and line artist are created once; each render only
+    updates the artist data and the peak annotations. Not thread-safe: use
+    one renderer per thread.
+    """
+
+    def __init__(self, figsize: Tuple[float, float] = (10, 6)):
+        # matplotlib 延遲到第一次繪圖才載入, 縮短啟動時間
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        self.figure = Figure(figsize=figsize)
+        FigureCanvasAgg(self.figure)
+        self.ax = self.figure.add_subplot()
+        self.line, = self.ax.plot([], [], color='red', label='Highest_data', linewidth=1)
+        self.ax.set_xlabel('Wavelength(nm)')
+        self.ax.set_ylabel('Intensity(Cts)')
+        self._annotations = []
+
+    def draw(self, envelope: SpectrumEnvelope) -> None:
+        """Update the figure artists from an envelope."""
+        self.line.set_data(envelope.wavelengths, envelope.intensities)
+        self.ax.set_title(f'ALL_Spectrum & Higher Peaks \n'
+                          f'Max_peak: {envelope.max_peak["波段"]:.1f}nm')
+
+        for annotation in self._annotations:
+            annotation.remove()
+        self._annotations = annotate_peaks(self.ax, envelope)
+        self.ax.relim()
+        self.ax.autoscale_view()
+
+    def to_png(self, dpi: int = PREVIEW_DPI) -> bytes:
+        """Render the current figure to an in-memory PNG."""
+        buffer = io.BytesIO()
+        self.figure.savefig(buffer, format='png', dpi=dpi, bbox_inches='tight')
+        return buffer.getvalue()
+
+    def save(self, output_path: str, dpi: int = FULL_DPI) -> str:
+        """Render the current figure to a PNG file."""
+        self.figure.savefig(output_path, dpi=dpi, bbox_inches='tight')
+        return output_path
+
+
+class PlotService:
+    """
+    Two-tier rendering of the all-spectrum figure.
+
+    ``render`` returns a low-dpi PNG preview immediately and queues the
+    full-resolution file write on a background thread. Both tiers draw the
+    same SpectrumEnvelope; each tier owns its own reusable figure.
+    """
+
+    def __init__(self, preview_dpi: int = PREVIEW_DPI, full_dpi: int = FULL_DPI):
+        self.preview_dpi = preview_dpi
+        self.full_dpi = full_dpi
+        self._preview_renderer: Optional[SpectrumRenderer] = None
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='oes-plot')
+        self._pending: List[Future] = []
+
+    def _write_full(self, envelope: SpectrumEnvelope, output_path: str) -> str:
+        renderer = getattr(self._local, 'renderer', None)
+        if renderer is None:
+            renderer = self._local.renderer = SpectrumRenderer()
+        renderer.draw(envelope)
+        renderer.save(output_path, dpi=self.full_dpi)
+        logger.info(f"已生成最大值比較圖：{output_path}")
+        return output_path
+
+    def render(self, envelope: SpectrumEnvelope, output_path: str) -> Tuple[bytes, Future]:
+        """
+        Render the preview now and write the full-resolution figure in the background.
+
+        Args:
+            envelope: Precomputed envelope to draw
+            output_path: Path of the full-resolution PNG
+
+        Returns:
+            Tuple of (preview PNG bytes, future resolving to ``output_path``)
+        """
+        future = self._executor.submit(self._write_full, envelope, output_path)
+        self._pending = [f for f in self._pending if not f.done()] + [future]
+
+        if self._preview_renderer is None:
+            self._preview_renderer = SpectrumRenderer()
+        self._preview_renderer.draw(envelope)
+        return self._preview_renderer.to_png(self.preview_dpi), future
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        """Block until every queued full-resolution write has finished."""
+        for future in list(self._pending):
+            future.result(timeout=timeout)
+        self._pending = []
+
+
+def _block_fmax_rows(data: np.ndarray, factor: int) -> np.ndarray:
+    """Max over consecutive groups of ``factor`` rows, ignoring NaN."""
+    if factor == 1:
+        return data
+    full = (data.shape[0] // factor) * factor
+    reduced = np.fmax.reduce(data[:full].reshape(-1, factor, data.shape[1]), axis=1)
+    if full < data.shape[0]:
+        reduced = np.vstack([reduced, np.fmax.reduce(data[full:], axis=0, keepdims=True)])
+    return reduced
+
+
+def block_max_decimate(data: np.ndarray, max_rows: int, max_cols: int) -> Tuple[np.ndarray, int, int]:
+    """
+    Shrink a 2-D array by taking the max of each block so peaks stay visible.
+
+    Args:
+        data: Array of shape (rows, cols), NaN for missing values
+        max_rows: Maximum number of output rows
+        max_cols: Maximum number of output columns
+
+    Returns:
+        Tuple of (decimated float32 array, row factor, column factor)
+    """
+    rows, cols = data.shape
+    row_factor = max(1, -(-rows // max_rows))
+    col_factor = max(1, -(-cols // max_cols))
+
+    # 先沿時間軸 (連續記憶體) 縮減, 再對較小的結果沿波長軸縮減
+    decimated = _block_fmax_rows(np.asarray(data, dtype=np.float32), row_factor)
+    decimated = _block_fmax_rows(np.ascontiguousarray(decimated.T), col_factor).T
+    return np.ascontiguousarray(decimated), row_factor, col_factor
+
+
+class HeatmapRenderer:
+    """
+    Draws a whole run as one time x wavelength image on a reusable Agg figure.
+
+    The cube is block-max decimated to at most ``max_rows`` x ``max_cols``
+    pixels and drawn with a single ``imshow``; activation frames and selected
+    wavebands are overlaid as lines.
+    """
+
+    def __init__(self, figsize: Tuple[float, float] = (10, 6), max_rows: int = 1000, max_cols: int = 2000):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        self.max_rows = max_rows
+        self.max_cols = max_cols
+        self.figure = Figure(figsize=figsize)
+        FigureCanvasAgg(self.figure)
+        self.ax = self.figure.add_subplot()
+        self.ax.set_xlabel('Wavelength(nm)')
+        self.ax.set_ylabel('Frame')
+        self.image = None
+        self._overlays = []
+
+    def draw(self, wavelengths: np.ndarray, frames: np.ndarray, intensities: np.ndarray,
+             marker_frames: Optional[List[int]] = None, marker_wavebands: Optional[List[float]] = None) -> None:
+        """
+        Update the heatmap and its overlays.
+
+        Args:
+            wavelengths: Wavelength axis (columns)
+            frames: Frame numbers (rows)
+            intensities: Array of shape (n_frames, n_wavelengths)
+            marker_frames: Frames to mark, e.g. detected activation/end frames
+            marker_wavebands: Wavelengths to mark, e.g. the selected wavebands
+        """
+        data, _, _ = block_max_decimate(intensities, self.max_rows, self.max_cols)
+        extent = (float(wavelengths[0]), float(wavelengths[-1]), float(frames[0]), float(frames[-1]))
+
+        if self.image is None:
+            self.image = self.ax.imshow(data, aspect='auto', origin='lower', extent=extent,
+                                        interpolation='nearest', cmap='viridis')
+            self.figure.colorbar(self.image, ax=self.ax, label='Intensity(Cts)')
+        else:
+            self.image.set_data(data)
+            self.image.set_extent(extent)
+        self.image.set_clim(np.nanmin(data), np.nanmax(data))
+
+        for overlay in self._overlays:
+            overlay.remove()
+        self._overlays = []
+        for frame in marker_frames or []:
+            if frame is not None:
+                self._overlays.append(self.ax.axhline(frame, color='white', linestyle='--', linewidth=1))
+        for waveband in marker_wavebands or []:
+            self._overlays.append(self.ax.axvline(waveband, color='red', linestyle=':', linewidth=1))
+
+        self.ax.set_title(f'Time x Wavelength ({len(frames)} frames x {len(wavelengths)} wavelengths)')
+
+    def to_png(self, dpi: int = PREVIEW_DPI) -> bytes:
+        """Render the current figure to an in-memory PNG."""
+        buffer = io.BytesIO()
+        self.figure.savefig(buffer, format='png', dpi=dpi)
+        return buffer.getvalue()
+
+    def save(self, output_path: str, dpi: int = FULL_DPI) -> str:
+        """Render the current figure to a PNG file."""
+        self.figure.savefig(output_path, dpi=dpi, bbox_inches='tight')
+        return output_path
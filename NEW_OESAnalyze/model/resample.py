@@ -0,0 +1,154 @@
+import logging
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional
+import numpy as np
+from model.cube import SpectralCube, to_float, to_storage
+
+logger = logging.getLogger(__name__)
+
+# 重取樣時每個區塊轉成浮點數的列數上限 (控制暫存記憶體)
+RESAMPLE_BLOCK_ROWS = 4096
+
+
+@dataclass
+class InterpolationWeights:
+    """
+    Linear interpolation from one source grid onto a target grid.
+
+    Every target wavelength is ``(1 - weight) * source[lower] + weight *
+    source[lower + 1]``: a sparse matrix with two non-zeros per column,
+    applied to a whole block of frames with two gathers. Targets outside
+    the source range get NaN (missing).
+    """
+    lower: np.ndarray
+    weight: np.ndarray
+    inside: np.ndarray
+
+    @classmethod
+    def between(cls, source: np.ndarray, target: np.ndarray) -> 'InterpolationWeights':
+        """
+        Weights from the ascending ``source`` grid to the ``target`` grid.
+
+        Args:
+            source: Wavelengths of the data (ascending)
+            target: Wavelengths to interpolate onto
+
+        Returns:
+            InterpolationWeights
+        """
+        source = np.asarray(source, dtype=np.float64)
+        target = np.asarray(target, dtype=np.float64)
+        if len(source) < 2:
+            raise ValueError("Source grid needs at least two wavelengths")
+        lower = np.clip(np.searchsorted(source, target, side='right') - 1, 0, len(source) - 2)
+        weight = (target - source[lower]) / (source[lower + 1] - source[lower])
+        inside = (target >= source[0]) & (target <= source[-1])
+        return cls(lower=lower, weight=np.clip(weight, 0.0, 1.0), inside=inside)
+
+    def apply(self, intensities: np.ndarray, dtype=np.float64) -> np.ndarray:
+        """
+        Interpolate every row (frame) at once.
+
+        Args:
+            intensities: Array of shape (n_frames, n_source), any storage dtype
+            dtype: Float dtype of the result
+
+        Returns:
+            Array of shape (n_frames, n_target), NaN outside the source range
+        """
+        values = to_float(np.atleast_2d(intensities), dtype)
+        weight = self.weight.astype(dtype)
+        lower = values[:, self.lower]
+        result = lower + weight * (values[:, self.lower + 1] - lower)
+        result[:, ~self.inside] = np.nan
+        return result
+
+
+class GridResampler:
+    """
+    Resample spectra from any calibration onto one target grid.
+
+    Weights are computed once per distinct source grid and cached, so a
+    batch of runs (or the frames of one run) that share a calibration pay
+    for the search only once.
+    """
+
+    def __init__(self, target: np.ndarray):
+        self.target = np.asarray(target, dtype=np.float64)
+        self._weights: Dict[bytes, InterpolationWeights] = {}
+
+    def weights(self, source: np.ndarray) -> InterpolationWeights:
+        """Cached weights of one source grid."""
+        source = np.asarray(source, dtype=np.float64)
+        key = source.tobytes()
+        weights = self._weights.get(key)
+        if weights is None:
+            weights = self._weights[key] = InterpolationWeights.between(source, self.target)
+        return weights
+
+    def matches(self, source: np.ndarray) -> bool:
+        """True when ``source`` already is the target grid (no interpolation needed)."""
+        return len(source) == len(self.target) and np.array_equal(source, self.target)
+
+    def resample(self, source: np.ndarray, intensities: np.ndarray, dtype=np.float64) -> np.ndarray:
+        """
+        Interpolate frames sampled on ``source`` onto the target grid.
+
+        Args:
+            source: Wavelengths of the columns of ``intensities``
+            intensities: Array of shape (n_frames, n_source) or (n_source,)
+            dtype: Float dtype of the result
+
+        Returns:
+            Float array with ``len(target)`` columns (one row for 1-D input)
+        """
+        if self.matches(source):
+            return to_float(np.atleast_2d(intensities), dtype)
+        return self.weights(source).apply(intensities, dtype)
+
+    def resample_cube(self, cube: SpectralCube) -> SpectralCube:
+        """
+        The cube on the target grid, keeping its storage dtype.
+
+        Rows are processed in blocks, so the float working copy stays bounded.
+        """
+        if self.matches(cube.wavelengths):
+            return cube
+        weights = self.weights(cube.wavelengths)
+        compute = np.float32 if cube.dtype.itemsize <= 4 else np.float64
+        intensities = np.empty((cube.n_frames, len(self.target)), dtype=cube.dtype)
+        for start in range(0, cube.n_frames, RESAMPLE_BLOCK_ROWS):
+            block = weights.apply(cube.intensities[start:start + RESAMPLE_BLOCK_ROWS], compute)
+            intensities[start:start + RESAMPLE_BLOCK_ROWS] = to_storage(block, cube.dtype)
+        return SpectralCube(wavelengths=self.target.copy(), frames=cube.frames, intensities=intensities,
+                            base_name=cube.base_name, last_frames=cube.last_frames)
+
+
+def regular_grid(start: float, stop: float, step: float) -> np.ndarray:
+    """Evenly spaced grid from ``start`` to ``stop`` (included when it falls on the grid)."""
+    if step <= 0 or stop < start:
+        raise ValueError(f"Invalid wavelength grid {start}..{stop} step {step}")
+    return start + step * np.arange(int(np.floor((stop - start) / step + 1e-9)) + 1)
+
+
+def common_grid(grids: Iterable[np.ndarray], step: Optional[float] = None) -> np.ndarray:
+    """
+    Target grid covering the range shared by all source grids.
+
+    Args:
+        grids: Wavelength grids of the runs (or frames) to align
+        step: Grid spacing in nm (default: the coarsest median spacing of the sources)
+
+    Returns:
+        Evenly spaced ascending grid
+    """
+    grids = [np.asarray(grid, dtype=np.float64) for grid in grids]
+    if not grids:
+        raise ValueError("No wavelength grids given")
+    first = max(grid[0] for grid in grids)
+    last = min(grid[-1] for grid in grids)
+    if first >= last:
+        raise ValueError("Wavelength grids do not overlap")
+    if step is None:
+        step = max(float(np.median(np.diff(grid))) for grid in grids)
+    return regular_grid(first, last, step)
@@ -0,0 +1,173 @@
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+import numpy as np
+from model.cube import SpectralCube
+from model.manifest import RunManifest, column_extrema, significant_difference_records
+
+logger = logging.getLogger(__name__)
+
+# 平行階段: 名稱 -> (以立方體為第一個參數的模組層級函式, 其餘位置參數, 關鍵字參數)
+Stage = Tuple[Callable[..., Any], tuple, dict]
+
+
+@dataclass(frozen=True)
+class SharedCubeHandle:
+    """
+    Picklable reference to a cube whose intensities live outside the process.
+
+    Only the small axes travel with the handle; the intensities are either a
+    shared memory segment (``segment``) or a ``.npy`` file (``path``) that
+    workers map without copying.
+    """
+    shape: Tuple[int, int]
+    dtype: str
+    wavelengths: np.ndarray
+    frames: np.ndarray
+    base_name: str = ''
+    last_frames: Optional[np.ndarray] = None
+    segment: Optional[str] = None
+    path: Optional[str] = None
+
+    def _cube(self, intensities: np.ndarray) -> SpectralCube:
+        return SpectralCube(wavelengths=self.wavelengths, frames=self.frames, intensities=intensities,
+                            base_name=self.base_name, last_frames=self.last_frames)
+
+    @contextmanager
+    def attach(self) -> Iterator[SpectralCube]:
+        """
+        Read-only zero-copy view of the cube, detached when the block exits.
+
+        The cube must not be used after the block: the memory behind it is unmapped.
+        """
+        if self.path is not None:
+            intensities = np.load(self.path, mmap_mode='r')
+            try:
+                yield self._cube(intensities)
+            finally:
+                del intensities
+            return
+
+        segment = _open_segment(self.segment)
+        intensities = np.ndarray(self.shape, dtype=np.dtype(self.dtype), buffer=segment.buf)
+        intensities.flags.writeable = False
+        try:
+            yield self._cube(intensities)
+        finally:
+            del intensities
+            segment.close()
+
+
+def _open_segment(name: str) -> shared_memory.SharedMemory:
+    """Attach to an existing segment without handing its lifetime to this process."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13: 工作行程與擁有者共用 resource tracker, 附加時的重複註冊不影響區段壽命
+        return shared_memory.SharedMemory(name=name)
+
+
+def _maps_whole_file(intensities: np.memmap) -> bool:
+    """True when the memmap is the whole ``.npy`` array (not a slice or a reinterpreted view)."""
+    stored = np.load(intensities.filename, mmap_mode='r')
+    return (intensities.flags.c_contiguous and stored.shape == intensities.shape
+            and stored.dtype == intensities.dtype)
+
+
+class SharedCube:
+    """
+    Owner of a cube shared with worker processes.
+
+    A memory-mapped ``.npy`` cube (e.g. from ``write_cube_file``) is shared
+    through its file; an in-memory cube is copied once into a shared memory
+    segment. Use as a context manager: the segment is unlinked on exit, even
+    when a stage fails.
+    """
+
+    def __init__(self, cube: SpectralCube):
+        self._segment: Optional[shared_memory.SharedMemory] = None
+        intensities = cube.intensities
+        path = getattr(intensities, 'filename', None)
+        if isinstance(intensities, np.memmap) and path and path.endswith('.npy') and _maps_whole_file(intensities):
+            # 已是檔案映射: 工作行程直接映射同一檔案
+            self.cube = cube
+        else:
+            path = None
+            self._segment = shared_memory.SharedMemory(create=True, size=max(intensities.nbytes, 1))
+            shared = np.ndarray(intensities.shape, dtype=intensities.dtype, buffer=self._segment.buf)
+            shared[...] = intensities
+            self.cube = SpectralCube(wavelengths=cube.wavelengths, frames=cube.frames, intensities=shared,
+                                     base_name=cube.base_name, last_frames=cube.last_frames)
+            logger.info(f"Shared {intensities.nbytes / (1 << 20):.1f} MB cube in segment {self._segment.name}")
+        self.handle = SharedCubeHandle(
+            shape=tuple(intensities.shape), dtype=intensities.dtype.str, wavelengths=cube.wavelengths,
+            frames=cube.frames, base_name=cube.base_name, last_frames=cube.last_frames,
+            segment=self._segment.name if self._segment is not None else None, path=path)
+
+    def close(self) -> None:
+        """Release the shared segment (idempotent)."""
+        if self._segment is None:
+            return
+        segment, self._segment = self._segment, None
+        self.cube = None
+        segment.close()
+        segment.unlink()
+
+    def __enter__(self) -> 'SharedCube':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+def _run_stage(handle: SharedCubeHandle, function: Callable[..., Any], args: tuple, kwargs: dict) -> Any:
+    with handle.attach() as cube:
+        return function(cube, *args, **kwargs)
+
+
+def run_stages(cube: SpectralCube, stages: Dict[str, Stage], max_workers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Run independent analysis stages on one cube in parallel processes.
+
+    Workers attach to the shared cube instead of receiving a pickled copy.
+    Stage functions must be importable module-level functions taking the
+    cube as first argument, and their results must be picklable (they should
+    not return views of the cube).
+
+    Args:
+        cube: Cube to analyze
+        stages: ``{name: (function, args, kwargs)}``
+        max_workers: Worker processes (default: one per CPU, at most one per stage)
+
+    Returns:
+        ``{name: result}``; the first failing stage's exception is raised
+        after every stage has finished and the segment is released
+    """
+    if not stages:
+        return {}
+    max_workers = min(max_workers or os.cpu_count() or 1, len(stages))
+    with SharedCube(cube) as shared, ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {name: pool.submit(_run_stage, shared.handle, function, tuple(args), dict(kwargs))
+                   for name, (function, args, kwargs) in stages.items()}
+        results, error = {}, None
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                logger.error(f"Stage {name} failed: {e}")
+                error = error or e
+    if error is not None:
+        raise error
+    return results
+
+
+def dissociation_stage(cube: SpectralCube, threshold: float,
+                       wavebands: Optional[Tuple[float, ...]] = None) -> Dict:
+    """Dissociation records of one threshold (``find_significant_differences`` format)."""
+    manifest = RunManifest.from_cube(cube)
+    return significant_difference_records(cube.wavelengths, column_extrema(cube.intensities), manifest,
+                                          threshold, wavebands)
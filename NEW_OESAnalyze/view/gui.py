@@ -2,15 +2,18 @@ import sys
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QPushButton, QLabel, QLineEdit, QFileDialog, QSpinBox,
-    QDoubleSpinBox, QTableWidget, QTableWidgetItem, QMessageBox, QMenu,
-    QTextEdit, QGroupBox , QHeaderView,  QCheckBox, QGridLayout
+    QDoubleSpinBox, QTableView, QMessageBox, QMenu,
+    QTextEdit, QGroupBox , QHeaderView,  QCheckBox, QGridLayout, QTabWidget, QComboBox
 )
 from PyQt6.QtCore import Qt
 from PyQt6.QtGui import QPixmap
 from controller.controller import OESController
-import pandas as pd
+from view.table_model import ArrayTableModel
 import os
-from typing import List, Dict
+from typing import List, Dict, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 class OESAnalyzerGUI(QMainWindow):
     """
@@ -21,6 +24,8 @@ class OESAnalyzerGUI(QMainWindow):
     def __init__(self):
         super().__init__()
         self.controller = OESController()
+        self.controller.profiler.add_listener(self._show_stage_timing)
+        self.controller.set_status_callback(self.statusBar().showMessage)
         self.start_index = 0
         self.end_index = 0
         self.setWindowTitle("OES Analyzer")
@@ -39,6 +44,15 @@ class OESAnalyzerGUI(QMainWindow):
 
         self._init_ui()
 
+    def _show_stage_timing(self, span):
+        """Stream finished pipeline stages to the status bar."""
+        message = f"{span.name}: {span.wall_s:.2f} s (CPU {span.cpu_s:.2f} s)"
+        if span.files:
+            message += f", {span.files} 檔 / {span.bytes / 1e6:.1f} MB"
+        self.statusBar().showMessage(message)
+        # 只重繪狀態列; 執行事件迴圈會讓分析途中的點擊再次啟動分析
+        self.statusBar().repaint()
+
     def _init_ui(self):
         """Initialize the GUI layout and components."""
         main_widget = QWidget()
@@ -77,6 +91,8 @@ class OESAnalyzerGUI(QMainWindow):
         self._setup_OES_analysis_section(button_layout)  # 分析按鈕
         # 擷取特定波段數據的按鈕
         self._setup_extract_waveband_section(button_layout)  # 擷取特定波段數據
+        # 匯出完整光譜立方體
+        self._setup_export_cube_section(button_layout)  # 匯出光譜立方體
         left_layout.addLayout(button_layout)
         self._setup_image_display(left_layout)  # 圖像顯示
 
@@ -151,6 +167,30 @@ class OESAnalyzerGUI(QMainWindow):
         section_layout.addWidget(section_label)
         section_layout.addWidget(self.section_spin)
         params_grid.addLayout(section_layout)
+
+        # Band width (0 = single pixel)
+        band_layout = QVBoxLayout()
+        band_label = QLabel('積分帶寬:')
+        self.band_width_spin = QDoubleSpinBox()
+        self.band_width_spin.setRange(0, 50)
+        self.band_width_spin.setValue(0)
+        self.band_width_spin.setSuffix(" nm")
+        self.band_width_spin.setFixedWidth(125)
+        self.band_width_spin.setToolTip("大於 0 時以波段積分面積取代單一像素 (門檻以面積為單位)")
+        band_layout.addWidget(band_label)
+        band_layout.addWidget(self.band_width_spin)
+        params_grid.addLayout(band_layout)
+
+        # Activation detection method
+        method_layout = QVBoxLayout()
+        method_label = QLabel('啟動偵測:')
+        self.method_combo = QComboBox()
+        self.method_combo.addItem("相鄰差值", 'diff')
+        self.method_combo.addItem("變化點 (抗雜訊)", 'changepoint')
+        self.method_combo.setFixedWidth(125)
+        method_layout.addWidget(method_label)
+        method_layout.addWidget(self.method_combo)
+        params_grid.addLayout(method_layout)
         
         layout.addLayout(params_grid)
         group.setLayout(layout)
@@ -167,6 +207,7 @@ class OESAnalyzerGUI(QMainWindow):
         skip_layout.addWidget(QLabel("最高峰值跳過範圍(nm):"))
         skip_layout.addWidget(self.skip_range)
         layout.addLayout(skip_layout)
+        self.skip_range.editingFinished.connect(self._refresh_spectrum_canvas)
         
         # 初始範圍設定
         range_layout = QHBoxLayout()
@@ -187,6 +228,31 @@ class OESAnalyzerGUI(QMainWindow):
         intensity_layout.addWidget(self.intensity_threshold)
         layout.addLayout(intensity_layout)
 
+        # 前處理: 宇宙射線尖峰、暗背景 (啟動前的幀) 與基線扣除
+        preprocess_layout = QHBoxLayout()
+        self.spike_checkbox = QCheckBox("去除尖峰")
+        self.dark_checkbox = QCheckBox("扣除啟動前暗背景")
+        self.baseline_combo = QComboBox()
+        self.baseline_combo.addItem("不扣除基線", None)
+        self.baseline_combo.addItem("多項式基線", 'polynomial')
+        self.baseline_combo.addItem("滾動最小值基線", 'rolling_min')
+        preprocess_layout.addWidget(self.spike_checkbox)
+        preprocess_layout.addWidget(self.dark_checkbox)
+        preprocess_layout.addWidget(self.baseline_combo)
+        self.bin_spin = QSpinBox()
+        self.bin_spin.setRange(1, 1000)
+        self.bin_spin.setValue(1)
+        self.bin_spin.setToolTip("每 N 個連續幀平均為一幀 (讀取時合併, 時間點為每組第一幀)")
+        preprocess_layout.addWidget(QLabel("合併幀數:"))
+        preprocess_layout.addWidget(self.bin_spin)
+        self.in_flight_spin = QSpinBox()
+        self.in_flight_spin.setRange(1, 64)
+        self.in_flight_spin.setValue(1)
+        self.in_flight_spin.setToolTip("同時讀取的檔案數 (資料在網路磁碟時調高, 1 為逐一讀取)")
+        preprocess_layout.addWidget(QLabel("同時讀取:"))
+        preprocess_layout.addWidget(self.in_flight_spin)
+        layout.addLayout(preprocess_layout)
+
         group.setLayout(layout)
         parent_layout.addWidget(group)
         # self.main_layout.addLayout(params_layout)
@@ -199,6 +265,7 @@ class OESAnalyzerGUI(QMainWindow):
         self.wavebands = QLineEdit("486.0, 612.0, 656.0, 777.0")
         layout.addWidget(QLabel("特定波段值(必填) (用逗號分隔):"))
         layout.addWidget(self.wavebands)
+        self.wavebands.editingFinished.connect(self._refresh_spectrum_canvas)
         
         # 變化量設定
         self.thresholds = QLineEdit("250, 350, 450, 550")
@@ -212,11 +279,21 @@ class OESAnalyzerGUI(QMainWindow):
         group = QGroupBox("波長比較圖")
         layout = QVBoxLayout()
 
+        # 互動式光譜圖 (可縮放/平移) 與靜態預覽圖分頁顯示
+        self.image_tabs = QTabWidget()
+        # matplotlib 畫布在第一次分析時才建立, 以縮短啟動時間
+        self.spectrum_canvas = None
+        self.spectrum_canvas_page = QWidget()
+        self.spectrum_canvas_page.setMinimumHeight(300)
+        QVBoxLayout(self.spectrum_canvas_page).setContentsMargins(0, 0, 0, 0)
+        self.image_tabs.addTab(self.spectrum_canvas_page, "互動光譜")
+
         self.image_label = QLabel()
         self.image_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         self.image_label.setMinimumHeight(300)
         self.image_label.setScaledContents(True)
-        layout.addWidget(self.image_label)
+        self.image_tabs.addTab(self.image_label, "圖片")
+        layout.addWidget(self.image_tabs)
 
         # 啟用右鍵選單
         self.image_label.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
@@ -229,10 +306,27 @@ class OESAnalyzerGUI(QMainWindow):
         """顯示圖片的右鍵選單"""
         menu = QMenu()
         zoom_action = menu.addAction("放大圖片")
+        heatmap_action = menu.addAction("顯示時間-波長熱圖")
         action = menu.exec(self.image_label.mapToGlobal(pos))
 
         if action == zoom_action:
             self._zoom_image()
+        elif action == heatmap_action:
+            self._show_heatmap()
+
+    def _show_heatmap(self):
+        """以熱圖顯示整段量測 (時間 x 波長)"""
+        try:
+            wavebands = [float(x.strip()) for x in self.wavebands.text().split(",")]
+            preview = self.controller.render_heatmap(wavebands=wavebands)
+            pixmap = QPixmap()
+            pixmap.loadFromData(preview, "PNG")
+            self.image_label.setPixmap(pixmap.scaled(self.image_label.size(),
+                                                     Qt.AspectRatioMode.KeepAspectRatio,
+                                                     Qt.TransformationMode.SmoothTransformation))
+            self.image_tabs.setCurrentWidget(self.image_label)
+        except Exception as e:
+            QMessageBox.critical(self, "錯誤", str(e))
     
     def _zoom_image(self):
         """放大圖片的窗口"""
@@ -246,7 +340,8 @@ class OESAnalyzerGUI(QMainWindow):
                 zoom_image_label = QLabel()
                 zoom_image_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
 
-                # 嘗試加載圖片
+                # 嘗試加載圖片 (等待背景寫出完成)
+                self.controller.wait_for_plots()
                 pixmap = QPixmap(self.output_path)
                 if pixmap.isNull():
                     raise ValueError("無法加載圖片，請檢查路徑。")
@@ -260,9 +355,30 @@ class OESAnalyzerGUI(QMainWindow):
             except Exception as e:
                 print(f"錯誤: {e}")  # 在控制台輸出錯誤信息
 
-    def update_image_display(self, image_path: str):
+    def _refresh_spectrum_canvas(self):
+        """依目前參數更新互動光譜圖 (僅更新資料, 不重建圖表)"""
+        try:
+            wavebands = [float(x.strip()) for x in self.wavebands.text().split(",")]
+            envelope, frames, series = self.controller.get_spectrum_view(
+                skip_range_nm=float(self.skip_range.text()),
+                wavebands=wavebands
+            )
+        except ValueError:
+            return  # 尚未分析或參數格式錯誤
+        if self.spectrum_canvas is None:
+            from view.spectrum_canvas import SpectrumCanvas
+            self.spectrum_canvas = SpectrumCanvas()
+            self.spectrum_canvas_page.layout().addWidget(self.spectrum_canvas)
+        self.spectrum_canvas.set_envelope(envelope)
+        if frames is not None:
+            self.spectrum_canvas.set_time_series(frames, series)
+
+    def update_image_display(self, image_path: str, preview: Optional[bytes] = None):
         """更新圖片顯示"""
-        pixmap = QPixmap(image_path)
+        pixmap = QPixmap()
+        if preview is None or not pixmap.loadFromData(preview, "PNG"):
+            self.controller.wait_for_plots()
+            pixmap = QPixmap(image_path)
         scaled_pixmap = pixmap.scaled(self.image_label.size(), 
                                     Qt.AspectRatioMode.KeepAspectRatio,
                                     Qt.TransformationMode.SmoothTransformation)
@@ -306,10 +422,11 @@ class OESAnalyzerGUI(QMainWindow):
 
     def _setup_results_section(self ,parent_layout):
         """Create results display section."""
-        self.results_table = QTableWidget()
-        self.results_table.setColumnCount(4)
-        self.results_table.setHorizontalHeaderLabels(["區段", "平均值", "標準差", "穩定度"])
-        self.results_table.setSizeAdjustPolicy(QTableWidget.SizeAdjustPolicy.AdjustToContents)
+        # 陣列模型: 只繪製可見列, 大量結果也不會卡住介面
+        self.results_model = ArrayTableModel({name: [] for name in ["區段", "平均值", "標準差", "穩定度"]})
+        self.results_table = QTableView()
+        self.results_table.setModel(self.results_model)
+        self.results_table.setSortingEnabled(True)
         self.results_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
         parent_layout.addWidget(self.results_table)
         
@@ -355,6 +472,46 @@ class OESAnalyzerGUI(QMainWindow):
         """)
         parent_layout.addWidget(extract_button)
 
+    def _setup_export_cube_section(self, parent_layout):
+        """Setup the export cube button section."""
+        export_button = QPushButton("匯出光譜立方體")
+        export_button.clicked.connect(self._export_cube)
+        export_button.setStyleSheet(""" 
+            QPushButton {
+                background-color: #4CAF50;
+                color: white;
+                padding: 5px;
+                border-radius: 3px;
+            }
+            QPushButton:hover {
+                background-color: #45a049;
+            }
+        """)
+        parent_layout.addWidget(export_button)
+
+    def _export_cube(self):
+        """Export the whole run (frames x wavelengths) to a .npy cube."""
+        try:
+            folder_path = self.path_edit.text()
+            save_folder_path = self.save_folder_path.text()
+
+            if not folder_path or not save_folder_path:
+                QMessageBox.warning(self, "警告", "請選擇資料夾路徑和保存路徑")
+                return
+
+            output_path = self.controller.export_cube(
+                folder_path=folder_path,
+                base_name=self.base_name,
+                start_index=self.start_index,
+                end_index=self.end_index,
+                save_folder_path=save_folder_path
+            )
+
+            QMessageBox.information(self, "成功", f"光譜立方體已匯出至：{output_path}")
+
+        except Exception as e:
+            QMessageBox.critical(self, "錯誤", str(e))
+
     def _extract_specific_waveband_data(self):
         """Trigger extraction of specific waveband data."""
         try:
@@ -417,6 +574,7 @@ class OESAnalyzerGUI(QMainWindow):
             threshold = self.threshold_spin.value()
             section_count = self.section_spin.value()
 
+            self.controller.begin_run("analyze_data")
             self.controller.load_and_process_data(
                 base_path=base_path,
                 base_name= self.base_name,
@@ -430,11 +588,17 @@ class OESAnalyzerGUI(QMainWindow):
                 section_count=section_count,
                 base_name=self.base_name,
                 base_path=base_path,
-                start_index= self.start_index
+                start_index= self.start_index,
+                band_width=self.band_width_spin.value() or None,
+                method=self.method_combo.currentData()
             )
 
             self._update_results_table(results_df)
-            QMessageBox.information(self, "成功", "分析完成！")
+            message = "分析完成！"
+            confidence = self.controller.get_activation_confidence()
+            if confidence is not None:
+                message += f"\n啟動信心: {confidence[0]:.1f}σ, 結束信心: {confidence[1]:.1f}σ"
+            QMessageBox.information(self, "成功", message)
 
         except Exception as e:
             QMessageBox.critical(self, "錯誤", str(e))
@@ -449,6 +613,9 @@ class OESAnalyzerGUI(QMainWindow):
             if not folder_path or not save_folder_path:
                 QMessageBox.warning(self, "警告", "請選擇資料夾路徑和保存路徑")
                 return
+            self.controller.begin_run("OES_analyze")
+            self.controller.set_binning(self.bin_spin.value())
+            self.controller.set_async_ingest(self.in_flight_spin.value())
             self.controller.load_and_process_data(
                 base_path=folder_path,
                 base_name= self.base_name,
@@ -461,6 +628,11 @@ class OESAnalyzerGUI(QMainWindow):
             wavebands = [float(x.strip()) for x in self.wavebands.text().split(",")]
             thresholds = [float(x.strip()) for x in self.thresholds.text().split(",")]
             skip_range_nm = float(self.skip_range.text())
+            self.controller.set_preprocessing(
+                dark_before_activation=self.dark_checkbox.isChecked(),
+                baseline=self.baseline_combo.currentData(),
+                spike_rejection=self.spike_checkbox.isChecked()
+            )
             
 
             #使用用戶選擇的保存路徑新增資料夾名為
@@ -490,13 +662,10 @@ class OESAnalyzerGUI(QMainWindow):
                 float(self.intensity_threshold.text()) if self.filter_checkbox.isChecked() else None
             )
 
-            # 修改圖片名稱以顯示過濾狀態
-            if self.filter_checkbox.isChecked():
-                filtered_output_path = self.output_path.replace(".png", "_filtered.png")
-                os.rename(self.output_path, filtered_output_path)
-                self.output_path = filtered_output_path
-
-            self.update_image_display(self.output_path)
+            # 高解析度圖於背景寫出, 先顯示記憶體中的預覽圖
+            self.update_image_display(self.output_path, self.controller.get_plot_preview())
+            self._refresh_spectrum_canvas()
+            self.controller.save_timing_report(save_folder_path, base_name)
             result_message = (
                 f"分析完成！結果已保存至：{os.path.basename(save_folder_path)}\n"
             )
@@ -520,18 +689,39 @@ class OESAnalyzerGUI(QMainWindow):
         except Exception as e:
             QMessageBox.critical(self, "錯誤", str(e))
 
-    def _update_results_table(self, results_df: pd.DataFrame):
+    def _update_results_table(self, results_df: 'pd.DataFrame'):
         """Update the results table with analysis data."""
-        self.results_table.setRowCount(len(results_df))
-        for i, row in results_df.iterrows():
-            for j, value in enumerate(row):
-                self.results_table.setItem(i, j, QTableWidgetItem(str(value)))
+        self.results_model.set_columns({str(name): results_df[name].to_numpy() for name in results_df.columns})
+
+    def _show_table_records(self, records: List[dict], keys: List[str]):
+        """以陣列模型顯示大量結果 (峰值列表、解離波段)"""
+        self.results_model.set_columns({key: [record[key] for record in records] for key in keys})
+
+    def _show_peak_table(self):
+        """顯示所有波段的峰值列表"""
+        try:
+            self._show_table_records(self.controller.get_peak_table(), ['波段', '最大值', '時間點'])
+        except Exception as e:
+            QMessageBox.critical(self, "錯誤", str(e))
+
+    def _show_dissociation_table(self):
+        """顯示第一個變化量門檻下的全部解離波段"""
+        try:
+            threshold = float(self.thresholds.text().split(",")[0])
+            records = self.controller.get_dissociation_table(threshold)
+            self._show_table_records(records, ['波段', '最小值', '最大值', '差值'])
+        except Exception as e:
+            QMessageBox.critical(self, "錯誤", str(e))
+
     def _show_context_menu(self, pos):
         """顯示右鍵選單"""
         menu = QMenu()
         copy_cell_action = menu.addAction("複製當前儲存格")
         copy_row_action = menu.addAction("複製當前行")
         copy_all_action = menu.addAction("複製全部")
+        menu.addSeparator()
+        peak_table_action = menu.addAction("顯示峰值列表")
+        dissociation_table_action = menu.addAction("顯示解離波段")
         
         action = menu.exec(self.results_table.mapToGlobal(pos))
         
@@ -541,48 +731,33 @@ class OESAnalyzerGUI(QMainWindow):
             self._copy_row()
         elif action == copy_all_action:
             self._copy_all()
+        elif action == peak_table_action:
+            self._show_peak_table()
+        elif action == dissociation_table_action:
+            self._show_dissociation_table()
+
     def _copy_cell(self):
         """複製選中儲存格"""
-        if self.results_table.currentItem() is not None:
+        index = self.results_table.currentIndex()
+        if index.isValid():
             clipboard = QApplication.clipboard()
-            clipboard.setText(self.results_table.currentItem().text())
+            clipboard.setText(self.results_model.data(index))
             QMessageBox.information(self, "複製成功", "已複製選中儲存格內容")
 
     def _copy_row(self):
         """複製整行"""
-        current_row = self.results_table.currentRow()
+        current_row = self.results_table.currentIndex().row()
         if current_row >= 0:
-            row_data = []
-            for col in range(self.results_table.columnCount()):
-                item = self.results_table.item(current_row, col)
-                if item is not None:
-                    row_data.append(item.text())
-            
             clipboard = QApplication.clipboard()
-            clipboard.setText('\t'.join(row_data))
+            clipboard.setText(self.results_model.to_text(rows=[current_row], include_headers=False))
             QMessageBox.information(self, "複製成功", "已複製整行內容")
 
     def _copy_all(self):
         """複製全部內容"""
-        all_data = []
-        # 添加表頭
-        headers = []
-        for col in range(self.results_table.columnCount()):
-            headers.append(self.results_table.horizontalHeaderItem(col).text())
-        all_data.append('\t'.join(headers))
-        
-        # 添加數據
-        for row in range(self.results_table.rowCount()):
-            row_data = []
-            for col in range(self.results_table.columnCount()):
-                item = self.results_table.item(row, col)
-                if item is not None:
-                    row_data.append(item.text())
-            all_data.append('\t'.join(row_data))
-        
         clipboard = QApplication.clipboard()
-        clipboard.setText('\n'.join(all_data))
+        clipboard.setText(self.results_model.to_text())
         QMessageBox.information(self, "複製成功", "已複製全部內容")
+
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     gui = OESAnalyzerGUI()
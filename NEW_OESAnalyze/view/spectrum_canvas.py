@@ -0,0 +1,106 @@
+from typing import Dict, Optional
+import numpy as np
+from PyQt6.QtWidgets import QWidget, QVBoxLayout
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg, NavigationToolbar2QT
+from model.pyramid import MinMaxPyramid
+from model.renderer import SpectrumEnvelope, annotate_peaks
+
+
+class SpectrumCanvas(QWidget):
+    """
+    Embedded interactive plot of the max-envelope and selected time series.
+
+    The figure and its line artists are created once. New results only
+    replace artist data, and zoom/pan re-queries a min/max pyramid of each
+    signal for the visible range, so redraw cost follows the widget width
+    rather than the data length.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.figure = Figure(figsize=(10, 6))
+        self.canvas = FigureCanvasQTAgg(self.figure)
+        self.toolbar = NavigationToolbar2QT(self.canvas, self)
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.toolbar)
+        layout.addWidget(self.canvas)
+
+        self.spectrum_ax, self.series_ax = self.figure.subplots(2, 1, gridspec_kw={'height_ratios': [2, 1]})
+        self.envelope_line, = self.spectrum_ax.plot([], [], color='red', label='Highest_data', linewidth=1)
+        self.spectrum_ax.set_xlabel('Wavelength(nm)')
+        self.spectrum_ax.set_ylabel('Intensity(Cts)')
+        self.series_ax.set_xlabel('Frame')
+        self.series_ax.set_ylabel('Intensity(Cts)')
+        self.figure.tight_layout()
+
+        self._envelope_pyramid: Optional[MinMaxPyramid] = None
+        self._series_pyramids: Dict[float, MinMaxPyramid] = {}
+        self._series_lines = {}
+        self._annotations = []
+
+        self.spectrum_ax.callbacks.connect('xlim_changed', self._on_spectrum_xlim)
+        self.series_ax.callbacks.connect('xlim_changed', self._on_series_xlim)
+
+    def _max_points(self) -> int:
+        # 每個像素取 min/max 兩點即可
+        return max(512, 2 * self.canvas.width())
+
+    @staticmethod
+    def _fit_ylim(ax, y_min: float, y_max: float) -> None:
+        margin = (y_max - y_min) * 0.05 or 1.0
+        ax.set_ylim(y_min - margin, y_max + margin)
+
+    def set_envelope(self, envelope: SpectrumEnvelope) -> None:
+        """Show a new envelope (or new peak marks) without rebuilding the figure."""
+        self._envelope_pyramid = MinMaxPyramid(envelope.wavelengths, envelope.intensities)
+        self.spectrum_ax.set_title(f'Max_peak: {envelope.max_peak["波段"]:.1f}nm')
+
+        for annotation in self._annotations:
+            annotation.remove()
+        self._annotations = annotate_peaks(self.spectrum_ax, envelope)
+
+        self.spectrum_ax.set_xlim(*self._envelope_pyramid.x_range)  # 觸發 _on_spectrum_xlim
+        self._fit_ylim(self.spectrum_ax, np.nanmin(envelope.intensities), np.nanmax(envelope.intensities))
+        self.canvas.draw_idle()
+
+    def set_time_series(self, frames: np.ndarray, series: Dict[float, np.ndarray]) -> None:
+        """
+        Show the time series of the selected wavebands.
+
+        Existing line artists are reused; lines for wavebands that are no
+        longer selected are removed.
+
+        Args:
+            frames: Frame numbers (x axis)
+            series: Mapping of waveband to its intensity per frame
+        """
+        for waveband in list(self._series_lines):
+            if waveband not in series:
+                self._series_lines.pop(waveband).remove()
+                self._series_pyramids.pop(waveband)
+
+        for waveband, values in series.items():
+            self._series_pyramids[waveband] = MinMaxPyramid(frames, values)
+            if waveband not in self._series_lines:
+                self._series_lines[waveband], = self.series_ax.plot([], [], linewidth=1, label=f'{waveband:.1f}nm')
+
+        if series:
+            self.series_ax.legend(loc='upper right', fontsize='small')
+            self.series_ax.set_xlim(float(frames[0]), float(frames[-1]))  # 觸發 _on_series_xlim
+            self._fit_ylim(self.series_ax, min(np.nanmin(v) for v in series.values()),
+                           max(np.nanmax(v) for v in series.values()))
+        elif self.series_ax.get_legend() is not None:
+            self.series_ax.get_legend().remove()
+        self.canvas.draw_idle()
+
+    def _on_spectrum_xlim(self, ax) -> None:
+        if self._envelope_pyramid is not None:
+            self.envelope_line.set_data(*self._envelope_pyramid.query(*ax.get_xlim(), self._max_points()))
+
+    def _on_series_xlim(self, ax) -> None:
+        x0, x1 = ax.get_xlim()
+        for waveband, pyramid in self._series_pyramids.items():
+            self._series_lines[waveband].set_data(*pyramid.query(x0, x1, self._max_points()))
@@ -0,0 +1,97 @@
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from PyQt6.QtCore import Qt, QAbstractTableModel, QModelIndex
+
+
+class ArrayTableModel(QAbstractTableModel):
+    """
+    Read-only Qt table model backed by one NumPy array per column.
+
+    Qt only asks for the cells that are visible, so the cost of showing a
+    result does not depend on its row count. Sorting permutes a row-order
+    index computed with ``np.argsort`` and copying serializes whole columns
+    at once instead of walking items.
+    """
+
+    def __init__(self, columns: Optional[Dict[str, Sequence]] = None, parent=None):
+        super().__init__(parent)
+        self._headers: List[str] = []
+        self._columns: List[np.ndarray] = []
+        self._order = np.arange(0)
+        if columns:
+            self.set_columns(columns)
+
+    @classmethod
+    def from_dataframe(cls, df, parent=None) -> 'ArrayTableModel':
+        """Build a model from a pandas DataFrame."""
+        return cls({str(name): df[name].to_numpy() for name in df.columns}, parent)
+
+    @classmethod
+    def from_records(cls, records: List[dict], keys: Optional[List[str]] = None, parent=None) -> 'ArrayTableModel':
+        """Build a model from a list of dicts (e.g. ``find_peak_points`` output)."""
+        keys = keys or (list(records[0].keys()) if records else [])
+        return cls({key: np.array([record[key] for record in records]) for key in keys}, parent)
+
+    def set_columns(self, columns: Dict[str, Sequence]) -> None:
+        """Replace the table contents."""
+        self.beginResetModel()
+        self._headers = list(columns.keys())
+        self._columns = [np.asarray(values) for values in columns.values()]
+        self._order = np.arange(len(self._columns[0]) if self._columns else 0)
+        self.endResetModel()
+
+    @property
+    def headers(self) -> List[str]:
+        return list(self._headers)
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._order)
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._columns)
+
+    def data(self, index: QModelIndex, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role != Qt.ItemDataRole.DisplayRole:
+            return None
+        return str(self._columns[index.column()][self._order[index.row()]])
+
+    def headerData(self, section: int, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        if orientation == Qt.Orientation.Horizontal:
+            return self._headers[section] if section < len(self._headers) else None
+        return str(section + 1)
+
+    def sort(self, column: int, order=Qt.SortOrder.AscendingOrder) -> None:
+        """Sort rows by one column on the underlying array."""
+        if not self._columns:
+            return
+        self.layoutAboutToBeChanged.emit()
+        order_index = np.argsort(self._columns[column], kind='stable')
+        if order == Qt.SortOrder.DescendingOrder:
+            order_index = order_index[::-1]
+        self._order = order_index
+        self.layoutChanged.emit()
+
+    def to_text(self, rows: Optional[Sequence[int]] = None, columns: Optional[Sequence[int]] = None,
+                include_headers: bool = True) -> str:
+        """
+        Serialize (part of) the table as tab-separated text in display order.
+
+        Args:
+            rows: View rows to include (default: all)
+            columns: Columns to include (default: all)
+            include_headers: Prepend the header line
+
+        Returns:
+            Tab/newline separated text for the clipboard
+        """
+        columns = range(len(self._columns)) if columns is None else columns
+        order = self._order if rows is None else self._order[np.asarray(rows, dtype=np.int64)]
+
+        # 每欄一次轉成字串陣列, 再一次組合
+        text_columns = [self._columns[c][order].astype(str) for c in columns]
+        lines = ['\t'.join(row) for row in zip(*text_columns)]
+        if include_headers:
+            lines.insert(0, '\t'.join(self._headers[c] for c in columns))
+        return '\n'.join(lines)
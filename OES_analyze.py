@@ -1,9 +1,62 @@
 import os
-import pandas as pd
-import matplotlib.pyplot as plt
-import numpy as np
+import re
+from collections import Counter
 from typing import List, Dict, Tuple, Optional, Callable
 
+# 檔名格式: {base_name}_S0001.txt (base_name 中可含 'S')
+FRAME_PATTERN = re.compile(r'^(?P<base>.+)_S(?P<index>\d+)\.txt$')
+
+def time_point_of(file_name: str) -> str:
+    """取出檔名中的時間點 (幀號) 字串"""
+    match = FRAME_PATTERN.match(os.path.basename(file_name))
+    return match.group('index') if match else ''
+
+class IngestDiagnostics:
+    """讀檔問題計數器: 依類別計數並保留少量範例, 每批檔案只回報一次彙總"""
+
+    LABELS = {
+        'skipped_line': '略過無效行',
+        'missing_file': '找不到檔案',
+        'empty_file': '無有效數據檔案',
+        'read_error': '讀取錯誤',
+    }
+
+    def __init__(self, max_samples: int = 3, chunk_files: int = 200):
+        self.max_samples = max_samples
+        self.chunk_files = chunk_files
+        self.totals = Counter()
+        self.counts = Counter()
+        self.samples: Dict[str, List[str]] = {}
+        self.files = 0
+
+    def record(self, category: str, file_path: str, detail: str = ''):
+        """計數一個問題, 範例數量有上限"""
+        self.counts[category] += 1
+        self.totals[category] += 1
+        samples = self.samples.setdefault(category, [])
+        if len(samples) < self.max_samples:
+            name = os.path.basename(file_path)
+            samples.append(f"{name}: {detail}" if detail else name)
+
+    def file_done(self, callback: Callable[[str], None]):
+        """完成一個檔案, 滿一批時回報"""
+        self.files += 1
+        if self.files >= self.chunk_files:
+            self.flush(callback)
+
+    def flush(self, callback: Callable[[str], None]) -> Optional[str]:
+        """回報本批彙總 (無問題時不回報) 並開始新的一批"""
+        message = None
+        if self.counts:
+            parts = [f"{self.LABELS.get(c, c)} {n} (例: {'; '.join(self.samples.get(c, []))})"
+                     for c, n in self.counts.items()]
+            message = f"已讀取 {self.files} 個檔案, " + ", ".join(parts)
+            callback(message)
+        self.counts = Counter()
+        self.samples = {}
+        self.files = 0
+        return message
+
 class OESAnalyzer:
     """OES光譜分析器"""
     
@@ -12,6 +65,7 @@ class OESAnalyzer:
         self.all_values: Dict[float, List[Tuple[str, float]]] = {}
         self.selected_files: List[str] = []
         self.status_callback: Optional[Callable[[str], None]] = None
+        self.diagnostics = IngestDiagnostics()
         
     def set_status_callback(self, callback):
         """設置狀態更新回調函數"""
@@ -35,7 +89,7 @@ class OESAnalyzer:
                 '波段': value,
                 '最大值': max_value,
                 '檔案名': file_name,
-                '時間點': file_name.split('S')[-1].split('.')[0]
+                '時間點': time_point_of(file_name)
             })
         
         # 按最大值排序
@@ -58,11 +112,12 @@ class OESAnalyzer:
                             if value >= self.start_value:
                                 values[value] = float(parts[1])
                         except ValueError:
-                            self.update_status(f"Skipping line due to ValueError: {line.strip()}")
+                            # 逐行回報會大量更新 GUI, 改為計數後每批彙總
+                            self.diagnostics.record('skipped_line', file_path, line.strip())
         except FileNotFoundError:
-            self.update_status(f"The file at {file_path} was not found.")
+            self.diagnostics.record('missing_file', file_path)
         except Exception as e:
-            self.update_status(f"An error occurred: {e}")
+            self.diagnostics.record('read_error', file_path, str(e))
         return values
 
     def gather_values(self) -> Dict:
@@ -70,13 +125,14 @@ class OESAnalyzer:
         self.all_values = {}
         for file_path in self.selected_files:
             file_values = self.read_values_by_line(file_path)
-            if not file_values:
-                self.update_status(f"No valid data found in {file_path}")
-                continue
+            if not file_values and os.path.exists(file_path):
+                self.diagnostics.record('empty_file', file_path)
             for value, measurement in file_values.items():
                 if value not in self.all_values:
                     self.all_values[value] = []
                 self.all_values[value].append((os.path.basename(file_path), measurement))
+            self.diagnostics.file_done(self.update_status)
+        self.diagnostics.flush(self.update_status)
         return self.all_values
 
     def find_specific_wavebands_differences(self, wavebands: List[float], threshold: float = 200) -> Dict:
@@ -90,7 +146,7 @@ class OESAnalyzer:
                 if abs(max_measurement - min_measurement) > threshold:
                     largest_diff = max(measurements, key=lambda x: abs(x[1] - min_measurement))
                     filename = largest_diff[0]
-                    file_second = filename.split('S')[-1].split('.')[0]
+                    file_second = time_point_of(filename)
                     specific_differences[value] = (min_measurement, max_measurement, largest_diff, file_second)
         return specific_differences
 
@@ -156,6 +212,8 @@ class OESAnalyzer:
     
     def allSpectrum_plot(self, data1, skip_range_nm, output_directory, file_name ,intensity_threshold=None):
         """繪製全波段圖形並標記出最高波段"""
+        import matplotlib.pyplot as plt  # 延遲載入, 縮短程式啟動時間
+
         try:
             # 過濾低於指定強度的波型
             if intensity_threshold is not None:
@@ -220,6 +278,8 @@ class OESAnalyzer:
                           initial_start: int, initial_end: int, skip_range_nm: float,
                           output_directory: str) -> Tuple[str, str]:
         """執行分析並導出結果"""
+        import pandas as pd  # 延遲載入, 只在匯出 Excel 時需要
+
         try:
             if not self.selected_files:
                 raise ValueError("未讀取到檔案進行分析")